@@ -0,0 +1,105 @@
+"""
+
+Benchmark for the size of code objects produced by to_code(compact=True).
+
+Compiles the modules in the standard library and converts them with transform.transform_code in
+several modes, measuring the total size of the marshalled code (the size of the .pyc files) and an
+estimate of the memory used by the code objects.
+
+Usage:
+
+    python benchmarks/bench_compact.py --output results.json
+
+"""
+from __future__ import print_function
+
+import marshal
+import os
+import sys
+import types
+
+from benchutil import best_time, log, make_parser, write_results
+
+from bytearound import transform, verify
+
+MODES = [
+    ('default', {}),
+    ('compact', {'compact': True}),
+    ('compact_collapse_lnotab', {'compact': True, 'collapse_lnotab': True}),
+]
+
+
+def memory_size(co, seen=None):
+    """Estimates the memory used by a code object, including nested code objects and constants."""
+    if seen is None:
+        seen = set()
+    if id(co) in seen:
+        return 0
+    seen.add(id(co))
+    size = sys.getsizeof(co) + sys.getsizeof(co.co_code) + sys.getsizeof(co.co_lnotab)
+    size += sys.getsizeof(co.co_consts)
+    for const in co.co_consts:
+        if isinstance(const, types.CodeType):
+            size += memory_size(const, seen)
+        elif id(const) not in seen:
+            seen.add(id(const))
+            size += sys.getsizeof(const)
+    return size
+
+
+def compile_files(files):
+    code_objects = []
+    for path in files:
+        try:
+            with open(path, 'rU') as f:
+                code_objects.append(compile(f.read(), path, 'exec', dont_inherit=True))
+        except (SyntaxError, TypeError, IOError):
+            pass
+    return code_objects
+
+
+def convert(code_objects, options):
+    """Converts the code objects, returning a list of the results (None for failures)."""
+    results = []
+    for co in code_objects:
+        try:
+            results.append(transform.transform_code(co, transform.identity, **options))
+        except Exception:
+            results.append(None)
+    return results
+
+
+def main():
+    parser = make_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--stdlib-files', type=int, default=None,
+                        help='Only use this many files from the standard library.')
+    args = parser.parse_args()
+
+    files = verify.find_files(directories=[os.path.dirname(os.__file__)])
+    if args.stdlib_files is not None:
+        files = files[:args.stdlib_files]
+    log('compiling %d files' % len(files))
+    code_objects = compile_files(files)
+
+    # only count modules that every mode can convert, so that the sizes are comparable
+    converted = {}
+    for mode, options in MODES:
+        log('converting in mode %s' % mode)
+        converted[mode] = convert(code_objects, options)
+    usable = [i for i in range(len(code_objects))
+              if all(converted[mode][i] is not None for mode, _ in MODES)]
+
+    results = {'modules': len(usable), 'skipped_modules': len(code_objects) - len(usable)}
+    for mode, options in MODES:
+        codes = [converted[mode][i] for i in usable]
+        results[mode] = {
+            'marshalled_bytes': sum(len(marshal.dumps(co)) for co in codes),
+            'memory_bytes': sum(memory_size(co) for co in codes),
+            'convert_time': best_time(
+                lambda: convert([code_objects[i] for i in usable], options), repeat=args.repeat),
+        }
+    write_results('compact', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+
+Benchmarks for parsing, code generation and stack size computation.
+
+Times parser.parse, generator.generate, generator.compute_stacksize and the full round trip
+through ByteAround.from_code and to_code(pessimize=True), both on the code objects in the standard
+library and on generated code of increasing size.
+
+Usage:
+
+    python benchmarks/bench_core.py --output results.json
+
+"""
+from __future__ import print_function
+
+import os
+
+from benchutil import best_time, log, make_parser, write_results
+
+from bytearound import ByteAround, ops, verify
+from bytearound import generator
+from bytearound import parser
+
+PHASES = ['parse', 'from_code', 'generate', 'compute_stacksize', 'round_trip']
+
+
+def time_phases(code_objects, repeat):
+    """Times each phase over a list of code objects, returning {phase: seconds or error string}."""
+    timings = {}
+    bas = [ByteAround.from_code(co) for co in code_objects]
+    phase_functions = {
+        'parse': lambda: [parser.parse(co) for co in code_objects],
+        'from_code': lambda: [ByteAround.from_code(co) for co in code_objects],
+        'generate': lambda: [generator.generate(ba, pessimize=True) for ba in bas],
+        'compute_stacksize': lambda: [generator.compute_stacksize(ba) for ba in bas],
+        'round_trip': lambda: [ByteAround.from_code(co).to_code(pessimize=True)
+                               for co in code_objects],
+    }
+    for phase in PHASES:
+        try:
+            timings[phase] = best_time(phase_functions[phase], repeat=repeat)
+        except Exception as e:
+            timings[phase] = '%s: %s' % (type(e).__name__, e)
+    return timings
+
+
+# Generators for synthetic code. Each takes a size and returns a list of instructions that
+# together form a valid function body.
+
+def straight_line(size):
+    """Arithmetic on a small set of locals and constants, without any jumps."""
+    instructions = []
+    for i in range(size // 4):
+        instructions += [
+            ops.LOAD_FAST('x%d' % (i % 16)),
+            ops.LOAD_CONST(i % 16),
+            ops.BINARY_ADD(),
+            ops.STORE_FAST('x%d' % ((i + 1) % 16)),
+        ]
+    return instructions + [ops.LOAD_CONST(None), ops.RETURN_VALUE()]
+
+
+def many_names(size):
+    """Every group of instructions uses a new global name and a new constant."""
+    instructions = []
+    for i in range(size // 4):
+        instructions += [
+            ops.LOAD_GLOBAL('g%d' % i),
+            ops.LOAD_CONST('c%d' % i),
+            ops.BINARY_ADD(),
+            ops.POP_TOP(),
+        ]
+    return instructions + [ops.LOAD_CONST(None), ops.RETURN_VALUE()]
+
+
+def sequential_branches(size):
+    """A long sequence of if/else statements."""
+    instructions = []
+    for i in range(size // 8):
+        else_label = ops.Label()
+        end_label = ops.Label()
+        instructions += [
+            ops.LOAD_FAST('x'),
+            ops.POP_JUMP_IF_FALSE(else_label),
+            ops.LOAD_CONST(i),
+            ops.STORE_FAST('y'),
+            ops.JUMP_FORWARD(end_label),
+            else_label,
+            ops.LOAD_CONST(-i),
+            ops.STORE_FAST('y'),
+            end_label,
+        ]
+    return instructions + [ops.LOAD_CONST(None), ops.RETURN_VALUE()]
+
+
+def nested_branches(size):
+    """if statements nested inside each other, size // 4 levels deep."""
+    depth = size // 4
+    labels = [ops.Label() for _ in range(depth)]
+    instructions = []
+    for i in range(depth):
+        instructions += [
+            ops.LOAD_FAST('x%d' % (i % 16)),
+            ops.POP_JUMP_IF_FALSE(labels[i]),
+            ops.LOAD_CONST(i),
+            ops.STORE_FAST('y'),
+        ]
+    instructions += reversed(labels)
+    return instructions + [ops.LOAD_CONST(None), ops.RETURN_VALUE()]
+
+
+# (generator, largest size to run it at or None); generate() looks up names and constants with
+# list.index, so many_names is quadratic and would take hours at a million instructions
+SYNTHETIC_CASES = [
+    (straight_line, None),
+    (many_names, 10 ** 5),
+    (sequential_branches, None),
+    (nested_branches, None),
+]
+
+
+def run_synthetic(sizes, repeat):
+    results = []
+    for case, max_size in SYNTHETIC_CASES:
+        for size in sizes:
+            if max_size is not None and size > max_size:
+                continue
+            log('synthetic %s, size %d' % (case.__name__, size))
+            ba = ByteAround(case(size), name=case.__name__, argnames=('x',))
+            result = {
+                'corpus': 'synthetic',
+                'case': case.__name__,
+                'size': size,
+                'instructions': len(ba),
+            }
+            # the larger sizes take long enough that repeating them is not useful
+            case_repeat = repeat if size < 100000 else 1
+            try:
+                co = ba.to_code(pessimize=True)
+            except Exception as e:
+                # no code object to parse, but we can still time the parts that work
+                error = 'not run, to_code failed: %s: %s' % (type(e).__name__, e)
+                result['phases'] = {phase: error for phase in PHASES}
+                for phase, fn in [('generate', lambda: generator.generate(ba, pessimize=True)),
+                                  ('compute_stacksize', lambda: generator.compute_stacksize(ba))]:
+                    try:
+                        result['phases'][phase] = best_time(fn, repeat=case_repeat)
+                    except Exception as e:
+                        result['phases'][phase] = '%s: %s' % (type(e).__name__, e)
+            else:
+                result['phases'] = time_phases([co], case_repeat)
+            results.append(result)
+    return results
+
+
+def run_stdlib(limit, repeat):
+    stdlib_dir = os.path.dirname(os.__file__)
+    files = verify.find_files(directories=[stdlib_dir])
+    if limit is not None:
+        files = files[:limit]
+    log('stdlib: compiling %d files' % len(files))
+    code_objects, _ = verify.collect_code_objects(files)
+    # exclude code objects that bytearound cannot handle, so that the timings are comparable
+    usable = []
+    for co in code_objects:
+        try:
+            ByteAround.from_code(co).to_code(pessimize=True)
+        except Exception:
+            pass
+        else:
+            usable.append(co)
+    log('stdlib: timing %d code objects' % len(usable))
+    return [{
+        'corpus': 'stdlib',
+        'case': 'all',
+        'files': len(files),
+        'code_objects': len(usable),
+        'skipped_code_objects': len(code_objects) - len(usable),
+        'instructions': sum(len(parser.parse(co)) for co in usable),
+        'phases': time_phases(usable, repeat),
+    }]
+
+
+def main():
+    arg_parser = make_parser(__doc__.strip().splitlines()[0])
+    arg_parser.add_argument('--max-size', type=int, default=10 ** 6,
+                            help='Largest synthetic function size, in instructions.')
+    arg_parser.add_argument('--stdlib-files', type=int, default=None,
+                            help='Only use this many files from the standard library.')
+    arg_parser.add_argument('--skip-stdlib', action='store_true', default=False)
+    args = arg_parser.parse_args()
+
+    sizes = []
+    size = 100
+    while size <= args.max_size:
+        sizes.append(size)
+        size *= 10
+    results = []
+    if not args.skip_stdlib:
+        results += run_stdlib(args.stdlib_files, args.repeat)
+    results += run_synthetic(sizes, args.repeat)
+    write_results('core', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+
+Benchmark for the dataflow analyses on large functions.
+
+Generates functions with the given number of instructions, made of assignments, branches, loops
+and try blocks, and measures creating dataflow.Liveness and dataflow.ReachingDefinitions objects,
+which builds the control flow graph (construction), and solving them, which computes the effects
+of each block and runs the worklist solver (solve).
+
+Usage:
+
+    python benchmarks/bench_dataflow.py --output results.json
+
+"""
+from __future__ import print_function
+
+from benchutil import best_time, log, make_parser, write_results
+
+from bytearound import ByteAround
+from bytearound.dataflow import Liveness, ReachingDefinitions
+
+# each chunk compiles to about 60 instructions and uses a few of the variables
+_CHUNK = '''
+    v%(a)d = v%(b)d + %(i)d
+    if v%(a)d > v%(c)d:
+        v%(b)d = v%(c)d
+    else:
+        v%(c)d = v%(a)d * 2
+    for i in range(v%(b)d):
+        if i:
+            break
+        v%(a)d += i
+    try:
+        v%(c)d = v%(a)d.attr
+    except AttributeError:
+        v%(b)d = None
+'''
+
+
+def make_function(num_instructions, num_variables=100):
+    """Returns a ByteAround object for a function with about num_instructions instructions."""
+    lines = ['def f(%s):' % ', '.join('v%d' % i for i in range(num_variables))]
+    i = 0
+    source_length = 0
+    while source_length < num_instructions:
+        chunk = _CHUNK % {'a': i % num_variables, 'b': (i * 7 + 1) % num_variables,
+                          'c': (i * 13 + 2) % num_variables, 'i': i}
+        lines.append(chunk)
+        i += 1
+        source_length += 60
+    lines.append('    return v0')
+    namespace = {}
+    exec('\n'.join(lines), namespace)
+    return ByteAround.from_code(namespace['f'].__code__)
+
+
+def main(argv=None):
+    parser = make_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000],
+                        help='Approximate numbers of instructions of the generated functions.')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for size in args.sizes:
+        ba = make_function(size)
+        log('benchmarking a function with %d instructions' % len(ba.instructions))
+        size_results = {'instructions': len(ba.instructions)}
+        for cls in (Liveness, ReachingDefinitions):
+            construction = best_time(lambda: cls(ba), repeat=args.repeat)
+            solve = best_time(cls(ba).solve, repeat=args.repeat)
+            size_results[cls.__name__] = {
+                'construction': construction,
+                'solve': solve,
+                'total': construction + solve,
+            }
+        results[str(size)] = size_results
+    write_results('dataflow', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
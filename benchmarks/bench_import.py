@@ -0,0 +1,48 @@
+"""
+
+Benchmark for the time taken by "import bytearound".
+
+Each measurement starts a fresh interpreter, so the results include the startup time of Python
+itself; that is measured separately (as "python -c pass") so that it can be subtracted.
+
+Usage:
+
+    python benchmarks/bench_import.py --output results.json
+
+"""
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+
+from benchutil import best_time, log, make_parser, write_results
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+STATEMENTS = [
+    ('python', 'pass'),
+    ('bytearound', 'import bytearound'),
+    ('bytearound_check', 'import bytearound; bytearound.check(lambda: None)'),
+]
+
+
+def run(statement):
+    subprocess.check_call([sys.executable, '-c', statement], cwd=ROOT)
+
+
+def main():
+    parser = make_parser(__doc__.strip().splitlines()[0])
+    parser.set_defaults(repeat=20)
+    args = parser.parse_args()
+
+    results = {}
+    for name, statement in STATEMENTS:
+        log('timing %s' % statement)
+        results[name] = best_time(lambda: run(statement), repeat=args.repeat)
+    results['import_time'] = results['bytearound'] - results['python']
+    write_results('import', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+
+Benchmark for profile-guided basic block reordering.
+
+Each benchmark function is profiled on its workload with profiler.BlockProfiler, reordered with
+reorder.reorder_function and timed on the same workload before and after reordering. The
+workloads are skewed so that the hot path through each function is not the one the compiler lays
+out as the fall-through.
+
+Usage:
+
+    python benchmarks/bench_reorder.py --output results.json
+
+"""
+from __future__ import print_function
+
+from benchutil import best_time, log, make_parser, write_results
+
+from bytearound.profiler import BlockProfiler
+from bytearound.reorder import reorder_function
+
+
+def classify(values):
+    counts = [0, 0, 0]
+    for value in values:
+        if value < 0:
+            counts[0] += 1
+        elif value == 0:
+            counts[1] += 1
+        else:
+            counts[2] += 1
+    return counts
+
+
+def count_errors(lines):
+    errors = 0
+    for line in lines:
+        if not line:
+            continue
+        if line[0] == '#':
+            continue
+        if line.startswith('ok'):
+            continue
+        errors += 1
+    return errors
+
+
+def safe_inverse(values):
+    total = 0.0
+    for value in values:
+        try:
+            if value:
+                total += 1.0 / value
+            else:
+                total -= 1
+        except TypeError:
+            total = None
+            break
+    return total
+
+
+def make_workloads(size):
+    """Returns a list of (function, argument) pairs."""
+    return [
+        (classify, [1 + i % 7 for i in range(size)]),
+        (count_errors, ['error %d' % i if i % 3 else '' for i in range(size)]),
+        (safe_inverse, [i % 5 - 5 for i in range(size)]),
+    ]
+
+
+def main(argv=None):
+    parser = make_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000,
+                        help='Number of items in each workload.')
+    parser.add_argument('--iterations', type=int, default=10,
+                        help='Number of times to call the function in each measurement.')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for fn, arg in make_workloads(args.size):
+        log('benchmarking %s' % fn.__name__)
+        original_code = fn.__code__
+
+        def run():
+            for _ in range(args.iterations):
+                fn(arg)
+
+        before = best_time(run, repeat=args.repeat)
+        with BlockProfiler() as profiler:
+            profiler.instrument(fn)
+            fn(arg)
+            counts = profiler.counts(fn)
+        reorder_function(fn, counts)
+        after = best_time(run, repeat=args.repeat)
+        fn.__code__ = original_code
+        results[fn.__name__] = {
+            'original': before,
+            'reordered': after,
+            'speedup': before / after,
+        }
+    write_results('reorder', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
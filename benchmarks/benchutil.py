@@ -0,0 +1,62 @@
+"""
+
+Shared helpers for the benchmark scripts.
+
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import bytearound  # noqa: E402
+
+
+def make_parser(description):
+    """Returns an argument parser with the options shared by all benchmarks."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('-o', '--output', default=None,
+                        help='Write results as JSON to this file (default: stdout).')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of times to repeat each measurement; the best time is kept.')
+    return parser
+
+
+def best_time(fn, repeat=3):
+    """Calls fn repeat times and returns the shortest time taken by a call, in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = timeit.default_timer()
+        fn()
+        elapsed = timeit.default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def write_results(benchmark, results, output=None):
+    """Writes the results of a benchmark as JSON, together with information about the system."""
+    data = {
+        'benchmark': benchmark,
+        'bytearound_version': bytearound.__version__,
+        'python_version': platform.python_version(),
+        'python_implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if output is None:
+        json.dump(data, sys.stdout, indent=2, sort_keys=True)
+        print()
+    else:
+        with open(output, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+
+
+def log(message):
+    """Prints progress information to stderr, so that it does not mix with JSON on stdout."""
+    print(message, file=sys.stderr)
@@ -6,6 +6,19 @@ bytearound is a library for parsing Python code objects into a more easily modif
 __version__ = '0.2'
 
 from .code_object import ByteAround
-from .debug import check, check_recursive
 from . import ops
 from .ops import Instruction, Label, cell_or_free
+
+
+# debug imports difflib and dis, so it is only imported when these functions are used
+
+def check(co):
+    """Checks that a code object round-trips through ByteAround (see debug.check)."""
+    from . import debug
+    return debug.check(co)
+
+
+def check_recursive(obj, seen=None):
+    """Calls check() on all code objects reachable from obj (see debug.check_recursive)."""
+    from . import debug
+    return debug.check_recursive(obj, seen=seen)
@@ -0,0 +1,152 @@
+"""
+
+Helpers for dividing instructions into basic blocks.
+
+"""
+import opcode
+from operator import attrgetter
+
+from . import ops
+
+# instructions after which execution never continues with the next instruction
+_UNCONDITIONAL_EXITS = frozenset([
+    opcode.opmap['JUMP_ABSOLUTE'],
+    opcode.opmap['JUMP_FORWARD'],
+    opcode.opmap['CONTINUE_LOOP'],
+    opcode.opmap['RETURN_VALUE'],
+    opcode.opmap['RAISE_VARARGS'],
+    opcode.opmap['BREAK_LOOP'],
+])
+# instructions that start a new block (Labels) or end the current one
+_BOUNDARY_OPCODES = _UNCONDITIONAL_EXITS | frozenset(
+    opcode.hasjrel + opcode.hasjabs + [ops.Label.opcode])
+_get_opcode = attrgetter('opcode')
+
+
+class BasicBlock(object):
+    """A sequence of instructions that can only be entered at the start.
+
+    index is the position of the block in the list returned by split_blocks, start and end delimit
+    the block in the original instruction list (end is exclusive), labels are the Labels at the
+    start of the block and instructions are the other instructions in the block.
+
+    """
+    def __init__(self, index, start, end, labels, instructions):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.labels = labels
+        self.instructions = instructions
+
+    @property
+    def lineno(self):
+        """Line number of the first instruction in the block."""
+        if self.instructions:
+            return self.instructions[0].lineno
+        return None
+
+    @property
+    def last(self):
+        """The last instruction in the block, or None if the block is empty."""
+        if self.instructions:
+            return self.instructions[-1]
+        return None
+
+    def jump_target(self):
+        """Returns the Label that the last instruction may jump to, or None."""
+        last = self.last
+        if last is not None and last.is_jump():
+            return last.oparg
+        return None
+
+    def can_fall_through(self):
+        """Whether execution may continue with the block that follows this one."""
+        last = self.last
+        return last is None or last.opcode not in _UNCONDITIONAL_EXITS
+
+    def __repr__(self):
+        return 'BasicBlock(%d, %d, %d, %r, %r)' % (
+            self.index, self.start, self.end, self.labels, self.instructions)
+
+
+def split_blocks(instructions, opcodes=None):
+    """Splits a list of instructions into basic blocks.
+
+    A new block starts at every Label (consecutive Labels start a single block), after every jump
+    and after every instruction that never continues with the next instruction, such as
+    RETURN_VALUE. This is the same division used by generator.compute_stacksize, except that dead
+    code after a RETURN_VALUE gets its own block.
+
+    opcodes is the list of the opcodes of the instructions, if the caller already has it.
+
+    """
+    starts, firsts, ends = block_bounds(instructions, opcodes)
+    return [BasicBlock(index, start, end, instructions[start:first], instructions[first:end])
+            for index, (start, first, end) in enumerate(zip(starts, firsts, ends))]
+
+
+def block_bounds(instructions, opcodes=None):
+    """Returns the positions of the basic blocks of split_blocks() without creating them.
+
+    The result is three lists with, for each block, the index of its first element, of its first
+    instruction that is not a Label and the end of the block (exclusive).
+
+    """
+    starts = []
+    firsts = []
+    ends = []
+    start = 0
+    num_labels = 0  # number of Labels at the start of the current block
+    # only look at the instructions that affect the division, which is much faster than looking at
+    # every instruction in Python code
+    if opcodes is None:
+        opcodes = map(_get_opcode, instructions)
+    for i in [i for i, op in enumerate(opcodes) if op in _BOUNDARY_OPCODES]:
+        if opcodes[i] == ops.Label.opcode:
+            if i > start + num_labels:
+                starts.append(start)
+                firsts.append(start + num_labels)
+                ends.append(i)
+                start = i
+                num_labels = 0
+            num_labels += 1
+        else:
+            starts.append(start)
+            firsts.append(start + num_labels)
+            ends.append(i + 1)
+            start = i + 1
+            num_labels = 0
+    if start < len(instructions) or not starts:
+        starts.append(start)
+        firsts.append(start + num_labels)
+        ends.append(len(instructions))
+    return starts, firsts, ends
+
+
+def get_label_map(code_blocks):
+    """Returns a dictionary of {Label: index of the block that starts with it}."""
+    return {label: block.index for block in code_blocks for label in block.labels}
+
+
+def find_reachable(code_blocks):
+    """Returns the set of indexes of the blocks that can be reached from the first block.
+
+    The targets of SETUP_* instructions count as reachable, because they are entered through the
+    block stack when an exception occurs or a loop ends.
+
+    """
+    label_map = get_label_map(code_blocks)
+    reachable = set()
+    to_visit = [0]
+    while to_visit:
+        index = to_visit.pop()
+        if index in reachable or index >= len(code_blocks):
+            continue
+        reachable.add(index)
+        block = code_blocks[index]
+        if block.can_fall_through():
+            to_visit.append(index + 1)
+        target = block.jump_target()
+        if target is not None:
+            to_visit.append(label_map[target])
+    return reachable
@@ -0,0 +1,191 @@
+"""
+
+Persistent on-disk cache of code objects produced by ByteAround.
+
+A cache is a single append-only file. It starts with a magic string and is followed by records of
+the form (marker, key length, data length, checksum, key, marshalled code object). When a cache is
+opened, the file is memory-mapped and only the records are scanned to build an index; code objects
+are unmarshalled one at a time when they are looked up. Records that were only partly written (for
+example because the disk was full) are skipped.
+
+Usage:
+
+    cache = CodeCache('/tmp/transformed.cache', version='my-transform-1')
+    f.__code__ = cache.transform(f.__code__, my_transform)
+
+"""
+import errno
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+import zlib
+
+from . import code_object
+from . import instrument
+
+_MAGIC = 'BACACHE2'
+# the start of every record, so that the records after a damaged one can be found
+_RECORD_MARKER = '\xbaREC'
+# marker, key length, data length and CRC-32 of the key and the data
+_RECORD_HEADER = struct.Struct('<4sIII')
+
+
+def fingerprint(co):
+    """Returns a string that uniquely identifies the contents of a code object."""
+    return hashlib.sha1(marshal.dumps(co)).hexdigest()
+
+
+class CodeCache(object):
+    """A cache of transformed code objects, keyed by the fingerprint of the original code object.
+
+    version is a tag identifying the transform; entries created with a different version are
+    ignored, so it should be changed whenever the transform changes its output.
+
+    """
+    def __init__(self, path, version=''):
+        self.path = path
+        self.version = version
+        self._index = {}  # key -> (offset of data, length of data)
+        self._map = None
+        self._scanned_size = len(_MAGIC)
+        self._create_if_missing()
+        self._refresh()
+
+    def get(self, co):
+        """Returns the cached transformed version of co, or None if there is none."""
+        key = self._key(co)
+        if key not in self._index:
+            self._refresh()
+            if key not in self._index:
+                instrument.record_event('cache', 'misses', co.co_name)
+                return None
+        instrument.record_event('cache', 'hits', co.co_name)
+        offset, length = self._index[key]
+        if self._map is None or offset + length > len(self._map):
+            self._remap()
+        return marshal.loads(self._map[offset:offset + length])
+
+    def put(self, co, transformed):
+        """Adds the transformed version of co to the cache."""
+        key = self._key(co)
+        data = marshal.dumps(transformed)
+        record = _RECORD_HEADER.pack(
+            _RECORD_MARKER, len(key), len(data), _checksum(key + data)) + key + data
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            # a single write to a file opened with O_APPEND, so that concurrent writers from
+            # several processes do not interleave their records; if the write is short, the rest
+            # is appended separately, and if another record gets in between or writing fails,
+            # the checksum makes readers skip the damaged record
+            written = 0
+            while written < len(record):
+                try:
+                    written += os.write(fd, record[written:])
+                except OSError as e:
+                    if e.errno != errno.EINTR:
+                        raise
+        finally:
+            os.close(fd)
+
+    def transform(self, co, fn, pessimize=False):
+        """Returns the result of applying fn to co, using the cache if possible.
+
+        fn is called with a ByteAround object for co and should return the ByteAround to convert
+        back into a code object (usually the same object, modified in place).
+
+        """
+        cached = self.get(co)
+        if cached is not None:
+            return cached
+        ba = code_object.ByteAround.from_code(co)
+        transformed = fn(ba).to_code(pessimize=pessimize)
+        self.put(co, transformed)
+        return transformed
+
+    def __contains__(self, co):
+        key = self._key(co)
+        if key not in self._index:
+            self._refresh()
+        return key in self._index
+
+    def __len__(self):
+        self._refresh()
+        return len(self._index)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _key(self, co):
+        return '%s:%s' % (self.version, fingerprint(co))
+
+    def _create_if_missing(self):
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        else:
+            try:
+                os.write(fd, _MAGIC)
+            finally:
+                os.close(fd)
+
+    def _remap(self):
+        self.close()
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(_MAGIC)] != _MAGIC:
+            self.close()
+            raise ValueError('%s is not a bytearound cache file' % self.path)
+
+    def _refresh(self):
+        """Indexes any records appended to the file since it was last scanned."""
+        if os.path.getsize(self.path) == self._scanned_size:
+            return
+        self._remap()
+        size = len(self._map)
+        offset = self._scanned_size
+        while offset + _RECORD_HEADER.size <= size:
+            record = self._read_record(offset, size)
+            if record is None:
+                # the record is damaged or still being written; continue with the next valid
+                # record if there is one, and otherwise look at this one again next time
+                next_offset = self._find_record(offset + 1, size)
+                if next_offset is None:
+                    break
+                offset = next_offset
+                continue
+            key, data_offset, data_length = record
+            self._index[key] = (data_offset, data_length)
+            offset = data_offset + data_length
+        self._scanned_size = offset
+
+    def _read_record(self, offset, size):
+        """Returns (key, data offset, data length) for a complete record, or None."""
+        marker, key_length, data_length, checksum = _RECORD_HEADER.unpack_from(self._map, offset)
+        if marker != _RECORD_MARKER:
+            return None
+        key_offset = offset + _RECORD_HEADER.size
+        data_offset = key_offset + key_length
+        if data_offset + data_length > size or \
+                _checksum(self._map[key_offset:data_offset + data_length]) != checksum:
+            return None
+        return self._map[key_offset:data_offset], data_offset, data_length
+
+    def _find_record(self, start, size):
+        """Returns the offset of the first complete record after start, or None."""
+        while True:
+            offset = self._map.find(_RECORD_MARKER, start, size)
+            if offset == -1 or offset + _RECORD_HEADER.size > size:
+                return None
+            if self._read_record(offset, size) is not None:
+                return offset
+            start = offset + 1
+
+
+def _checksum(data):
+    return zlib.crc32(data) & 0xffffffff
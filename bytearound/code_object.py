@@ -3,14 +3,19 @@
 bytearound's representation of a code object.
 
 """
-import inspect
 import itertools
 import types
 
+from . import frozen
 from . import generator
+from . import instrument
 from .ops import Instruction, Label
 from . import parser
 
+# flags from inspect, which is slow to import
+_CO_VARARGS = 0x4
+_CO_VARKEYWORDS = 0x8
+
 
 class ByteAround(object):
     """bytearound's representation of a Python code object."""
@@ -38,11 +43,19 @@ class ByteAround(object):
         if pessimized_names is None:
             pessimized_names = {}
         self.pessimized_names = pessimized_names
+        # see pattern.get_index
+        self._pattern_index = None
 
     @classmethod
     def from_code(cls, co, is_function=True):
         """Creates a CodeObject object from a raw Python code object."""
+        record = instrument.new_record('from_code', co.co_name)
+        if record is not None:
+            record.start_phase('parse')
         instructions = parser.parse(co)
+        if record is not None:
+            record.start_phase('setup')
+            record.count('instructions', len(instructions))
         # if the code object is a function, the first element in co_consts is supposed to be
         # the docstring
         if is_function and co.co_consts:
@@ -50,9 +63,9 @@ class ByteAround(object):
         else:
             docstring = cls._not_a_function
         argcount = co.co_argcount
-        if co.co_flags & inspect.CO_VARARGS:
+        if co.co_flags & _CO_VARARGS:
             argcount += 1
-        if co.co_flags & inspect.CO_VARKEYWORDS:
+        if co.co_flags & _CO_VARKEYWORDS:
             argcount += 1
         argnames = co.co_varnames[:argcount]
 
@@ -72,37 +85,72 @@ class ByteAround(object):
                 else:
                     pessimized_names[name] = co.co_names[idx - 1]
 
-        return cls(
+        ba = cls(
             instructions, co.co_filename, co.co_name, co.co_flags, argnames, docstring,
             co.co_firstlineno, pessimized_names
         )
+        if record is not None:
+            record.finish()
+        return ba
 
     @classmethod
     def from_function(cls, fn):
         """Creates a ByteAround object from a function."""
         return cls.from_code(fn.__code__, is_function=True)
 
-    def to_code(self, pessimize=False):
+    def to_code(self, pessimize=False, dedupe_consts=False, pool=None, compact=False,
+                collapse_lnotab=False, precise_stacksize=False):
         """Computes a code object from this object.
 
         If pessimize is True, attempts to replicate CPython's behavior more exactly, even where it
         is slightly less efficient.
 
+        If dedupe_consts is True, constants that are equal in type and value (such as strings
+        created separately by a transform) share a single entry in co_consts. By default,
+        constants are only shared if they are the same object, so that code objects round-trip
+        exactly.
+
+        pool is an interning.InternPool that is shared between many to_code() calls, so that equal
+        constants in different code objects become the same object.
+
+        If compact is True, produces smaller code objects for deployment: the docstring is dropped
+        (co_consts[0] becomes None), constants are deduplicated by value and CPython's quirks are
+        not replicated, so compact cannot be combined with pessimize. If collapse_lnotab is True,
+        co_lnotab only contains the line of the first instruction, which makes tracebacks and
+        debuggers less precise.
+
+        If precise_stacksize is True, co_stacksize is the exact maximum stack depth rather than
+        CPython's conservative estimate (see generator.compute_stacksize), which reduces the memory
+        allocated for each frame. It cannot be combined with pessimize.
+
+        When instrumentation is enabled (see bytearound.instrument), the time spent in each phase
+        is recorded: offsets, operands (nested in offsets and code), labels, code, lnotab,
+        stacksize and code_object.
+
         """
+        if precise_stacksize and pessimize:
+            raise ValueError('precise_stacksize and pessimize cannot be used together')
+        record = instrument.new_record('to_code', self.name)
         code, consts, cellvars, freevars, varnames, names, lnotab = generator.generate(
-            self, pessimize=pessimize)
+            self, pessimize=pessimize, record=record, dedupe_consts=dedupe_consts, pool=pool,
+            compact=compact, collapse_lnotab=collapse_lnotab)
+        if record is not None:
+            record.start_phase('stacksize')
+        stacksize = generator.compute_stacksize(self, precise=precise_stacksize)
+        if record is not None:
+            record.start_phase('code_object')
         lnotab = ''.join(map(chr, itertools.chain.from_iterable(lnotab)))
         codestring = ''.join(map(chr, code))
         argcount = len(self.argnames)
-        if self.flags & inspect.CO_VARARGS:
+        if self.flags & _CO_VARARGS:
             argcount -= 1
-        if self.flags & inspect.CO_VARKEYWORDS:
+        if self.flags & _CO_VARKEYWORDS:
             argcount -= 1
-        return types.CodeType(
+        co = types.CodeType(
             argcount,
             # TODO add kwonlyargcount
             len(varnames),  # nlocals
-            generator.compute_stacksize(self),
+            stacksize,
             self.flags,
             codestring,
             tuple(consts),
@@ -115,11 +163,23 @@ class ByteAround(object):
             tuple(freevars),
             tuple(cellvars),
         )
+        if record is not None:
+            record.finish()
+        return co
 
     def is_function(self):
         """Whether this code object is for a function."""
         return self.docstring is not self._not_a_function
 
+    def freeze(self):
+        """Returns an immutable, hashable snapshot of this object (see bytearound.frozen).
+
+        The snapshot can be shared between threads and converted back into a ByteAround object
+        with thaw().
+
+        """
+        return frozen.freeze(self)
+
     def __setitem__(self, key, value):
         """Wrapper around writing to self.instructions, to automatically set line numbers.
 
@@ -170,17 +230,51 @@ class ByteAround(object):
                             % instr)
 
             self.instructions[key] = value
+            self._update_pattern_index(key, value)
         else:
             if isinstance(value, Label):
                 self.instructions[key] = value
+                self._update_pattern_index(key, value)
             elif isinstance(value, Instruction):
                 if value.lineno is None:
                     value.lineno = _get_nearest_lineno(self.instructions, key)
                 self.instructions[key] = value
+                self._update_pattern_index(key, value)
             else:
                 raise TypeError(
                     'Instructions can only contain Instruction and Label objects, not %s' % value)
 
+    def insert_instructions(self, index, instructions, lineno=None):
+        """Inserts a list of instructions before the given position.
+
+        Instructions whose line number is None get the given lineno, or by default the line
+        number of the instruction nearest to the insertion point. Unlike slice assignment, this
+        looks up the nearest line number at most once for the whole list.
+
+        """
+        instructions = list(instructions)
+        missing_lineno = []
+        for instr in instructions:
+            if not isinstance(instr, Instruction):
+                raise TypeError(
+                    'Instructions can only contain Instruction and Label objects, not %s' % instr)
+            if instr.lineno is None and not isinstance(instr, Label):
+                missing_lineno.append(instr)
+        if missing_lineno:
+            if lineno is None:
+                lineno = _get_nearest_lineno(self.instructions, index)
+            for instr in missing_lineno:
+                instr.lineno = lineno
+        key = slice(index, index)
+        self.instructions[key] = instructions
+        self._update_pattern_index(key, instructions)
+
+    def _update_pattern_index(self, key, value):
+        # called after the assignment, so that failed assignments do not change the index
+        index = self._pattern_index
+        if index is not None:
+            index.update(self.instructions, key, value)
+
     def __getitem__(self, key):
         return self.instructions[key]
 
@@ -194,7 +288,8 @@ class ByteAround(object):
         return 'ByteAround(%s)' % self.instructions
 
     def __repr__(self):
-        return 'ByteAround(%s)' % ', '.join('%s=%r' % p for p in self.__dict__.iteritems())
+        return 'ByteAround(%s)' % ', '.join(
+            '%s=%r' % p for p in self.__dict__.iteritems() if not p[0].startswith('_'))
 
 
 def _get_nearest_lineno(lst, first_index):
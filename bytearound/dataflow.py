@@ -0,0 +1,604 @@
+"""
+
+Dataflow analysis over the basic blocks of a ByteAround object.
+
+Facts are represented as integers used as bitsets, and the solver uses a worklist. Two analyses are
+included:
+- Liveness: which variables may be read before they are next assigned
+- ReachingDefinitions: which assignments may have produced the current value of a variable
+
+Both track fast locals (LOAD_FAST and friends) and names (LOAD_NAME and friends, as used in module
+and class bodies). Variables are identified by (kind, name) tuples, where kind is FAST or NAME.
+
+Exceptions are taken into account: every block inside a try block (as determined by simulating the
+SETUP_* and POP_BLOCK instructions) has an exceptional edge to the innermost handler, along which
+the facts from any point in the block flow.
+
+Usage:
+
+    result = Liveness(ba).solve()
+    for i, instr in enumerate(ba):
+        print(instr, result.decode(result.before(i)))
+
+"""
+from collections import namedtuple
+import opcode
+from operator import attrgetter
+
+from . import blocks
+from . import ops
+
+FORWARD = 'forward'
+BACKWARD = 'backward'
+
+FAST = 'fast'
+NAME = 'name'
+
+_LABEL = ops.Label.opcode
+
+_EXCEPTION_SETUPS = frozenset([
+    ops.SETUP_EXCEPT.opcode,
+    ops.SETUP_FINALLY.opcode,
+    ops.SETUP_WITH.opcode,
+])
+_SETUPS = _EXCEPTION_SETUPS | frozenset([ops.SETUP_LOOP.opcode])
+_BLOCK_STACK_OPCODES = _SETUPS | frozenset([
+    ops.POP_BLOCK.opcode,
+    ops.BREAK_LOOP.opcode,
+    ops.END_FINALLY.opcode,
+])
+# {opcode: (kind of variable, whether it reads the variable, whether it writes the variable)};
+# deleting a variable counts as a read because it fails if the variable is not set
+_VARIABLE_ACCESSES = {
+    ops.LOAD_FAST.opcode: (FAST, True, False),
+    ops.STORE_FAST.opcode: (FAST, False, True),
+    ops.DELETE_FAST.opcode: (FAST, True, True),
+    ops.LOAD_NAME.opcode: (NAME, True, False),
+    ops.STORE_NAME.opcode: (NAME, False, True),
+    ops.DELETE_NAME.opcode: (NAME, True, True),
+}
+_CONTINUE_LOOP = ops.CONTINUE_LOOP.opcode
+_JUMP_OPCODES = frozenset(opcode.hasjrel + opcode.hasjabs)
+# instructions after which execution never continues with the next instruction, as in blocks.py
+_NO_FALL_THROUGH = frozenset([
+    ops.JUMP_ABSOLUTE.opcode,
+    ops.JUMP_FORWARD.opcode,
+    ops.CONTINUE_LOOP.opcode,
+    ops.RETURN_VALUE.opcode,
+    ops.RAISE_VARARGS.opcode,
+    ops.BREAK_LOOP.opcode,
+])
+# elements that the control flow graph needs to see, apart from the last one in each block
+_CFG_OPCODES = _BLOCK_STACK_OPCODES | frozenset([_CONTINUE_LOOP, _LABEL])
+_get_opcode = attrgetter('opcode')
+
+
+class ControlFlowGraph(object):
+    """The basic blocks of a list of instructions and the edges between them.
+
+    successors[i] lists the blocks that execution may continue with after block i finishes
+    normally, and exceptional_successors[i] the handlers that may be entered when an exception
+    occurs within block i. block_stacks[i] is the block stack at the start of block i, as a tuple of
+    (opcode of the SETUP_* instruction, index of its target block) pairs, or None if block i is
+    unreachable.
+
+    The graph is built from the positions of the blocks (see blocks.block_bounds); the BasicBlock
+    objects are only created when the blocks attribute is first used.
+
+    """
+    def __init__(self, instructions):
+        self.instructions = instructions
+        # opcode of each instruction, which the analyses use to find the instructions they need
+        # without looking at every instruction in Python code
+        self.opcodes = map(_get_opcode, instructions)
+        self._starts, self._firsts, self._ends = blocks.block_bounds(instructions, self.opcodes)
+        self.num_blocks = len(self._starts)
+        self.successors = [[] for _ in xrange(self.num_blocks)]
+        self.exceptional_successors = [[] for _ in xrange(self.num_blocks)]
+        # index of the block that contains each instruction
+        self._block_indexes = []
+        for index, (start, end) in enumerate(zip(self._starts, self._ends)):
+            self._block_indexes += [index] * (end - start)
+        self._blocks = None
+        self._build()
+        self.predecessors = _invert(self.successors)
+        self.exceptional_predecessors = _invert(self.exceptional_successors)
+
+    @property
+    def blocks(self):
+        """The BasicBlocks, as returned by blocks.split_blocks()."""
+        if self._blocks is None:
+            self._blocks = blocks.split_blocks(self.instructions, self.opcodes)
+        return self._blocks
+
+    def instruction_stacks(self):
+        """Yields (index, instruction, block stack) for every reachable instruction.
+
+        The block stack is the one that is active before the instruction runs. Labels are skipped.
+
+        """
+        label_map = self._label_map
+        instructions = self.instructions
+        for first, end, stack in zip(self._firsts, self._ends, self.block_stacks):
+            if stack is None:
+                continue
+            for index in xrange(first, end):
+                instr = instructions[index]
+                yield index, instr, stack
+                if instr.opcode in _SETUPS:
+                    stack += ((instr.opcode, label_map[instr.oparg]),)
+                elif instr.opcode == ops.POP_BLOCK.opcode:
+                    stack = stack[:-1]
+
+    def block_of(self, instruction_index):
+        """Returns the index of the block that contains the given instruction."""
+        return self._block_indexes[instruction_index]
+
+    def block_range(self, block_index):
+        """Returns the (start, end) indexes of the instructions of a block, including its labels."""
+        return self._starts[block_index], self._ends[block_index]
+
+    def _build(self):
+        num_blocks = self.num_blocks
+        instructions = self.instructions
+        opcodes = self.opcodes
+        block_indexes = self._block_indexes
+        firsts = self._firsts
+        ends = self._ends
+        # {label: index of the block it starts}
+        label_map = self._label_map = {}
+        continue_loops = []
+        # the indexes of the instructions in each block that change the block stack
+        stack_instructions = [[] for _ in xrange(num_blocks)]
+        for i in [i for i, op in enumerate(opcodes) if op in _CFG_OPCODES]:
+            op = opcodes[i]
+            if op == _LABEL:
+                label_map[instructions[i]] = block_indexes[i]
+            elif op == _CONTINUE_LOOP:
+                continue_loops.append(i)
+            else:
+                stack_instructions[block_indexes[i]].append(i)
+        continue_targets = set(label_map[instructions[i].oparg] for i in continue_loops)
+        all_successors = self.successors
+        # {block stack: (innermost exception handler, block stack it runs with) or None}
+        handlers_by_stack = {(): None}
+        # the block stack at the start of each block, as a tuple of (opcode, target block index)
+        stacks = {0: ()}
+        worklist = [0] if num_blocks else []
+        # edges from END_FINALLY to continue targets, which may belong to any loop; they are only
+        # used to find the block stack of blocks that cannot be reached in any other way
+        deferred = []
+        while worklist or deferred:
+            if not worklist:
+                successor, successor_stack = deferred.pop()
+                if successor not in stacks:
+                    stacks[successor] = successor_stack
+                    worklist.append(successor)
+                continue
+            index = worklist.pop()
+            end = ends[index]
+            stack = stacks[index]
+            successors = []
+            handlers = []
+            if stack and end > firsts[index]:
+                try:
+                    handler = handlers_by_stack[stack]
+                except KeyError:
+                    handler = _get_handler(stack, handlers_by_stack)
+                if handler is not None:
+                    handlers.append(handler)
+            for i in stack_instructions[index]:
+                op = opcodes[i]
+                if op in _SETUPS:
+                    # the target is entered after the block has been popped
+                    target = label_map[instructions[i].oparg]
+                    successors.append((target, stack))
+                    stack += ((op, target),)
+                elif op == ops.POP_BLOCK.opcode:
+                    stack = stack[:-1]
+                    if i != end - 1:
+                        handler = _get_handler(stack, handlers_by_stack)
+                        if handler is not None:
+                            handlers.append(handler)
+                else:
+                    # BREAK_LOOP, or END_FINALLY, which may continue a break or continue that was
+                    # interrupted by a finally block
+                    successors += _break_targets(stack)
+                    if op == ops.END_FINALLY.opcode:
+                        for target in continue_targets:
+                            if target not in all_successors[index]:
+                                all_successors[index].append(target)
+                            deferred.append((target, _continue_stack(stack)))
+            # labels have an opcode that is neither a jump nor an exit, so the last element of a block
+            # without instructions falls through
+            last_opcode = opcodes[end - 1]
+            if last_opcode in _JUMP_OPCODES and last_opcode not in _SETUPS:
+                target = label_map[instructions[end - 1].oparg]
+                if last_opcode == _CONTINUE_LOOP:
+                    # CONTINUE_LOOP unwinds the blocks inside the loop
+                    successors.append((target, _continue_stack(stack)))
+                else:
+                    successors.append((target, stack))
+            if last_opcode not in _NO_FALL_THROUGH and index + 1 < num_blocks:
+                successors.append((index + 1, stack))
+            block_successors = all_successors[index]
+            for successor, successor_stack in successors:
+                if successor not in block_successors:
+                    block_successors.append(successor)
+                if successor not in stacks:
+                    stacks[successor] = successor_stack
+                    worklist.append(successor)
+            if handlers:
+                if len(handlers) > 1:
+                    handlers = sorted(set(handlers))
+                for handler, handler_stack in handlers:
+                    self.exceptional_successors[index].append(handler)
+                    if handler not in stacks:
+                        stacks[handler] = handler_stack
+                        worklist.append(handler)
+        self.block_stacks = [stacks.get(index) for index in xrange(num_blocks)]
+
+
+def _get_handler(stack, handlers_by_stack):
+    """Returns the innermost exception handler in the block stack and the stack it runs with.
+
+    Returns None if there is no handler. handlers_by_stack caches the results.
+
+    """
+    try:
+        return handlers_by_stack[stack]
+    except KeyError:
+        pass
+    handler = None
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i][0] in _EXCEPTION_SETUPS:
+            handler = stack[i][1], stack[:i]
+            break
+    handlers_by_stack[stack] = handler
+    return handler
+
+
+def _break_targets(stack):
+    """Returns the (block, stack) pairs that a break with the given block stack may go to."""
+    targets = []
+    for i in range(len(stack) - 1, -1, -1):
+        op, target = stack[i]
+        targets.append((target, stack[:i]))
+        if op == ops.SETUP_LOOP.opcode:
+            break
+    return targets
+
+
+def _continue_stack(stack):
+    """Returns the block stack after a continue, which unwinds the blocks inside the loop."""
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i][0] == ops.SETUP_LOOP.opcode:
+            return stack[:i + 1]
+    return stack
+
+
+def _invert(edges):
+    result = [[] for _ in edges]
+    for source, targets in enumerate(edges):
+        for target in targets:
+            result[target].append(source)
+    return result
+
+
+class Analysis(object):
+    """Base class for dataflow analyses.
+
+    Subclasses set direction to FORWARD or BACKWARD and implement effect(), which returns a
+    (gen, kill) pair of bitsets for an instruction: the fact after the instruction (before it, for
+    backward analyses) is gen | (fact & ~kill). Facts from different paths are combined with
+    union, so only "may" analyses are supported. Subclasses may also override block_effects() to
+    compute the effects of whole blocks without calling effect() for every instruction.
+
+    """
+    direction = FORWARD
+
+    def __init__(self, ba):
+        self.ba = ba
+        self.cfg = ControlFlowGraph(ba.instructions)
+
+    def boundary(self):
+        """Returns the fact at the entry (or exit, for backward analyses) of the code."""
+        return 0
+
+    def effect(self, index, instr):
+        """Returns (gen, kill) for the instruction at the given index."""
+        raise NotImplementedError
+
+    def decode(self, bits):
+        """Converts a bitset into a more convenient representation."""
+        return bits
+
+    def solve(self):
+        """Runs the analysis, returning a DataflowResult."""
+        if self.direction == FORWARD:
+            return _solve_forward(self)
+        else:
+            return _solve_backward(self)
+
+    def block_effects(self):
+        """Returns lists of gen, kill and all_gen (the union of all gens) for each block."""
+        gens = []
+        kills = []
+        all_gens = []
+        instructions = self.ba.instructions
+        effect = self.effect
+        for block_index in xrange(self.cfg.num_blocks):
+            gen = kill = all_gen = 0
+            indexes = range(*self.cfg.block_range(block_index))
+            if self.direction == BACKWARD:
+                indexes.reverse()
+            for i in indexes:
+                instr = instructions[i]
+                if instr.opcode == _LABEL:
+                    continue
+                instr_gen, instr_kill = effect(i, instr)
+                if instr_gen or instr_kill:
+                    gen = instr_gen | (gen & ~instr_kill)
+                    kill |= instr_kill
+                    all_gen |= instr_gen
+            gens.append(gen)
+            kills.append(kill)
+            all_gens.append(all_gen)
+        return gens, kills, all_gens
+
+
+def _solve_forward(analysis):
+    cfg = analysis.cfg
+    num_blocks = cfg.num_blocks
+    gens, kills, all_gens = analysis.block_effects()
+    block_in = [0] * num_blocks
+    block_out = [0] * num_blocks
+    boundary = analysis.boundary()
+    predecessors = cfg.predecessors
+    exceptional_predecessors = cfg.exceptional_predecessors
+    successors = _all_successors(cfg)
+    # the worklist is a flag for each block; the blocks are visited in order, so that the facts from
+    # the end of a loop reach the start of the loop before the code after the loop is visited, and
+    # another sweep is only needed when a fact flows backward
+    pending = [True] * num_blocks
+    sweep = bool(num_blocks)
+    while sweep:
+        sweep = False
+        for index in xrange(num_blocks):
+            if not pending[index]:
+                continue
+            pending[index] = False
+            fact = boundary if index == 0 else 0
+            for predecessor in predecessors[index]:
+                fact |= block_out[predecessor]
+            for predecessor in exceptional_predecessors[index]:
+                # the exception may happen anywhere in the predecessor
+                fact |= block_in[predecessor] | all_gens[predecessor]
+            out = gens[index] | (fact & ~kills[index])
+            if fact != block_in[index] or out != block_out[index]:
+                block_in[index] = fact
+                block_out[index] = out
+                for successor in successors[index]:
+                    pending[successor] = True
+                    if successor <= index:
+                        sweep = True
+    return DataflowResult(analysis, block_in, block_out)
+
+
+def _solve_backward(analysis):
+    cfg = analysis.cfg
+    num_blocks = cfg.num_blocks
+    gens, kills, _ = analysis.block_effects()
+    block_in = [0] * num_blocks
+    block_out = [0] * num_blocks
+    boundary = analysis.boundary()
+    successors = cfg.successors
+    exceptional_successors = cfg.exceptional_successors
+    predecessors = _all_predecessors(cfg)
+    # like in _solve_forward, but the blocks are visited in reverse order
+    pending = [True] * num_blocks
+    sweep = bool(num_blocks)
+    while sweep:
+        sweep = False
+        for index in xrange(num_blocks - 1, -1, -1):
+            if not pending[index]:
+                continue
+            pending[index] = False
+            if successors[index]:
+                fact = 0
+                for successor in successors[index]:
+                    fact |= block_in[successor]
+            else:
+                fact = boundary
+            block_out[index] = fact
+            new_in = gens[index] | (fact & ~kills[index])
+            for handler in exceptional_successors[index]:
+                new_in |= block_in[handler]
+            if new_in != block_in[index]:
+                block_in[index] = new_in
+                for predecessor in predecessors[index]:
+                    pending[predecessor] = True
+                    if predecessor >= index:
+                        sweep = True
+    return DataflowResult(analysis, block_in, block_out)
+
+
+def _all_successors(cfg):
+    return [normal + exceptional
+            for normal, exceptional in zip(cfg.successors, cfg.exceptional_successors)]
+
+
+def _all_predecessors(cfg):
+    return [normal + exceptional
+            for normal, exceptional in zip(cfg.predecessors, cfg.exceptional_predecessors)]
+
+
+def _exceptional_fact(cfg, block_in, index):
+    fact = 0
+    for handler in cfg.exceptional_successors[index]:
+        fact |= block_in[handler]
+    return fact
+
+
+class DataflowResult(object):
+    """The solution of a dataflow analysis.
+
+    block_in and block_out are the facts at the start and at the end of each block, regardless of
+    the direction of the analysis.
+
+    """
+    def __init__(self, analysis, block_in, block_out):
+        self.analysis = analysis
+        self.block_in = block_in
+        self.block_out = block_out
+
+    def before(self, index):
+        """Returns the fact right before the instruction at the given index."""
+        analysis = self.analysis
+        cfg = analysis.cfg
+        block_index = cfg.block_of(index)
+        start, end = cfg.block_range(block_index)
+        instructions = analysis.ba.instructions
+        if analysis.direction == FORWARD:
+            fact = self.block_in[block_index]
+            indexes = range(start, index)
+        else:
+            fact = self.block_out[block_index]
+            indexes = range(end - 1, index - 1, -1)
+        for i in indexes:
+            instr = instructions[i]
+            if not isinstance(instr, ops.Label):
+                gen, kill = analysis.effect(i, instr)
+                fact = gen | (fact & ~kill)
+        if analysis.direction == BACKWARD:
+            fact |= _exceptional_fact(cfg, self.block_in, block_index)
+        return fact
+
+    def decode(self, bits):
+        return self.analysis.decode(bits)
+
+
+class _VariableAnalysis(Analysis):
+    """Base class for analyses of variables, which assigns a bit to each variable."""
+    def __init__(self, ba):
+        super(_VariableAnalysis, self).__init__(ba)
+        self.variables = [(FAST, name) for name in ba.argnames]
+        self.variable_bits = {variable: 1 << i for i, variable in enumerate(self.variables)}
+        # (index, block index, whether it reads, whether it writes, variable) for each instruction
+        # that accesses a variable
+        self._accesses = []
+        instructions = ba.instructions
+        opcodes = self.cfg.opcodes
+        block_indexes = self.cfg._block_indexes
+        for i in [i for i, op in enumerate(opcodes) if op in _VARIABLE_ACCESSES]:
+            kind, reads, writes = _VARIABLE_ACCESSES[opcodes[i]]
+            variable = (kind, instructions[i].oparg)
+            if variable not in self.variable_bits:
+                self.variable_bits[variable] = 1 << len(self.variables)
+                self.variables.append(variable)
+            self._accesses.append((i, block_indexes[i], reads, writes, variable))
+
+    def decode(self, bits):
+        """Returns the set of variables in a bitset."""
+        return set(variable for i, variable in enumerate(self.variables) if bits & (1 << i))
+
+
+class Liveness(_VariableAnalysis):
+    """Computes which variables may be read before they are assigned again.
+
+    Names (as opposed to fast locals) are considered live at the end of the code, because they may
+    be read by other code after a module or class body finishes.
+
+    """
+    direction = BACKWARD
+
+    def boundary(self):
+        bits = 0
+        for variable, bit in self.variable_bits.items():
+            if variable[0] == NAME:
+                bits |= bit
+        return bits
+
+    def effect(self, index, instr):
+        try:
+            kind, reads, writes = _VARIABLE_ACCESSES[instr.opcode]
+        except KeyError:
+            return 0, 0
+        bit = self.variable_bits[(kind, instr.oparg)]
+        return (bit if reads else 0), (bit if writes else 0)
+
+    def block_effects(self):
+        num_blocks = self.cfg.num_blocks
+        gens = [0] * num_blocks
+        kills = [0] * num_blocks
+        all_gens = [0] * num_blocks
+        variable_bits = self.variable_bits
+        # going forward through the block, a read generates the variable unless it has been
+        # assigned earlier in the block
+        for _, block_index, reads, writes, variable in self._accesses:
+            bit = variable_bits[variable]
+            if reads:
+                gens[block_index] |= bit & ~kills[block_index]
+                all_gens[block_index] |= bit
+            if writes:
+                kills[block_index] |= bit
+        return gens, kills, all_gens
+
+
+# a definition of a variable: index of the assigning instruction (None for arguments, which are
+# defined on entry) and the (kind, name) of the variable
+Definition = namedtuple('Definition', ['index', 'variable'])
+
+
+class ReachingDefinitions(_VariableAnalysis):
+    """Computes which definitions of each variable may reach each point in the code.
+
+    Arguments are defined on entry. Deleting a variable also counts as a definition.
+
+    """
+    direction = FORWARD
+
+    def __init__(self, ba):
+        super(ReachingDefinitions, self).__init__(ba)
+        self.definitions = [Definition(None, (FAST, name)) for name in ba.argnames]
+        self._definition_bits = {}  # instruction index -> bit
+        for i, _, _, writes, variable in self._accesses:
+            if writes:
+                self._definition_bits[i] = 1 << len(self.definitions)
+                self.definitions.append(Definition(i, variable))
+        # {variable: bitset of all its definitions}
+        self._variable_definitions = {}
+        for i, definition in enumerate(self.definitions):
+            self._variable_definitions[definition.variable] = \
+                self._variable_definitions.get(definition.variable, 0) | (1 << i)
+
+    def boundary(self):
+        return (1 << len(self.ba.argnames)) - 1
+
+    def effect(self, index, instr):
+        try:
+            bit = self._definition_bits[index]
+        except KeyError:
+            return 0, 0
+        variable = (_VARIABLE_ACCESSES[instr.opcode][0], instr.oparg)
+        return bit, self._variable_definitions[variable]
+
+    def block_effects(self):
+        num_blocks = self.cfg.num_blocks
+        gens = [0] * num_blocks
+        kills = [0] * num_blocks
+        all_gens = [0] * num_blocks
+        definition_bits = self._definition_bits
+        variable_definitions = self._variable_definitions
+        for i, block_index, _, writes, variable in self._accesses:
+            if writes:
+                bit = definition_bits[i]
+                kill = variable_definitions[variable]
+                gens[block_index] = bit | (gens[block_index] & ~kill)
+                kills[block_index] |= kill
+                all_gens[block_index] |= bit
+        return gens, kills, all_gens
+
+    def decode(self, bits):
+        """Returns the list of Definitions in a bitset."""
+        return [definition for i, definition in enumerate(self.definitions) if bits & (1 << i)]
@@ -5,19 +5,17 @@ Helpers for debugging and testing code objects.
 """
 from __future__ import print_function
 
-import contextlib
 import difflib
 import dis
-import re
-import sys
+import opcode
 import types
 
 from . import code_object
+from . import generator
 from . import parser
 
 
 _CODE_OBJECT_ATTRIBUTES = sorted(attr for attr in dir(types.CodeType) if not attr.startswith('_'))
-_REMOVE_LOAD_CONST_NUM_RGX = re.compile(r'LOAD_CONST +\d+ ')
 
 
 def check_recursive(obj, seen=None):
@@ -77,98 +75,171 @@ def compare_code_objects(co1, co2):
     - co_lnotab may have unnecessary extra entries when generated by CPython
 
     """
-    not_equal = set()
+    difference = diff_code_objects(co1, co2)
+    if difference.attributes or difference.ignored:
+        print(difference.format())
+    return not difference
+
+
+def diff_code_objects(co1, co2):
+    """Compares two code objects structurally and returns a CodeDifference.
+
+    Harmless differences are ignored as in compare_code_objects. Instead of disassembling the code
+    objects with dis, this decodes co_code into tuples of (opname, argument), with arguments
+    resolved to the constants and names they refer to, and compares those directly. It does not
+    print anything and is safe to use from multiple threads.
+
+    """
+    difference = CodeDifference(co1, co2)
     different_due_to_const_rearrangement = False
 
     for attr in _CODE_OBJECT_ATTRIBUTES:
         value1 = getattr(co1, attr)
         value2 = getattr(co2, attr)
-        if value1 != value2:
-            print('%s is not equal' % attr)
-            if attr == 'co_consts' and different_due_to_const_rearrangement:
-                continue
-            if attr == 'co_stacksize':
-                # co_stacksize differences often happen because the peephole optimizer stage that
-                # moves constant tuples into co_consts runs after co_stacksize is computed, so
-                # ignore differences that can be explained by requiring a stack spot for each
-                # tuple element
-                smaller, larger = (co1, co2) if co1.co_stacksize < co2.co_stacksize else (co2, co1)
-                tuples_in_smaller = [obj for obj in smaller.co_consts if isinstance(obj, tuple)]
-                if tuples_in_smaller:
-                    largest_size = max(len(obj) for obj in tuples_in_smaller)
-                    allowed_difference = largest_size - 1
-                    if larger.co_stacksize - smaller.co_stacksize <= allowed_difference:
-                        print('ignoring co_stacksize difference due to tuple optimization')
-                        continue
-            if attr == 'co_code':
-                disassembled1 = _disassemble_to_string(co1)
-                disassembled2 = _disassemble_to_string(co2)
-                if co1.co_consts != co2.co_consts and \
-                        _compare_consts(co1.co_consts, co2.co_consts):
-                    cleaned1 = _REMOVE_LOAD_CONST_NUM_RGX.sub(
-                        'LOAD_CONST               N', disassembled1)
-                    cleaned2 = _REMOVE_LOAD_CONST_NUM_RGX.sub(
-                        'LOAD_CONST               N', disassembled2)
-                    if cleaned1 == cleaned2:
-                        print('ignoring co_code difference due to const rearrangement')
-                        different_due_to_const_rearrangement = True
-                        continue
-                diff = difflib.unified_diff(disassembled1.splitlines(), disassembled2.splitlines(),
-                                            fromfile='co1', tofile='co2')
-                print(''.join(line + '\n' for line in diff))
-            elif attr == 'co_lnotab':
-                lnotab1 = list(parser.get_offsets_from_lnotab(value1))
-                lnotab2 = list(parser.get_offsets_from_lnotab(value2))
-                if _simplify_lnotab(lnotab1) == _simplify_lnotab(lnotab2):
-                    print('ignoring co_lnotab difference that disappeared after simplification')
+        if value1 == value2:
+            continue
+        if attr == 'co_consts' and different_due_to_const_rearrangement:
+            difference.ignored.append((attr, 'const rearrangement'))
+            continue
+        if attr == 'co_stacksize':
+            # co_stacksize differences often happen because the peephole optimizer stage that
+            # moves constant tuples into co_consts runs after co_stacksize is computed, so
+            # ignore differences that can be explained by requiring a stack spot for each
+            # tuple element
+            smaller, larger = (co1, co2) if co1.co_stacksize < co2.co_stacksize else (co2, co1)
+            tuples_in_smaller = [obj for obj in smaller.co_consts if isinstance(obj, tuple)]
+            if tuples_in_smaller:
+                largest_size = max(len(obj) for obj in tuples_in_smaller)
+                allowed_difference = largest_size - 1
+                if larger.co_stacksize - smaller.co_stacksize <= allowed_difference:
+                    difference.ignored.append((attr, 'tuple optimization'))
                     continue
-                diff = difflib.unified_diff(map(str, lnotab1), map(str, lnotab2),
-                                            fromfile='co1', tofile='co2')
-                print(''.join(line + '\n' for line in diff))
-            else:
-                print('%r != %r' % (value1, value2))
-            not_equal.add(attr)
+        elif attr == 'co_code':
+            if co1.co_consts != co2.co_consts and \
+                    _compare_consts(co1.co_consts, co2.co_consts) and \
+                    decode_instructions(co1) == decode_instructions(co2):
+                difference.ignored.append((attr, 'const rearrangement'))
+                different_due_to_const_rearrangement = True
+                continue
+        elif attr == 'co_lnotab':
+            lnotab1 = list(parser.get_offsets_from_lnotab(value1))
+            lnotab2 = list(parser.get_offsets_from_lnotab(value2))
+            if _simplify_lnotab(lnotab1) == _simplify_lnotab(lnotab2):
+                difference.ignored.append((attr, 'disappeared after simplification'))
+                continue
+        difference.attributes.add(attr)
 
-    return len(not_equal) == 0
+    return difference
 
 
-def _disassemble_to_string(co):
-    """Disassembles a code object using the dis module, saving the result in a string."""
-    with _capture_stdout() as f:
-        dis.dis(co)
-    return f.read()
+class CodeDifference(object):
+    """The result of diff_code_objects.
 
+    attributes is the set of code object attributes that differ and ignored is a list of
+    (attribute, reason) pairs for differences that were ignored as harmless. The object is true if
+    there are any differences that were not ignored.
 
-@contextlib.contextmanager
-def _capture_stdout():
-    """Context that captures data printed to stdout within it.
+    """
+    def __init__(self, co1, co2):
+        self.co1 = co1
+        self.co2 = co2
+        self.attributes = set()
+        self.ignored = []
+
+    def __nonzero__(self):
+        return bool(self.attributes)
+
+    __bool__ = __nonzero__
+
+    def __repr__(self):
+        return 'CodeDifference(attributes=%r, ignored=%r)' % (sorted(self.attributes), self.ignored)
+
+    def format(self):
+        """Returns a human-readable description of the differences."""
+        lines = []
+        for attr, reason in self.ignored:
+            lines.append('ignoring %s difference due to %s' % (attr, reason))
+        for attr in sorted(self.attributes):
+            lines.append('%s is not equal' % attr)
+            value1 = getattr(self.co1, attr)
+            value2 = getattr(self.co2, attr)
+            if attr == 'co_code':
+                diff = _unified_diff(format_instructions(decode_instructions(self.co1)),
+                                     format_instructions(decode_instructions(self.co2)))
+                lines += diff or ['instructions are equal after resolving arguments']
+            elif attr == 'co_lnotab':
+                lines += _unified_diff(map(str, parser.get_offsets_from_lnotab(value1)),
+                                       map(str, parser.get_offsets_from_lnotab(value2)))
+            else:
+                lines.append('%r != %r' % (value1, value2))
+        return '\n'.join(lines)
 
-    Usage:
 
-    with _capture_stdout() as f:
-        print('hello')
+def decode_instructions(co):
+    """Decodes the bytecode of a code object into a list of (opname, argument) tuples.
 
-    output = f.read()  # "hello\n"
+    Arguments are resolved to the objects they refer to: constants (as keys that distinguish
+    objects that compare equal but have different types, like 1 and 1.0), names, comparison
+    operators and cell or free variables. Jump targets are given as instruction indexes, and
+    EXTENDED_ARG is merged into the argument of the following instruction.
 
     """
-    capturer = _Capturer()
-    old_stdout = sys.stdout
-    sys.stdout = capturer
-    try:
-        yield capturer
-    finally:
-        sys.stdout = old_stdout
+    code = bytearray(co.co_code)
+    free_vars = co.co_cellvars + co.co_freevars
+    raw_instructions = []
+    offset_to_index = {}
+    extended_arg = 0
+    i = 0
+    while i < len(code):
+        offset_to_index[i] = len(raw_instructions)
+        op = code[i]
+        i += 1
+        if op < opcode.HAVE_ARGUMENT:
+            raw_instructions.append((op, None, i))
+            continue
+        oparg = code[i] + code[i + 1] * 256 + extended_arg
+        i += 2
+        if op == opcode.EXTENDED_ARG:
+            extended_arg = oparg * 65536
+            continue
+        extended_arg = 0
+        raw_instructions.append((op, oparg, i))
+    offset_to_index[i] = len(raw_instructions)
+
+    instructions = []
+    for op, oparg, next_offset in raw_instructions:
+        if oparg is None:
+            arg = None
+        elif op in opcode.hasconst:
+            const = co.co_consts[oparg]
+            # nested code objects are compared by value, not by identity
+            arg = const if isinstance(const, types.CodeType) else generator.const_key(const)
+        elif op in opcode.hasname:
+            arg = co.co_names[oparg]
+        elif op in opcode.haslocal:
+            arg = co.co_varnames[oparg]
+        elif op in opcode.hasfree:
+            arg = (free_vars[oparg], oparg < len(co.co_cellvars))
+        elif op in opcode.hascompare:
+            arg = opcode.cmp_op[oparg]
+        elif op in opcode.hasjabs:
+            arg = offset_to_index.get(oparg, oparg)
+        elif op in opcode.hasjrel:
+            arg = offset_to_index.get(next_offset + oparg, next_offset + oparg)
+        else:
+            arg = oparg
+        instructions.append((opcode.opname[op], arg))
+    return instructions
 
 
-class _Capturer(object):
-    def __init__(self):
-        self.data = []
+def format_instructions(instructions):
+    """Formats the output of decode_instructions as a list of lines."""
+    return ['%4d %-24s %r' % (i, opname, arg) if arg is not None else '%4d %s' % (i, opname)
+            for i, (opname, arg) in enumerate(instructions)]
 
-    def write(self, line):
-        self.data.append(line)
 
-    def read(self):
-        return ''.join(self.data)
+def _unified_diff(lines1, lines2):
+    return list(difflib.unified_diff(lines1, lines2, fromfile='co1', tofile='co2', lineterm=''))
 
 
 def _simplify_lnotab(pairs):
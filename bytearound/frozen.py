@@ -0,0 +1,141 @@
+"""
+
+Immutable snapshots of ByteAround objects.
+
+ByteAround objects and their instructions can be changed at any time, so a ByteAround cannot be
+shared between threads while one of them modifies it. ByteAround.freeze() returns a
+FrozenByteAround, which stores the instructions as tuples and cannot be changed after it has been
+created. It can be passed to other threads, used as a dictionary key and converted into a code
+object without any locking.
+
+Usage:
+
+    frozen = ba.freeze()
+    co = frozen.to_code()  # in any thread
+    variant = frozen.thaw()  # a new ByteAround that can be modified
+    variant[0] = ops.LOAD_CONST('goodbye')
+
+"""
+import opcode
+
+from . import generator
+from . import ops
+
+_LABEL = ops.Label.opcode
+_JUMP_OPCODES = frozenset(opcode.hasjabs + opcode.hasjrel)
+_CONST_OPCODES = frozenset(opcode.hasconst)
+
+
+class FrozenByteAround(object):
+    """An immutable and hashable snapshot of a ByteAround object.
+
+    instructions is a tuple of (opcode, oparg, lineno) tuples. Labels are represented as
+    (ops.Label.opcode, number, None), and jumps use the number of their target Label as their
+    oparg. The other attributes are the same as on ByteAround, except that argnames is a tuple and
+    pessimized_names is a sorted tuple of (key, value) pairs.
+
+    Two snapshots are equal if they have the same attributes and instructions; constants are
+    compared by type and value (see generator.const_key), so LOAD_CONST(1) and LOAD_CONST(True)
+    are different.
+
+    """
+    __slots__ = ['instructions', 'filename', 'name', 'flags', 'argnames', 'docstring',
+                 'firstlineno', 'pessimized_names', '_key', '_hash']
+
+    def __init__(self, instructions, filename, name, flags, argnames, docstring, firstlineno,
+                 pessimized_names):
+        values = {
+            'instructions': tuple(instructions),
+            'filename': filename,
+            'name': name,
+            'flags': flags,
+            'argnames': tuple(argnames),
+            'docstring': docstring,
+            'firstlineno': firstlineno,
+            'pessimized_names': tuple(sorted(pessimized_names)),
+        }
+        for attr, value in values.items():
+            object.__setattr__(self, attr, value)
+        key = (
+            tuple((op, generator.const_key(oparg) if op in _CONST_OPCODES else oparg, lineno)
+                  for op, oparg, lineno in self.instructions),
+            filename, name, flags, self.argnames, generator.const_key(docstring), firstlineno,
+            self.pessimized_names,
+        )
+        object.__setattr__(self, '_key', key)
+        object.__setattr__(self, '_hash', hash(key))
+
+    def __setattr__(self, attr, value):
+        raise AttributeError('FrozenByteAround objects are immutable')
+
+    def __delattr__(self, attr):
+        raise AttributeError('FrozenByteAround objects are immutable')
+
+    def __eq__(self, other):
+        if not isinstance(other, FrozenByteAround):
+            return NotImplemented
+        return self._hash == other._hash and self._key == other._key
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def __hash__(self):
+        return self._hash
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def __repr__(self):
+        return 'FrozenByteAround(%s, %s, %d instructions)' % (
+            self.name, self.filename, len(self.instructions))
+
+    def thaw(self):
+        """Returns a new ByteAround object with new Instructions and Labels."""
+        from . import code_object  # code_object imports this module
+
+        labels = {}
+        instructions = []
+        for op, oparg, lineno in self.instructions:
+            if op == _LABEL:
+                instructions.append(_get_label(labels, oparg))
+            elif op in _JUMP_OPCODES:
+                instructions.append(ops.Instruction.make(op, _get_label(labels, oparg), lineno))
+            else:
+                instructions.append(ops.Instruction.make(op, oparg, lineno))
+        return code_object.ByteAround(
+            instructions, self.filename, self.name, self.flags, self.argnames, self.docstring,
+            self.firstlineno, dict(self.pessimized_names))
+
+    def to_code(self, **kwargs):
+        """Computes a code object; takes the same arguments as ByteAround.to_code."""
+        return self.thaw().to_code(**kwargs)
+
+
+def freeze(ba):
+    """Returns a FrozenByteAround with the current contents of ba."""
+    label_numbers = {}
+    for instr in ba.instructions:
+        if isinstance(instr, ops.Label):
+            label_numbers[instr] = len(label_numbers)
+    instructions = []
+    for instr in ba.instructions:
+        if isinstance(instr, ops.Label):
+            instructions.append((_LABEL, label_numbers[instr], None))
+        elif instr.is_jump():
+            try:
+                number = label_numbers[instr.oparg]
+            except KeyError:
+                raise ValueError('%s jumps to a Label that is not in the code' % (instr,))
+            instructions.append((instr.opcode, number, instr.lineno))
+        else:
+            instructions.append((instr.opcode, instr.oparg, instr.lineno))
+    return FrozenByteAround(instructions, ba.filename, ba.name, ba.flags, ba.argnames,
+                            ba.docstring, ba.firstlineno, ba.pessimized_names.items())
+
+
+def _get_label(labels, number):
+    try:
+        return labels[number]
+    except KeyError:
+        label = labels[number] = ops.Label(number)
+        return label
@@ -4,25 +4,55 @@ Helpers for generating code objects from bytearound objects.
 
 """
 
-from collections import namedtuple
 from itertools import islice
 import opcode
 import sys
+import types
 
 from . import ops
 
 _EXTENDED_ARG_LIMIT = 65536
 _BYTE_LIMIT = 256
+_MAX_LNOTAB_INCREMENT = 255
 
 
-def generate(ba, pessimize=False):
+def generate(ba, pessimize=False, record=None, dedupe_consts=False, pool=None, compact=False,
+             collapse_lnotab=False):
+    """Generates the parts of a code object from a ByteAround object.
+
+    record is an instrument.CallRecord, which is given the time spent in each phase, or None. If
+    dedupe_consts is True, equal constants share a single entry in co_consts (see _ConstsList).
+
+    pool is an interning.InternPool or None. If it is given, constants are replaced with their
+    canonical versions from the pool and the constants are returned as a canonical tuple.
+
+    If compact is True, the docstring is replaced with None and constants are deduplicated by
+    value; it cannot be combined with pessimize. If collapse_lnotab is True, the lnotab only
+    records the line of the first instruction, so all of the code is attributed to that line.
+
+    co_lnotab cannot represent decreasing line numbers in Python 2, so an instruction whose line
+    number is lower than that of an earlier instruction (for example after blocks have been
+    reordered) is attributed to the highest line number so far.
+
+    """
+    if compact:
+        if pessimize:
+            raise ValueError('compact and pessimize cannot be used together')
+        dedupe_consts = True
     instrs_with_offsets = []
     label_to_offset = {}
 
     if ba.is_function():
-        consts = _ConstsList(ba.docstring)
+        if compact:
+            # keep the slot, because CPython treats co_consts[0] as the docstring
+            docstring = None
+        elif pool is not None:
+            docstring = pool.canonical(ba.docstring)
+        else:
+            docstring = ba.docstring
+        consts = _ConstsList([docstring], by_value=dedupe_consts)
     else:
-        consts = _ConstsList()
+        consts = _ConstsList(by_value=dedupe_consts)
     cellvars = []
     freevars = []
     varnames = list(ba.argnames)
@@ -30,12 +60,22 @@ def generate(ba, pessimize=False):
 
     current_offset = 0
     consts_to_move = set()
+    # {id of constant: canonical version}, so that each constant is only looked up in the pool
+    # once even though _get_oparg is called twice for each instruction
+    canonical_consts = {}
+
+    def _canonical(constant):
+        try:
+            return canonical_consts[id(constant)]
+        except KeyError:
+            canonical = canonical_consts[id(constant)] = pool.canonical(constant)
+            return canonical
 
     def _get_oparg(instr, current_offset):
         if instr.opcode in opcode.hascompare:
             return instr.oparg
         elif instr.opcode in opcode.hasconst:
-            constant = instr.oparg
+            constant = instr.oparg if pool is None else _canonical(instr.oparg)
             if pessimize:
                 if constant is None and not (ba.is_function() and consts.objs[0] is None):
                     consts_to_move.add(constant)
@@ -69,6 +109,11 @@ def generate(ba, pessimize=False):
         else:
             return instr.oparg
 
+    if record is not None:
+        _get_oparg = record.timed('operands', _get_oparg)
+        record.count('instructions', len(ba.instructions))
+        record.start_phase('offsets')
+
     # compute the offsets of all instructions, so we can generate the code
     # this is complicated by the fact that we can't know beforehand whether we'll need
     # EXTENDED_ARG, especially for jump offsets
@@ -87,6 +132,8 @@ def generate(ba, pessimize=False):
                 oparg /= _EXTENDED_ARG_LIMIT
         instrs_with_offsets.append((offset, instr))
 
+    if record is not None:
+        record.start_phase('labels')
     code = []
     # Python emits these sorted by name, rather than by usage like co_names
     cellvars = sorted(cellvars)
@@ -109,10 +156,13 @@ def generate(ba, pessimize=False):
                     else:
                         names.insert(insert_index, name)
 
+    extended_arg_count = [0]
+
     def _add_op(op, oparg):
         extended_arg = oparg // _EXTENDED_ARG_LIMIT
         rest_of_arg = oparg % _EXTENDED_ARG_LIMIT
         if extended_arg > 0:
+            extended_arg_count[0] += 1
             _add_op(opcode.EXTENDED_ARG, extended_arg)
         code.append(op)
         code.append(rest_of_arg % _BYTE_LIMIT)
@@ -121,28 +171,25 @@ def generate(ba, pessimize=False):
     lnotab = []
     prev_lineno = prev_addr = 0
 
+    if record is not None:
+        # the lnotab is built in the same pass, so its time is included in this phase
+        record.start_phase('code')
+    track_lines = True
     for current_offset, instr in instrs_with_offsets:
         if isinstance(instr, ops.Label):
             continue
-        if instr.lineno != prev_lineno:
-            addr_offset = current_offset - prev_addr
-            line_offset = instr.lineno - prev_lineno
-            while addr_offset >= _BYTE_LIMIT:
-                lnotab.append((_BYTE_LIMIT - 1, 0))
-                addr_offset -= _BYTE_LIMIT
-            while line_offset >= _BYTE_LIMIT:
-                lnotab.append((addr_offset, _BYTE_LIMIT - 1))
-                addr_offset = 0
-                line_offset -= _BYTE_LIMIT
-            if line_offset > 0 or addr_offset > 0:
-                lnotab.append((addr_offset, line_offset))
-            prev_lineno = instr.lineno
-            prev_addr = current_offset
-
+        if track_lines:
+            if instr.lineno > prev_lineno:
+                _add_lnotab_entry(lnotab, current_offset - prev_addr, instr.lineno - prev_lineno)
+                prev_lineno = instr.lineno
+                prev_addr = current_offset
+            track_lines = not collapse_lnotab
         if instr.has_argument():
             _add_op(instr.opcode, _get_oparg(instr, current_offset + 3))
         else:
             code.append(instr.opcode)
+    if record is not None:
+        record.count('extended_args', extended_arg_count[0])
 
     if pessimize and not lnotab:
         # for one-line generator expressions, CPython generates a nonempty co_lnotab
@@ -150,7 +197,26 @@ def generate(ba, pessimize=False):
         if any(isinstance(instr, ops.FOR_ITER) for instr in ba.instructions):
             lnotab.append((6, 0))
 
-    return code, consts.as_tuple(), cellvars, freevars, varnames, names, lnotab
+    if pool is not None:
+        consts_tuple = pool.canonical_tuple(consts.objs)
+    else:
+        consts_tuple = consts.as_tuple()
+    return code, consts_tuple, cellvars, freevars, varnames, names, lnotab
+
+
+def _add_lnotab_entry(lnotab, addr_offset, line_offset):
+    # each entry can hold increments of up to 255, as in assemble_lnotab() in compile.c
+    if addr_offset > _MAX_LNOTAB_INCREMENT:
+        count = addr_offset // _MAX_LNOTAB_INCREMENT
+        lnotab.extend([(_MAX_LNOTAB_INCREMENT, 0)] * count)
+        addr_offset -= count * _MAX_LNOTAB_INCREMENT
+    if line_offset > _MAX_LNOTAB_INCREMENT:
+        count = line_offset // _MAX_LNOTAB_INCREMENT
+        lnotab.append((addr_offset, _MAX_LNOTAB_INCREMENT))
+        lnotab.extend([(0, _MAX_LNOTAB_INCREMENT)] * (count - 1))
+        addr_offset = 0
+        line_offset -= count * _MAX_LNOTAB_INCREMENT
+    lnotab.append((addr_offset, line_offset))
 
 
 def _get_or_add(lst, obj):
@@ -165,29 +231,56 @@ class _ConstsList(object):
     """Maintains a list of constants.
 
     Needed because co_consts can contain different objects that nonetheless compare equal when
-    simply put in a list (e.g. 1 and 1.0). This objects keeps track of them by object identity.
+    simply put in a list (e.g. 1 and 1.0). By default, this object keeps track of them by object
+    identity, so that code objects round-trip exactly. If by_value is True, constants are
+    deduplicated by const_key() instead, so equal constants that were created separately share a
+    single entry.
 
     """
-    def __init__(self, *args):
+    def __init__(self, objs=(), by_value=False):
         self.obj_to_idx = {}
         self.objs = []
+        self.by_value = by_value
 
-        for arg in args:
-            self.add(arg)
+        for obj in objs:
+            self.add(obj)
 
     def add(self, obj):
-        identity = id(obj)
-        if identity in self.obj_to_idx:
-            return self.obj_to_idx[identity]
+        key = const_key(obj) if self.by_value else id(obj)
+        if key in self.obj_to_idx:
+            return self.obj_to_idx[key]
         idx = len(self.objs)
         self.objs.append(obj)
-        self.obj_to_idx[identity] = idx
+        self.obj_to_idx[key] = idx
         return idx
 
     def as_tuple(self):
         return tuple(self.objs)
 
 
+def const_key(obj):
+    """Returns a key for a constant that is equal only for interchangeable constants.
+
+    Objects of different types never have the same key, so 1, 1L, 1.0 and True are kept apart.
+    Floats and complex numbers are compared by their repr, so that 0.0 and -0.0 are different and
+    NaNs are equal to each other. Code objects and unhashable objects are keyed by identity.
+
+    """
+    if isinstance(obj, (float, complex)):
+        return type(obj), repr(obj)
+    elif isinstance(obj, tuple):
+        return tuple, tuple(map(const_key, obj))
+    elif isinstance(obj, frozenset):
+        return frozenset, frozenset(map(const_key, obj))
+    elif isinstance(obj, types.CodeType):
+        return type(obj), id(obj)
+    try:
+        hash(obj)
+    except TypeError:
+        return type(obj), id(obj)
+    return type(obj), obj
+
+
 # Stack size calculation
 # Based heavily on CPython's code in compile.c (functions stackdepth, stackdepth_walk, and
 # opcode_stack_effect).
@@ -402,26 +495,30 @@ def opcode_stack_effect(instr):
         return func(instr)
 
 
-Block = namedtuple('Block', ['begin_idx'])
+def compute_stacksize(ba, precise=False):
+    """Computes co_stacksize for a ByteAround object.
 
+    By default, this follows CPython's stackdepth() in compile.c, so that code objects round-trip
+    exactly. That computation is conservative: it assumes that loops have no net effect and makes
+    room for an exception at every jump into a try block's handler. If precise is True, the exact
+    maximum depth is computed instead (see _compute_precise_stacksize), which is often smaller for
+    heavily transformed code. Precise mode models the Python 2 block stack, so on Python 3 the
+    conservative computation is always used.
 
-def compute_stacksize(ba):
+    """
+    if precise and sys.version_info < (3, 0):
+        return _compute_precise_stacksize(ba)
     # first divide the code into blocks
     # every label starts a block and every instruction in hasjabs or hasjrel ends one
+    # blocks are identified by the index of their first instruction
     label_to_block = {}
-    idx_to_block = {}
-    begin_block = Block(0)
-    idx_to_block[0] = begin_block
+    begin_block = 0
     block_to_stack_effect = {}
     seen_blocks = set()
 
     for i, instr in enumerate(ba.instructions):
         if isinstance(instr, ops.Label):
-            block = Block(i)
-            label_to_block[instr] = block
-            idx_to_block[i] = block
-        elif instr.is_jump():
-            idx_to_block[i + 1] = Block(i + 1)
+            label_to_block[instr] = i
 
     def cached_stack_effect_of_block(block):
         if block in block_to_stack_effect:
@@ -439,7 +536,7 @@ def compute_stacksize(ba):
         depth = 0
         max_depth = 0
 
-        for i, instr in islice(enumerate(ba.instructions), block.begin_idx, None):
+        for i, instr in islice(enumerate(ba.instructions), block, None):
             if isinstance(instr, ops.Label):
                 continue
             depth += opcode_stack_effect(instr)
@@ -477,7 +574,7 @@ def compute_stacksize(ba):
                     else:
                         continuation_depth_delta = 0
 
-                    continuation_block = idx_to_block[i + 1]
+                    continuation_block = i + 1
                     continuation_depth = continuation_depth_delta + \
                         cached_stack_effect_of_block(continuation_block)
                     target_depth = max(continuation_depth, target_depth)
@@ -485,3 +582,157 @@ def compute_stacksize(ba):
                 return max(max_depth, depth + target_depth)
         return max_depth
     return stack_effect_of_block(begin_block)
+
+
+# Kinds of entries on the block stack simulated by _compute_precise_stacksize. Each entry is a
+# (kind, level) pair, where level is the stack depth once the block has been left.
+_LOOP_BLOCK = 'loop'
+_EXCEPT_BLOCK = 'except'
+_FINALLY_BLOCK = 'finally'  # also used for SETUP_WITH
+# Python 2 does not put exception handlers on the block stack, but tracking them lets us know
+# where the stack goes after END_FINALLY. The handler of an except block ends when the exception is
+# popped off the stack; the handler of a finally or with block ends at END_FINALLY.
+_EXCEPT_HANDLER = 'except handler'
+_FINALLY_HANDLER = 'finally handler'
+
+# entering an exception handler pushes the traceback, value and type
+_EXCEPTION_DEPTH = 3
+
+
+def _compute_precise_stacksize(ba):
+    """Computes the maximum stack depth by finding the depth and block stack at every instruction.
+
+    This is a fixed-point computation over the control flow graph. Code can only reach an
+    instruction with one block stack and, except at the start of exception handlers (which are
+    also reached by the normal path into a finally block), with one stack depth. Raises
+    ValueError if these checks fail or the stack underflows.
+
+    """
+    instructions = ba.instructions
+    if not instructions:
+        return 0
+    label_to_index = {}
+    for i, instr in enumerate(instructions):
+        if isinstance(instr, ops.Label):
+            label_to_index[instr] = i
+    handlers = set(label_to_index[instr.oparg] for instr in instructions
+                   if isinstance(instr, (ops.SETUP_EXCEPT, ops.SETUP_FINALLY, ops.SETUP_WITH)))
+
+    states = [None] * len(instructions)  # (depth, block stack) at the start of each instruction
+    states[0] = (0, ())
+    max_depth = 0
+    worklist = [0]
+    handler_updates = {}
+    while worklist:
+        i = worklist.pop()
+        depth, blocks = states[i]
+        for successor, (new_depth, new_blocks) in _precise_successors(ba, i, depth, blocks,
+                                                                      label_to_index):
+            if new_depth < 0:
+                raise ValueError('stack underflow after instruction %d (%s)' % (i, instructions[i]))
+            if successor >= len(instructions):
+                raise ValueError('execution continues past the end of the code')
+            # leave exception handlers once the exception has been popped
+            while new_blocks and new_blocks[-1][0] == _EXCEPT_HANDLER and \
+                    new_depth <= new_blocks[-1][1]:
+                new_blocks = new_blocks[:-1]
+            max_depth = max(max_depth, new_depth)
+            existing = states[successor]
+            if existing is None:
+                states[successor] = (new_depth, new_blocks)
+                worklist.append(successor)
+                continue
+            existing_depth, existing_blocks = existing
+            if existing_blocks != new_blocks:
+                raise ValueError('inconsistent block stack at instruction %d: %s and %s' % (
+                    successor, existing_blocks, new_blocks))
+            if existing_depth == new_depth:
+                continue
+            if successor not in handlers:
+                raise ValueError('inconsistent stack depth at instruction %d: %d and %d' % (
+                    successor, existing_depth, new_depth))
+            if new_depth > existing_depth:
+                handler_updates[successor] = handler_updates.get(successor, 0) + 1
+                if handler_updates[successor] > len(instructions):
+                    raise ValueError('stack depth at instruction %d grows without bound' % successor)
+                states[successor] = (new_depth, new_blocks)
+                worklist.append(successor)
+    return max_depth
+
+
+def _precise_successors(ba, i, depth, blocks, label_to_index):
+    """Returns a list of (index, (depth, block stack)) pairs for the successors of instruction i.
+
+    Exceptions are handled by an edge from each SETUP_* instruction to its handler and breaks by an
+    edge from SETUP_LOOP to the end of the loop, so that the depth at those targets does not
+    depend on where in the block the exception or break happens.
+
+    """
+    instr = ba.instructions[i]
+    following = i + 1
+    if isinstance(instr, ops.Label):
+        return [(following, (depth, blocks))]
+    elif isinstance(instr, (ops.RETURN_VALUE, ops.RAISE_VARARGS, ops.BREAK_LOOP)):
+        return []
+    elif isinstance(instr, ops.SETUP_LOOP):
+        return [
+            (following, (depth, blocks + ((_LOOP_BLOCK, depth),))),
+            (label_to_index[instr.oparg], (depth, blocks)),
+        ]
+    elif isinstance(instr, ops.SETUP_EXCEPT):
+        return [
+            (following, (depth, blocks + ((_EXCEPT_BLOCK, depth),))),
+            (label_to_index[instr.oparg],
+             (depth + _EXCEPTION_DEPTH, blocks + ((_EXCEPT_HANDLER, depth),))),
+        ]
+    elif isinstance(instr, (ops.SETUP_FINALLY, ops.SETUP_WITH)):
+        # SETUP_WITH replaces the context manager with its __exit__ method and pushes the result of
+        # __enter__; __exit__ is popped by WITH_CLEANUP
+        level = depth - 1 if isinstance(instr, ops.SETUP_WITH) else depth
+        following_depth = depth + 1 if isinstance(instr, ops.SETUP_WITH) else depth
+        return [
+            (following, (following_depth, blocks + ((_FINALLY_BLOCK, level),))),
+            (label_to_index[instr.oparg],
+             (depth + _EXCEPTION_DEPTH, blocks + ((_FINALLY_HANDLER, level),))),
+        ]
+    elif isinstance(instr, ops.POP_BLOCK):
+        if not blocks or blocks[-1][0] not in (_LOOP_BLOCK, _EXCEPT_BLOCK, _FINALLY_BLOCK):
+            raise ValueError('POP_BLOCK at instruction %d does not end a block' % i)
+        kind, level = blocks[-1]
+        blocks = blocks[:-1]
+        # the compiler follows POP_BLOCK for a finally block with LOAD_CONST None and the handler
+        if kind == _FINALLY_BLOCK:
+            blocks += ((_FINALLY_HANDLER, level),)
+        return [(following, (depth, blocks))]
+    elif isinstance(instr, ops.END_FINALLY):
+        if not blocks or blocks[-1][0] not in (_EXCEPT_HANDLER, _FINALLY_HANDLER):
+            raise ValueError('END_FINALLY at instruction %d is not in a handler' % i)
+        kind, level = blocks[-1]
+        if kind == _EXCEPT_HANDLER:
+            return []  # the exception is re-raised
+        # returns, breaks and continues are handled by the edges for RETURN_VALUE, SETUP_LOOP and
+        # CONTINUE_LOOP
+        return [(following, (level, blocks[:-1]))]
+    elif isinstance(instr, ops.CONTINUE_LOOP):
+        loop_indexes = [index for index, (kind, _) in enumerate(blocks) if kind == _LOOP_BLOCK]
+        if not loop_indexes:
+            raise ValueError('CONTINUE_LOOP at instruction %d is not in a loop' % i)
+        loop_index = loop_indexes[-1]
+        # the blocks inside the loop are unwound, restoring the stack depth of the outermost one
+        unwound = blocks[loop_index + 1:]
+        target_depth = unwound[0][1] if unwound else depth
+        return [(label_to_index[instr.oparg], (target_depth, blocks[:loop_index + 1]))]
+
+    new_depth = depth + opcode_stack_effect(instr)
+    if not instr.is_jump():
+        return [(following, (new_depth, blocks))]
+    target = label_to_index[instr.oparg]
+    if isinstance(instr, (ops.JUMP_ABSOLUTE, ops.JUMP_FORWARD)):
+        return [(target, (new_depth, blocks))]
+    elif isinstance(instr, (ops.JUMP_IF_TRUE_OR_POP, ops.JUMP_IF_FALSE_OR_POP)):
+        return [(following, (new_depth - 1, blocks)), (target, (new_depth, blocks))]
+    elif isinstance(instr, ops.FOR_ITER):
+        # when the iterator is exhausted, it is popped instead of pushing the next value
+        return [(following, (new_depth, blocks)), (target, (new_depth - 2, blocks))]
+    else:
+        return [(following, (new_depth, blocks)), (target, (new_depth, blocks))]
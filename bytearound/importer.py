@@ -0,0 +1,161 @@
+"""
+
+PEP 302 import hook that applies a transform to imported modules.
+
+The transformed code is saved in a side file next to the source (module.bytearound.pyc), which
+is keyed by the source file's mtime and size and by a transform version tag. Later imports load
+the saved code directly without going through ByteAround.
+
+Usage:
+
+    importer = install(my_transform, version='my-transform-1', modules=['mypackage'])
+    import mypackage.module
+    uninstall(importer)
+
+"""
+import imp
+import marshal
+import os
+import struct
+import sys
+
+from . import transform
+
+_CACHE_SUFFIX = '.bytearound.pyc'
+_HEADER = struct.Struct('<IIH')  # source mtime, source size, length of the version tag
+
+
+def install(fn, version='', modules=None):
+    """Installs an import hook that applies fn to modules imported from source.
+
+    If modules is given, it is a list of module names and only these modules and their submodules
+    are transformed. Returns the importer object, which can be passed to uninstall().
+
+    """
+    importer = TransformingImporter(fn, version=version, modules=modules)
+    sys.meta_path.insert(0, importer)
+    return importer
+
+
+def uninstall(importer):
+    """Removes an import hook previously installed with install()."""
+    sys.meta_path.remove(importer)
+
+
+class TransformingImporter(object):
+    """Finder that returns a TransformingLoader for modules with Python source files."""
+    def __init__(self, fn, version='', modules=None):
+        self.fn = fn
+        self.version = version
+        self.modules = None if modules is None else tuple(modules)
+
+    def find_module(self, fullname, path=None):
+        if not self._should_transform(fullname):
+            return None
+        name = fullname.rpartition('.')[2]
+        try:
+            f, pathname, (_, _, kind) = imp.find_module(name, path)
+        except ImportError:
+            return None
+        if f is not None:
+            f.close()
+        if kind == imp.PY_SOURCE:
+            return TransformingLoader(self, fullname, pathname, is_package=False)
+        elif kind == imp.PKG_DIRECTORY:
+            init_path = os.path.join(pathname, '__init__.py')
+            if os.path.exists(init_path):
+                return TransformingLoader(self, fullname, init_path, is_package=True)
+        return None
+
+    def _should_transform(self, fullname):
+        if self.modules is None:
+            return True
+        return any(fullname == module or fullname.startswith(module + '.')
+                   for module in self.modules)
+
+
+class TransformingLoader(object):
+    """Loader for a single module that applies the importer's transform to its code."""
+    def __init__(self, importer, fullname, path, is_package):
+        self.importer = importer
+        self.fullname = fullname
+        self.path = path
+        self._is_package = is_package
+
+    def load_module(self, fullname):
+        code = self.get_code(fullname)
+        is_reload = fullname in sys.modules
+        module = sys.modules.setdefault(fullname, imp.new_module(fullname))
+        module.__file__ = self.path
+        module.__loader__ = self
+        if self._is_package:
+            module.__path__ = [os.path.dirname(self.path)]
+            module.__package__ = fullname
+        else:
+            module.__package__ = fullname.rpartition('.')[0]
+        try:
+            exec(code, module.__dict__)
+        except BaseException:
+            if not is_reload:
+                del sys.modules[fullname]
+            raise
+        return sys.modules[fullname]
+
+    def is_package(self, fullname):
+        return self._is_package
+
+    def get_filename(self, fullname):
+        return self.path
+
+    def get_source(self, fullname):
+        with open(self.path, 'rU') as f:
+            return f.read()
+
+    def get_code(self, fullname):
+        """Returns the transformed code for the module, using the side .pyc if it is valid."""
+        st = os.stat(self.path)
+        cache_path = get_cache_path(self.path)
+        code = _read_cache(cache_path, st, self.importer.version)
+        if code is None:
+            co = compile(self.get_source(fullname), self.path, 'exec', dont_inherit=True)
+            code = transform.transform_code(co, self.importer.fn)
+            _write_cache(cache_path, code, st, self.importer.version)
+        return code
+
+
+def get_cache_path(source_path):
+    """Returns the path of the side .pyc file for a source file."""
+    return os.path.splitext(source_path)[0] + _CACHE_SUFFIX
+
+
+def _make_header(st, version):
+    return imp.get_magic() + _HEADER.pack(int(st.st_mtime) & 0xFFFFFFFF,
+                                          st.st_size & 0xFFFFFFFF, len(version)) + version
+
+
+def _read_cache(cache_path, st, version):
+    """Returns the code object stored in cache_path, or None if it is missing or stale."""
+    header = _make_header(st, version)
+    try:
+        with open(cache_path, 'rb') as f:
+            if f.read(len(header)) != header:
+                return None
+            return marshal.load(f)
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+
+
+def _write_cache(cache_path, code, st, version):
+    # write to a temporary file and rename it, so that other processes never see a partial file
+    tmp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(_make_header(st, version))
+            marshal.dump(code, f)
+        os.rename(tmp_path, cache_path)
+    except (IOError, OSError):
+        # like the regular import system, silently continue if the cache cannot be written
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
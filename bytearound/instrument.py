@@ -0,0 +1,165 @@
+"""
+
+Opt-in instrumentation for ByteAround.from_code and ByteAround.to_code.
+
+When instrumentation is enabled, each from_code and to_code call produces a CallRecord containing
+the time spent in each phase and counters such as the number of instructions. Records are passed
+to all registered listeners. When no listener is registered, instrumented code only pays for a
+single check that returns None.
+
+Usage:
+
+    with instrument.collect() as stats:
+        f.__code__ = ByteAround.from_code(f.__code__).to_code()
+    print(stats.report())
+
+"""
+import contextlib
+import time
+
+_listeners = []
+
+
+def add_listener(listener):
+    """Registers a callable that is called with a CallRecord after each instrumented call."""
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    """Removes a listener previously registered with add_listener()."""
+    _listeners.remove(listener)
+
+
+def is_enabled():
+    return bool(_listeners)
+
+
+def new_record(kind, name=None):
+    """Returns a CallRecord for a new call, or None if instrumentation is disabled."""
+    if not _listeners:
+        return None
+    return CallRecord(kind, name)
+
+
+def record_event(kind, counter, name=None):
+    """Records a single event that is not part of a timed call, such as a cache hit."""
+    if _listeners:
+        record = CallRecord(kind, name)
+        record.count(counter)
+        record.finish()
+
+
+@contextlib.contextmanager
+def collect():
+    """Context manager that aggregates all records created within it into a Stats object."""
+    stats = Stats()
+    add_listener(stats)
+    try:
+        yield stats
+    finally:
+        remove_listener(stats)
+
+
+class CallRecord(object):
+    """Information about a single instrumented call.
+
+    kind is the kind of call (e.g. "to_code") and name is the name of the code object. phases is a
+    dictionary of {phase name: seconds} and phase_order lists the phases in the order they were
+    first entered. Some phases (like "operands" in to_code) are nested inside other phases, so
+    their times overlap. counters is a dictionary of {counter name: value}.
+
+    """
+    def __init__(self, kind, name=None):
+        self.kind = kind
+        self.name = name
+        self.phases = {}
+        self.phase_order = []
+        self.counters = {}
+        self.total = None
+        self._start = time.time()
+        self._phase = None
+        self._phase_start = None
+
+    def start_phase(self, phase):
+        """Ends the current phase (if any) and starts a new one."""
+        now = time.time()
+        self._end_phase(now)
+        self._phase = phase
+        self._phase_start = now
+
+    def add_time(self, phase, seconds):
+        if phase not in self.phases:
+            self.phases[phase] = 0.0
+            self.phase_order.append(phase)
+        self.phases[phase] += seconds
+
+    def timed(self, phase, fn):
+        """Returns a wrapper around fn that adds the time spent in it to the given phase."""
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add_time(phase, time.time() - start)
+        return wrapper
+
+    def count(self, counter, value=1):
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def finish(self):
+        """Ends the call and passes the record to all listeners."""
+        now = time.time()
+        self._end_phase(now)
+        self.total = now - self._start
+        for listener in list(_listeners):
+            listener(self)
+
+    def _end_phase(self, now):
+        if self._phase is not None:
+            self.add_time(self._phase, now - self._phase_start)
+            self._phase = None
+
+    def __repr__(self):
+        return 'CallRecord(%r, %r, total=%r, phases=%r, counters=%r)' % (
+            self.kind, self.name, self.total, self.phases, self.counters)
+
+
+class Stats(object):
+    """Listener that aggregates CallRecords.
+
+    calls is a dictionary of {kind: number of calls}, total_time of {kind: seconds}, phases of
+    {(kind, phase): seconds} and counters of {(kind, counter): value}.
+
+    """
+    def __init__(self):
+        self.calls = {}
+        self.total_time = {}
+        self.phases = {}
+        self.counters = {}
+        self._phase_order = []
+
+    def __call__(self, record):
+        self.calls[record.kind] = self.calls.get(record.kind, 0) + 1
+        self.total_time[record.kind] = self.total_time.get(record.kind, 0.0) + record.total
+        for phase in record.phase_order:
+            key = (record.kind, phase)
+            if key not in self.phases:
+                self.phases[key] = 0.0
+                self._phase_order.append(key)
+            self.phases[key] += record.phases[phase]
+        for counter, value in record.counters.items():
+            key = (record.kind, counter)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def report(self):
+        """Returns a human-readable summary of the collected data."""
+        lines = []
+        for kind in sorted(self.calls):
+            lines.append('%s: %d calls, %.6fs' % (kind, self.calls[kind], self.total_time[kind]))
+            for key in self._phase_order:
+                if key[0] == kind:
+                    lines.append('    %-20s %.6fs' % (key[1], self.phases[key]))
+            for key in sorted(self.counters):
+                if key[0] == kind:
+                    lines.append('    %-20s %d' % (key[1], self.counters[key]))
+        return '\n'.join(lines)
@@ -0,0 +1,104 @@
+"""
+
+Sharing of equal constants and names between code objects.
+
+Every call to ByteAround.to_code() builds a new co_consts tuple, so a process that creates many
+code objects keeps many equal strings, numbers and tuples alive. An InternPool maps each of these
+values to a single canonical object; passing the same pool to every to_code() call in a batch makes
+the resulting code objects share them, and code objects with equal constants share the co_consts
+tuple itself.
+
+Names (co_names, co_varnames and so on) are not handled here: the code object constructor copies
+those tuples and interns the strings in them, so they are already shared. CPython only interns
+string constants that look like identifiers.
+
+Usage:
+
+    pool = InternPool()
+    for fn in functions:
+        fn.__code__ = ByteAround.from_code(fn.__code__).to_code(pool=pool)
+    print(pool.report())
+
+"""
+import sys
+
+from . import generator
+
+_INTERNABLE_TYPES = frozenset([int, long, float, complex, str, unicode, bool, type(None)])
+
+
+class InternPool(object):
+    """Maps equal constants to a single canonical object.
+
+    Objects are considered equal if they have the same generator.const_key(), so 1 and 1.0 or 0.0
+    and -0.0 are kept apart. Only strings, numbers and tuples and frozensets of such objects are
+    interned; other objects are returned unchanged.
+
+    The pool keeps all canonical objects alive, so it should be discarded (or cleared) when the
+    batch of code objects it is used for has been created.
+
+    """
+    def __init__(self):
+        self._objects = {}  # const_key -> canonical object
+        self.lookups = 0
+        self.hits = 0
+        # estimated number of bytes used by duplicates that were replaced with canonical objects
+        self.bytes_saved = 0
+
+    def canonical(self, obj):
+        """Returns the canonical object that is equal to obj, adding obj to the pool if needed."""
+        if not _is_internable(obj):
+            return obj
+        self.lookups += 1
+        key = generator.const_key(obj)
+        try:
+            existing = self._objects[key]
+        except KeyError:
+            pass
+        else:
+            if existing is not obj:
+                self.hits += 1
+                self.bytes_saved += _deep_sizeof(obj)
+            return existing
+        if isinstance(obj, (tuple, frozenset)):
+            elements = [self.canonical(elt) for elt in obj]
+            if any(new is not old for new, old in zip(elements, obj)):
+                obj = type(obj)(elements)
+        self._objects[key] = obj
+        return obj
+
+    def canonical_tuple(self, objs):
+        """Returns a canonical tuple containing the canonical versions of the objects in objs.
+
+        Objects that cannot be interned (such as code objects) are kept as they are, but in that
+        case the tuple itself is not shared.
+
+        """
+        return self.canonical(tuple(self.canonical(obj) for obj in objs))
+
+    def clear(self):
+        self._objects.clear()
+
+    def __len__(self):
+        return len(self._objects)
+
+    def report(self):
+        """Returns a human-readable summary of the pool's effect."""
+        return '%d objects in pool, %d of %d lookups found a duplicate, ~%d bytes saved' % (
+            len(self._objects), self.hits, self.lookups, self.bytes_saved)
+
+
+def _is_internable(obj):
+    if type(obj) in _INTERNABLE_TYPES:
+        return True
+    elif type(obj) in (tuple, frozenset):
+        return all(_is_internable(elt) for elt in obj)
+    else:
+        return False
+
+
+def _deep_sizeof(obj):
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (tuple, frozenset)):
+        size += sum(_deep_sizeof(elt) for elt in obj)
+    return size
@@ -0,0 +1,379 @@
+"""
+
+Optimization passes for ByteAround objects.
+
+Each pass is a transform (see bytearound.transform): it modifies a ByteAround object in place and
+returns it. CPython's peephole optimizer already performs similar optimizations when it compiles
+source code, so these passes are mostly useful on code that has been changed by other transforms,
+for example after specialize.py replaces arguments with constants.
+
+"""
+import itertools
+import opcode
+import operator
+
+from . import blocks
+from . import dataflow
+from . import ops
+
+# results that are longer than this are not folded, so that code objects do not contain huge
+# constants (CPython's peephole optimizer uses the same limit)
+_MAX_SEQUENCE_LENGTH = 20
+_MAX_INT_BITS = 128
+_CONSTANT_TYPES = frozenset([int, long, float, complex, bool, str, unicode, type(None)])
+
+_UNARY_OPERATORS = {
+    ops.UNARY_NOT.opcode: operator.not_,
+    ops.UNARY_NEGATIVE.opcode: operator.neg,
+    ops.UNARY_POSITIVE.opcode: operator.pos,
+    ops.UNARY_INVERT.opcode: operator.invert,
+}
+# BINARY_DIVIDE is not folded because its behavior depends on the -Q command line option
+_BINARY_OPERATORS = {
+    ops.BINARY_ADD.opcode: operator.add,
+    ops.BINARY_SUBTRACT.opcode: operator.sub,
+    ops.BINARY_MULTIPLY.opcode: operator.mul,
+    ops.BINARY_FLOOR_DIVIDE.opcode: operator.floordiv,
+    ops.BINARY_TRUE_DIVIDE.opcode: operator.truediv,
+    ops.BINARY_MODULO.opcode: operator.mod,
+    ops.BINARY_POWER.opcode: operator.pow,
+    ops.BINARY_SUBSCR.opcode: operator.getitem,
+    ops.BINARY_LSHIFT.opcode: operator.lshift,
+    ops.BINARY_RSHIFT.opcode: operator.rshift,
+    ops.BINARY_AND.opcode: operator.and_,
+    ops.BINARY_OR.opcode: operator.or_,
+    ops.BINARY_XOR.opcode: operator.xor,
+}
+# identity comparisons are not folded, because whether two equal constants are the same object
+# is an implementation detail
+_COMPARISONS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda left, right: left in right,
+    'not in': lambda left, right: left not in right,
+}
+# {opcode: whether the instruction jumps if the value on top of the stack is true}
+_CONDITIONAL_JUMPS = {
+    ops.POP_JUMP_IF_TRUE.opcode: True,
+    ops.POP_JUMP_IF_FALSE.opcode: False,
+}
+_JUMP_OR_POP = {
+    ops.JUMP_IF_TRUE_OR_POP.opcode: True,
+    ops.JUMP_IF_FALSE_OR_POP.opcode: False,
+}
+_UNCONDITIONAL_JUMPS = frozenset([ops.JUMP_ABSOLUTE.opcode, ops.JUMP_FORWARD.opcode])
+
+_CO_OPTIMIZED = 0x1
+# prefix of the names of the locals created by eliminate_common_loads
+_CSE_PREFIX = '.cse'
+# instructions that can start a chain of loads
+_CHAIN_BASES = frozenset([ops.LOAD_FAST.opcode, ops.LOAD_DEREF.opcode, ops.LOAD_GLOBAL.opcode])
+# {store or delete opcode: opcode of the load whose value it changes}; these only invalidate
+# chains that start with a load of the same name
+_NAME_STORES = {
+    ops.STORE_FAST.opcode: ops.LOAD_FAST.opcode,
+    ops.DELETE_FAST.opcode: ops.LOAD_FAST.opcode,
+    ops.STORE_DEREF.opcode: ops.LOAD_DEREF.opcode,
+    ops.STORE_GLOBAL.opcode: ops.LOAD_GLOBAL.opcode,
+    ops.DELETE_GLOBAL.opcode: ops.LOAD_GLOBAL.opcode,
+}
+# instructions that cannot run arbitrary Python code (assuming that attribute lookups have no side
+# effects, which eliminate_common_loads relies on anyway)
+_PURE_OPCODES = frozenset([
+    ops.NOP.opcode,
+    ops.LOAD_FAST.opcode,
+    ops.LOAD_CONST.opcode,
+    ops.LOAD_DEREF.opcode,
+    ops.LOAD_GLOBAL.opcode,
+    ops.LOAD_ATTR.opcode,
+    ops.LOAD_CLOSURE.opcode,
+    ops.DUP_TOP.opcode,
+    ops.DUP_TOPX.opcode,
+    ops.ROT_TWO.opcode,
+    ops.ROT_THREE.opcode,
+    ops.ROT_FOUR.opcode,
+    ops.BUILD_TUPLE.opcode,
+    ops.BUILD_LIST.opcode,
+])
+# the default for the invalidating argument to eliminate_common_loads: everything that is not
+# known to be pure, including calls, stores, deletions and operators that may call special methods
+INVALIDATING_OPCODES = frozenset(opcode.opmap.values()) - _PURE_OPCODES
+
+
+def fold_constants(ba):
+    """Evaluates operations on constants and jumps that depend only on a constant.
+
+    Unary and binary operations, comparisons and BUILD_TUPLE whose operands are all loaded by
+    LOAD_CONST instructions directly before them (within the same basic block) are replaced by a
+    single LOAD_CONST. Only operations on immutable builtin types are folded, and operations that
+    raise an exception are left alone so that the exception still happens at runtime.
+
+    Conditional jumps on a constant become either an unconditional jump or nothing. The code that
+    can no longer be reached is left in place; use remove_dead_code to remove it.
+
+    """
+    result = []
+    for instr in ba.instructions:
+        if isinstance(instr, ops.Label):
+            result.append(instr)
+            continue
+        op = instr.opcode
+        if op in _UNARY_OPERATORS:
+            folded = _fold(result, 1, _UNARY_OPERATORS[op])
+        elif op in _BINARY_OPERATORS:
+            folded = _fold(result, 2, _BINARY_OPERATORS[op])
+        elif op == ops.COMPARE_OP.opcode and opcode.cmp_op[instr.oparg] in _COMPARISONS:
+            folded = _fold(result, 2, _COMPARISONS[opcode.cmp_op[instr.oparg]])
+        elif op == ops.BUILD_TUPLE.opcode:
+            folded = _fold(result, instr.oparg, lambda *args: args, lineno=instr.lineno)
+        elif op in _CONDITIONAL_JUMPS and _is_constant_load(result, 1):
+            if bool(result.pop().oparg) == _CONDITIONAL_JUMPS[op]:
+                result.append(ops.JUMP_ABSOLUTE(instr.oparg, instr.lineno))
+            folded = True
+        elif op in _JUMP_OR_POP and _is_constant_load(result, 1):
+            if bool(result[-1].oparg) == _JUMP_OR_POP[op]:
+                # the value stays on the stack if the jump is taken
+                result.append(ops.JUMP_ABSOLUTE(instr.oparg, instr.lineno))
+            else:
+                result.pop()
+            folded = True
+        else:
+            folded = False
+        if not folded:
+            result.append(instr)
+    ba.instructions = result
+    return ba
+
+
+def remove_dead_code(ba):
+    """Removes basic blocks that can never be executed and jumps to the next instruction."""
+    code_blocks = blocks.split_blocks(ba.instructions)
+    reachable = blocks.find_reachable(code_blocks)
+    instructions = []
+    for block in code_blocks:
+        if block.index in reachable:
+            instructions += block.labels
+            instructions += block.instructions
+
+    result = []
+    for i, instr in enumerate(instructions):
+        if not isinstance(instr, ops.Label) and instr.is_jump() and \
+                _jumps_to_next_instruction(instructions, i):
+            if instr.opcode in _UNCONDITIONAL_JUMPS:
+                continue
+            elif instr.opcode in _CONDITIONAL_JUMPS:
+                result.append(ops.POP_TOP(None, instr.lineno))
+                continue
+        result.append(instr)
+    ba.instructions = result
+    return ba
+
+
+def remove_loop_blocks(ba):
+    """Removes the SETUP_LOOP and POP_BLOCK instructions of loops that do not use their block.
+
+    The block pushed by SETUP_LOOP is only needed by BREAK_LOOP and CONTINUE_LOOP instructions for
+    which the loop is the innermost one; exceptions and returns unwind the block stack whether or
+    not it contains the loop. For loops without such instructions, SETUP_LOOP and the POP_BLOCK
+    instructions that pop its block are removed. Labels pointing to the removed instructions are
+    kept, so that they now point to the instruction that follows.
+
+    """
+    cfg = dataflow.ControlFlowGraph(ba.instructions)
+    label_map = blocks.get_label_map(cfg.blocks)
+    # loops are identified by the index of the block that their SETUP_LOOP jumps to
+    setups = {}  # {loop: indexes of SETUP_LOOP instructions}
+    pops = {}  # {loop: indexes of POP_BLOCK instructions that pop its block}
+    used = set()
+    for index, instr, stack in cfg.instruction_stacks():
+        if isinstance(instr, ops.SETUP_LOOP):
+            setups.setdefault(label_map[instr.oparg], []).append(index)
+        elif isinstance(instr, ops.POP_BLOCK):
+            if stack and stack[-1][0] == ops.SETUP_LOOP.opcode:
+                pops.setdefault(stack[-1][1], []).append(index)
+        elif isinstance(instr, (ops.BREAK_LOOP, ops.CONTINUE_LOOP)):
+            loops = [loop for op, loop in stack if op == ops.SETUP_LOOP.opcode]
+            if loops:
+                used.add(loops[-1])
+            else:
+                return ba  # invalid code, leave it alone
+
+    to_remove = set()
+    for loop, indexes in setups.items():
+        # several SETUP_LOOPs with the same target cannot be told apart, so they are kept
+        if loop not in used and len(indexes) == 1:
+            to_remove.update(indexes)
+            to_remove.update(pops.get(loop, ()))
+    if to_remove:
+        ba.instructions = [instr for i, instr in enumerate(ba.instructions) if i not in to_remove]
+    return ba
+
+
+def eliminate_common_loads(ba, invalidating=INVALIDATING_OPCODES):
+    """Computes repeated chains of attribute loads within a basic block only once.
+
+    A chain is a LOAD_FAST, LOAD_DEREF or LOAD_GLOBAL followed by one or more LOAD_ATTRs, like
+    self.config.value. When the same chain (or a prefix of it) occurs more than once in a block,
+    the first occurrence stores the value in a new local variable (named .cse0, .cse1 and so on)
+    and later occurrences load that local instead.
+
+    This assumes that attribute lookups have no side effects and that their results only change
+    when an invalidating instruction runs. invalidating is a collection of opcodes; by default it
+    includes every instruction that may run arbitrary Python code. Stores and deletions of a
+    local, cell or global variable invalidate the chains that start with that variable, whether or
+    not they are in invalidating, and no other chains; all other invalidating instructions
+    invalidate every chain.
+
+    Only applies to functions, because other code objects do not use fast locals.
+
+    """
+    if not ba.flags & _CO_OPTIMIZED:
+        return ba
+    temp_names = ('%s%d' % (_CSE_PREFIX, i) for i in itertools.count(_next_temp_index(ba)))
+    result = []
+    for block in blocks.split_blocks(ba.instructions):
+        result += block.labels
+        result += _eliminate_common_loads_in_block(block.instructions, invalidating, temp_names)
+    ba.instructions = result
+    return ba
+
+
+def _eliminate_common_loads_in_block(instructions, invalidating, temp_names):
+    # find all chains as (start, end, keys), where keys identifies the value of each prefix of the
+    # chain with at least one LOAD_ATTR
+    chains = []
+    generation = 0  # incremented by instructions that invalidate all chains
+    versions = {}  # {(load opcode, name): number of stores to the name}
+    i = 0
+    while i < len(instructions):
+        instr = instructions[i]
+        if instr.opcode in _CHAIN_BASES:
+            end = i + 1
+            while end < len(instructions) and isinstance(instructions[end], ops.LOAD_ATTR):
+                end += 1
+            if end > i + 1:
+                base = instr.opcode, instr.oparg
+                key = (generation, base, versions.get(base, 0))
+                keys = []
+                for attr in instructions[i + 1:end]:
+                    key += (attr.oparg,)
+                    keys.append(key)
+                chains.append((i, end, keys))
+                i = end
+                continue
+        elif instr.opcode in _NAME_STORES:
+            # a new value of the base always invalidates its chains, whatever invalidating says
+            base = _NAME_STORES[instr.opcode], instr.oparg
+            versions[base] = versions.get(base, 0) + 1
+        elif instr.opcode in invalidating:
+            generation += 1
+        i += 1
+
+    # each chain reuses the longest prefix that occurs more than once
+    counts = {}
+    for _, _, keys in chains:
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+    chosen = []
+    for _, _, keys in chains:
+        length = 0
+        for j, key in enumerate(keys):
+            if counts[key] > 1:
+                length = j + 1
+        chosen.append(length)
+    # a prefix may occur more than once but be chosen only once, because the other chains use a
+    # longer prefix
+    chosen_counts = {}
+    for (_, _, keys), length in zip(chains, chosen):
+        if length:
+            chosen_counts[keys[length - 1]] = chosen_counts.get(keys[length - 1], 0) + 1
+
+    result = []
+    position = 0
+    temps = {}  # {key: name of the local holding its value}
+    for (start, end, keys), length in zip(chains, chosen):
+        if not length or chosen_counts[keys[length - 1]] < 2:
+            continue
+        result += instructions[position:start]
+        key = keys[length - 1]
+        prefix_end = start + 1 + length
+        if key in temps:
+            result.append(ops.LOAD_FAST(temps[key], instructions[start].lineno))
+        else:
+            temps[key] = name = next(temp_names)
+            lineno = instructions[prefix_end - 1].lineno
+            result += instructions[start:prefix_end]
+            result += [ops.DUP_TOP(None, lineno), ops.STORE_FAST(name, lineno)]
+        result += instructions[prefix_end:end]
+        position = end
+    result += instructions[position:]
+    return result
+
+
+def _next_temp_index(ba):
+    """Returns the smallest number that is not used in the name of an existing temporary local."""
+    index = 0
+    for instr in ba.instructions:
+        if isinstance(instr, (ops.LOAD_FAST, ops.STORE_FAST)) and \
+                instr.oparg.startswith(_CSE_PREFIX):
+            suffix = instr.oparg[len(_CSE_PREFIX):]
+            if suffix.isdigit():
+                index = max(index, int(suffix) + 1)
+    return index
+
+
+def _is_constant_load(instructions, count):
+    """Whether the last count instructions are LOAD_CONSTs of immutable builtin objects."""
+    if len(instructions) < count:
+        return False
+    return all(isinstance(instr, ops.LOAD_CONST) and _is_constant(instr.oparg)
+               for instr in instructions[len(instructions) - count:])
+
+
+def _is_constant(obj):
+    if type(obj) in _CONSTANT_TYPES:
+        return True
+    elif type(obj) in (tuple, frozenset):
+        return all(_is_constant(elt) for elt in obj)
+    else:
+        return False
+
+
+def _fold(instructions, count, fn, lineno=None):
+    """Replaces the last count LOAD_CONSTs in instructions with the result of fn, if possible.
+
+    Returns whether the operation was folded.
+
+    """
+    if not _is_constant_load(instructions, count):
+        return False
+    operands = instructions[len(instructions) - count:]
+    try:
+        value = fn(*[instr.oparg for instr in operands])
+    except Exception:
+        return False
+    if not _is_constant(value):
+        return False
+    if isinstance(value, (str, unicode, tuple, frozenset)) and len(value) > _MAX_SEQUENCE_LENGTH:
+        return False
+    if isinstance(value, (int, long)) and value.bit_length() > _MAX_INT_BITS:
+        return False
+    if operands:
+        lineno = operands[0].lineno
+    del instructions[len(instructions) - count:]
+    instructions.append(ops.LOAD_CONST(value, lineno))
+    return True
+
+
+def _jumps_to_next_instruction(instructions, index):
+    target = instructions[index].oparg
+    for instr in instructions[index + 1:]:
+        if not isinstance(instr, ops.Label):
+            return False
+        if instr is target:
+            return True
+    return False
@@ -0,0 +1,222 @@
+"""
+
+Searching for and replacing sequences of instructions.
+
+A pattern is a list of elements that each match a single instruction:
+- an Instruction object matches instructions with the same opcode and an equal argument; the
+  argument may be ANY to match any argument or a Predicate to test it
+- an Instruction subclass (e.g. ops.LOAD_FAST) matches any instruction with that opcode
+- ANY_INSTRUCTION matches any instruction that is not a Label
+
+Searches use an index of {opcode: positions} that is stored on the ByteAround object and kept up to
+date by ByteAround.__setitem__, so only the positions of the rarest opcode in the pattern need to
+be checked. The index is rebuilt if ba.instructions has been changed in some other way.
+
+Usage:
+
+    pattern = Pattern([ops.LOAD_GLOBAL('len'), ops.LOAD_FAST(ANY), ops.CALL_FUNCTION(1)])
+    for match in search(ba, pattern):
+        print(match.start, match.instructions)
+
+"""
+from bisect import bisect_left, insort
+from collections import namedtuple
+import opcode
+from operator import attrgetter
+
+from . import generator
+from . import ops
+
+
+class _Any(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+# matches any argument
+ANY = _Any('ANY')
+# matches any instruction
+ANY_INSTRUCTION = _Any('ANY_INSTRUCTION')
+
+
+class Predicate(object):
+    """Matches instruction arguments for which fn returns True."""
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __call__(self, oparg):
+        return self.fn(oparg)
+
+    def __repr__(self):
+        return 'Predicate(%r)' % self.fn
+
+
+_get_opcode = attrgetter('opcode')
+
+# start and end (exclusive) of the match in the instruction list and the matched instructions
+Match = namedtuple('Match', ['start', 'end', 'instructions'])
+
+
+class Pattern(object):
+    """A sequence of elements that each match a single instruction."""
+    def __init__(self, elements):
+        if not elements:
+            raise ValueError('patterns must contain at least one element')
+        self.elements = list(elements)
+        self._matchers = [_make_matcher(element) for element in self.elements]
+        # (position in the pattern, opcode) for all elements that require a specific opcode
+        self._anchors = []
+        for i, element in enumerate(self.elements):
+            if isinstance(element, ops.Instruction):
+                self._anchors.append((i, element.opcode))
+            elif isinstance(element, type) and issubclass(element, ops.Instruction):
+                self._anchors.append((i, element.opcode))
+
+    def __len__(self):
+        return len(self.elements)
+
+    def matches_at(self, instructions, start):
+        """Whether the pattern matches the instructions starting at the given position."""
+        if start < 0 or start + len(self._matchers) > len(instructions):
+            return False
+        return all(matcher(instructions[start + i]) for i, matcher in enumerate(self._matchers))
+
+    def __repr__(self):
+        return 'Pattern(%r)' % self.elements
+
+
+def search(ba, pattern):
+    """Returns a list of non-overlapping Matches of pattern in ba, in order."""
+    candidates = _candidate_starts(ba, pattern)
+    matches = []
+    end = 0
+    for start in candidates:
+        if start >= end and pattern.matches_at(ba.instructions, start):
+            end = start + len(pattern)
+            matches.append(Match(start, end, ba.instructions[start:end]))
+    return matches
+
+
+def replace(ba, pattern, fn):
+    """Replaces all matches of pattern in ba, returning the number of replacements.
+
+    fn is called with each Match and returns a list of instructions to replace it with, or None to
+    leave the match unchanged. Instructions without line numbers get the line number of the
+    instructions they replace.
+
+    """
+    count = 0
+    # go backwards, so that the positions of earlier matches are not affected by replacements
+    for match in reversed(search(ba, pattern)):
+        replacement = fn(match)
+        if replacement is not None:
+            ba[match.start:match.end] = replacement
+            count += 1
+    return count
+
+
+def get_index(ba):
+    """Returns the InstructionIndex for ba, creating it if necessary."""
+    index = ba._pattern_index
+    if index is None or not index.is_valid_for(ba.instructions):
+        index = ba._pattern_index = InstructionIndex(ba.instructions)
+    return index
+
+
+class InstructionIndex(object):
+    """Maps each opcode to the sorted positions of the instructions with that opcode.
+
+    The index is kept up to date when instructions are changed through ByteAround.__setitem__ and
+    ByteAround.insert_instructions. It also remembers the opcodes it was computed for, so that
+    get_index can detect any other change to ba.instructions and rebuild it.
+
+    """
+    def __init__(self, instructions):
+        self._instructions = instructions
+        # the opcodes that the positions describe, or None if the index must be rebuilt
+        self._opcodes = map(_get_opcode, instructions)
+        self._positions = {}
+        for i, op in enumerate(self._opcodes):
+            self._positions.setdefault(op, []).append(i)
+
+    def positions(self, op):
+        """Returns the sorted list of positions of instructions with the given opcode."""
+        return self._positions.get(op, [])
+
+    def is_valid_for(self, instructions):
+        return instructions is self._instructions and \
+            self._opcodes == map(_get_opcode, instructions)
+
+    def update(self, instructions, key, value):
+        """Updates the index after instructions[key] = value has succeeded."""
+        if instructions is not self._instructions or self._opcodes is None:
+            return
+        length = len(self._opcodes)
+        if isinstance(key, slice):
+            start, stop, step = key.indices(length)
+            if step != 1:
+                self._opcodes = None
+                return
+            stop = max(start, stop)
+            new_opcodes = [instr.opcode for instr in value]
+        else:
+            start = key + length if key < 0 else key
+            if not 0 <= start < length:
+                # the index was already out of date
+                self._opcodes = None
+                return
+            stop = start + 1
+            new_opcodes = [value.opcode]
+        delta = len(new_opcodes) - (stop - start)
+        for positions in self._positions.values():
+            low = bisect_left(positions, start)
+            high = bisect_left(positions, stop)
+            if delta:
+                positions[high:] = [position + delta for position in positions[high:]]
+            del positions[low:high]
+        for i, op in enumerate(new_opcodes):
+            insort(self._positions.setdefault(op, []), start + i)
+        self._opcodes[start:stop] = new_opcodes
+
+
+def _candidate_starts(ba, pattern):
+    if not pattern._anchors:
+        return range(len(ba.instructions) - len(pattern) + 1)
+    index = get_index(ba)
+    offset, op = min(pattern._anchors, key=lambda anchor: len(index.positions(anchor[1])))
+    return [position - offset for position in index.positions(op)]
+
+
+def _make_matcher(element):
+    if element is ANY_INSTRUCTION:
+        return lambda instr: not isinstance(instr, ops.Label)
+    elif isinstance(element, type) and issubclass(element, ops.Instruction):
+        return lambda instr: instr.opcode == element.opcode
+    elif isinstance(element, ops.Label):
+        raise TypeError('patterns cannot contain Labels')
+    elif isinstance(element, ops.Instruction):
+        op = element.opcode
+        arg_matches = _make_arg_matcher(element)
+        return lambda instr: instr.opcode == op and arg_matches(instr.oparg)
+    else:
+        raise TypeError('invalid pattern element: %r' % (element,))
+
+
+def _make_arg_matcher(element):
+    expected = element.oparg
+    if expected is ANY:
+        return lambda oparg: True
+    elif isinstance(expected, Predicate):
+        return expected
+    elif element.opcode in opcode.hasconst:
+        # compare constants by type and value, so that LOAD_CONST(1) does not match
+        # LOAD_CONST(True)
+        key = generator.const_key(expected)
+        return lambda oparg: generator.const_key(oparg) == key
+    elif element.opcode in opcode.hasjrel or element.opcode in opcode.hasjabs:
+        return lambda oparg: oparg is expected
+    else:
+        return lambda oparg: oparg == expected
@@ -0,0 +1,152 @@
+"""
+
+Profile-guided reordering of basic blocks.
+
+Reorders the basic blocks of a ByteAround object so that the most frequently executed successor of
+each block directly follows it, which means that the hot path through a function falls through
+instead of jumping. Block execution counts can be gathered with profiler.BlockProfiler or supplied
+by the caller.
+
+Usage:
+
+    with BlockProfiler() as profiler:
+        profiler.instrument(f)
+        run_typical_workload()
+        counts = profiler.counts(f)
+    reorder_function(f, counts)
+
+"""
+import opcode
+
+from . import blocks
+from . import code_object
+from . import ops
+
+_FLIPPED_JUMPS = {
+    ops.POP_JUMP_IF_TRUE.opcode: ops.POP_JUMP_IF_FALSE,
+    ops.POP_JUMP_IF_FALSE.opcode: ops.POP_JUMP_IF_TRUE,
+}
+# jumps that do not make their target a successor in the layout: the target is a block that is
+# only entered through the block stack (an exception handler or the end of a loop)
+_SETUP_OPCODES = frozenset([
+    ops.SETUP_LOOP.opcode,
+    ops.SETUP_EXCEPT.opcode,
+    ops.SETUP_FINALLY.opcode,
+    ops.SETUP_WITH.opcode,
+])
+
+
+def reorder_function(fn, counts):
+    """Reorders the blocks of a function in place, given the counts for its current code."""
+    ba = code_object.ByteAround.from_code(fn.__code__)
+    fn.__code__ = reorder_blocks(ba, counts).to_code()
+
+
+def reorder_blocks(ba, counts):
+    """Reorders the basic blocks of ba in place and returns ba.
+
+    counts is a list of the number of times each block in blocks.split_blocks(ba.instructions)
+    was executed. The entry block stays first. After that, each block is followed by its most
+    frequently executed successor that has not been placed yet. Conditional jumps are inverted and
+    JUMP_ABSOLUTE instructions are added where the original fall-through successor no longer
+    follows a block.
+
+    Instructions with relative jumps other than JUMP_FORWARD (FOR_ITER and the SETUP_*
+    instructions) can only jump forward, so their targets are always placed after them. The line
+    numbers of the instructions are kept, but co_lnotab cannot represent decreasing line numbers in
+    Python 2, so in the generated code blocks that end up after blocks with higher line numbers are
+    attributed to the higher line number (see generator.generate).
+
+    """
+    code_blocks = blocks.split_blocks(ba.instructions)
+    if len(counts) != len(code_blocks):
+        raise ValueError('expected %d counts, got %d' % (len(code_blocks), len(counts)))
+    label_map = blocks.get_label_map(code_blocks)
+    order = _compute_layout(code_blocks, counts, label_map)
+    position = {block_index: i for i, block_index in enumerate(order)}
+
+    # decide how each block should end before emitting any code, because the changes may require
+    # adding labels to blocks that come earlier in the new order
+    block_ends = []
+    for block_index in order:
+        block = code_blocks[block_index]
+        instructions = list(block.instructions)
+        last = block.last
+        if last is not None and last.opcode == ops.JUMP_FORWARD.opcode and \
+                position[label_map[last.oparg]] <= position[block_index]:
+            instructions[-1] = ops.JUMP_ABSOLUTE(last.oparg, last.lineno)
+        fall_through = block_index + 1
+        if block.can_fall_through() and fall_through < len(code_blocks) and \
+                position[fall_through] != position[block_index] + 1:
+            label = _get_label(code_blocks[fall_through])
+            lineno = last.lineno if last is not None else None
+            if last is not None and last.opcode in _FLIPPED_JUMPS and \
+                    position[label_map[last.oparg]] == position[block_index] + 1:
+                instructions[-1] = _FLIPPED_JUMPS[last.opcode](label, lineno)
+            else:
+                instructions.append(ops.JUMP_ABSOLUTE(label, lineno))
+        block_ends.append(instructions)
+
+    new_instructions = []
+    prev_lineno = None
+    for block_index, instructions in zip(order, block_ends):
+        new_instructions += code_blocks[block_index].labels
+        for instr in instructions:
+            # jumps added after empty blocks have no line number yet
+            if instr.lineno is None:
+                instr.lineno = prev_lineno
+            prev_lineno = instr.lineno
+            new_instructions.append(instr)
+    ba.instructions = new_instructions
+    return ba
+
+
+def _compute_layout(code_blocks, counts, label_map):
+    """Returns a list of block indexes in the order the blocks should be placed."""
+    num_blocks = len(code_blocks)
+    successors = []
+    # {block index: indexes of blocks that must be placed before it}
+    required_predecessors = {}
+    for block in code_blocks:
+        block_successors = []
+        if block.can_fall_through() and block.index + 1 < num_blocks:
+            block_successors.append(block.index + 1)
+        target = block.jump_target()
+        if target is not None:
+            target_index = label_map[target]
+            if block.last.opcode in opcode.hasjrel and block.last.opcode != ops.JUMP_FORWARD.opcode:
+                required_predecessors.setdefault(target_index, []).append(block.index)
+            if block.last.opcode not in _SETUP_OPCODES:
+                block_successors.append(target_index)
+        successors.append(block_successors)
+
+    placed = [False] * num_blocks
+
+    def can_place(block_index):
+        return not placed[block_index] and \
+            all(placed[i] for i in required_predecessors.get(block_index, ()))
+
+    order = []
+    first_unplaced = 0
+    current = 0
+    while True:
+        order.append(current)
+        placed[current] = True
+        if len(order) == num_blocks:
+            return order
+        candidates = [i for i in successors[current] if can_place(i)]
+        if candidates:
+            # prefer the original fall-through successor if the counts are equal
+            current = max(candidates, key=lambda i: (counts[i], i == current + 1))
+        else:
+            # the first unplaced block can always be placed, because relative jumps only go
+            # forward in the original order
+            while placed[first_unplaced]:
+                first_unplaced += 1
+            current = first_unplaced
+
+
+def _get_label(block):
+    if not block.labels:
+        block.labels.append(ops.Label())
+    return block.labels[0]
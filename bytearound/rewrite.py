@@ -0,0 +1,196 @@
+"""
+
+Command-line tool that applies a transform to all Python files in a directory tree.
+
+For every .py file, the transformed code is written to the corresponding .pyc file, which the
+regular import system will load as long as the source is not modified. Existing .pyc files without
+a corresponding source file are rewritten in place.
+
+Usage:
+
+    python -m bytearound.rewrite --transform mypackage.transforms.my_transform build/
+
+"""
+from __future__ import print_function
+
+import argparse
+import imp
+import itertools
+import marshal
+import os
+import struct
+import sys
+import time
+
+from . import transform
+
+_PYC_HEADER_LENGTH = 8  # magic number and source mtime
+_SKIPPED_SUFFIXES = ('.bytearound.pyc',)  # side files written by bytearound.importer
+
+
+def find_files(paths):
+    """Yields the .py and .pyc files found under the given files and directories.
+
+    .pyc files are skipped if the corresponding .py file is also present, because they will be
+    regenerated from the source.
+
+    """
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            filenames = set(filenames)
+            for filename in sorted(filenames):
+                if filename.endswith(_SKIPPED_SUFFIXES):
+                    continue
+                if filename.endswith('.py'):
+                    yield os.path.join(dirpath, filename)
+                elif filename.endswith('.pyc') and filename[:-1] not in filenames:
+                    yield os.path.join(dirpath, filename)
+
+
+def get_output_path(path, root=None, output_dir=None):
+    """Returns the path of the .pyc file to write for the given input file.
+
+    root is the file or directory given on the command line that path was found in. If it is a
+    file, the output is written directly to output_dir.
+
+    """
+    pyc_path = path + 'c' if path.endswith('.py') else path
+    if output_dir is None:
+        return pyc_path
+    if root is not None and os.path.isfile(root):
+        root = os.path.dirname(root) or os.curdir
+    return os.path.join(output_dir, os.path.relpath(pyc_path, root))
+
+
+def rewrite_file(path, output_path, fn, pessimize=False, compact=False, collapse_lnotab=False):
+    """Applies fn to the code in path and writes the result as a .pyc file to output_path.
+
+    pessimize, compact and collapse_lnotab are passed to ByteAround.to_code.
+
+    """
+    if path.endswith('.py'):
+        with open(path, 'rU') as f:
+            source = f.read()
+        co = compile(source, path, 'exec', dont_inherit=True)
+        header = imp.get_magic() + struct.pack('<I', int(os.stat(path).st_mtime) & 0xFFFFFFFF)
+    else:
+        with open(path, 'rb') as f:
+            header = f.read(_PYC_HEADER_LENGTH)
+            if header[:4] != imp.get_magic():
+                raise ValueError('bad magic number in %s' % path)
+            co = marshal.load(f)
+    code = transform.transform_code(co, fn, pessimize=pessimize, compact=compact,
+                                    collapse_lnotab=collapse_lnotab)
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.isdir(output_dir):
+        try:
+            os.makedirs(output_dir)
+        except OSError:
+            if not os.path.isdir(output_dir):  # another worker may have created it
+                raise
+    tmp_path = '%s.%d.tmp' % (output_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        marshal.dump(code, f)
+    os.rename(tmp_path, output_path)
+
+
+_worker_state = {}
+
+
+def _init_worker(transform_name, options):
+    _worker_state['fn'] = transform.get_transform(transform_name)
+    _worker_state['options'] = options
+
+
+def _rewrite_in_worker(paths):
+    """Rewrites a single file, returning (path, elapsed time, error message or None)."""
+    path, output_path = paths
+    start = time.time()
+    try:
+        rewrite_file(path, output_path, _worker_state['fn'], **_worker_state['options'])
+    except Exception as e:
+        error = '%s: %s' % (type(e).__name__, e)
+    else:
+        error = None
+    return path, time.time() - start, error
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m bytearound.rewrite',
+        description='Apply a bytearound transform to all Python files in a directory tree.')
+    parser.add_argument('paths', nargs='+', help='Files and directories to rewrite.')
+    parser.add_argument('-t', '--transform', default='identity',
+                        help='Name of a bytearound transform or dotted path to a function.')
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help='Write .pyc files to this directory instead of next to the input.')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Number of worker processes (defaults to the number of CPUs).')
+    parser.add_argument('--pessimize', action='store_true', default=False,
+                        help='Replicate CPython quirks when generating code.')
+    parser.add_argument('--compact', action='store_true', default=False,
+                        help='Drop docstrings and deduplicate constants to make smaller files.')
+    parser.add_argument('--collapse-lnotab', action='store_true', default=False,
+                        help='Only record the first line number of each code object.')
+    parser.add_argument('--slowest', type=int, default=10,
+                        help='Number of slowest files to show in the summary.')
+    args = parser.parse_args(argv)
+    # imported here because multiprocessing is slow to import and only needed for this command
+    import multiprocessing
+    if args.jobs is None:
+        args.jobs = multiprocessing.cpu_count()
+
+    if args.compact and args.pessimize:
+        parser.error('--compact and --pessimize cannot be used together')
+    options = dict(pessimize=args.pessimize, compact=args.compact,
+                   collapse_lnotab=args.collapse_lnotab)
+    # fail early if the transform does not exist
+    transform.get_transform(args.transform)
+    jobs = []
+    for root in args.paths:
+        for path in find_files([root]):
+            jobs.append((path, get_output_path(path, root=root, output_dir=args.output_dir)))
+
+    start = time.time()
+    if args.jobs == 1:
+        _init_worker(args.transform, options)
+        pool = None
+        results = itertools.imap(_rewrite_in_worker, jobs)
+    else:
+        pool = multiprocessing.Pool(args.jobs, initializer=_init_worker,
+                                    initargs=(args.transform, options))
+        chunksize = max(1, min(64, len(jobs) // (args.jobs * 4)))
+        results = pool.imap_unordered(_rewrite_in_worker, jobs, chunksize=chunksize)
+    try:
+        results = list(results)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    elapsed = time.time() - start
+
+    failures = sorted((path, error) for path, _, error in results if error is not None)
+    print('rewrote %d files in %.2fs with %d workers (%d failed)' % (
+        len(results) - len(failures), elapsed, args.jobs, len(failures)))
+    if results:
+        print('total time in workers: %.2fs' % sum(result[1] for result in results))
+    slowest = sorted(results, key=lambda result: result[1], reverse=True)[:args.slowest]
+    if slowest:
+        print('slowest files:')
+        for path, file_elapsed, _ in slowest:
+            print('  %.3fs %s' % (file_elapsed, path))
+    if failures:
+        print('failures:')
+        for path, error in failures:
+            print('  %s: %s' % (path, error))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
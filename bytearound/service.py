@@ -0,0 +1,332 @@
+"""
+
+A local service that applies transforms on behalf of several processes.
+
+In a prefork server, every worker process would otherwise repeat the same from_code, transform and
+to_code work for the same functions. The service is a daemon listening on a Unix domain socket
+that performs the work once and keeps the results in an in-memory cache shared by all of its
+clients, so the cost is paid once per host instead of once per process.
+
+Each message is a 4-byte little-endian length followed by a marshalled tuple. A transform request
+is ('transform', transform name, options, list of code objects) and the response is
+('ok', list of results), where each result is (True, code object) or (False, error message).
+Python 2.7 has no asyncio, so the server uses a thread per connection; requests for the same code
+object that arrive at the same time are only computed once.
+
+marshal is not safe against malicious input, so the socket is only accessible by its owner.
+
+Usage:
+
+    python -m bytearound.service --socket /tmp/bytearound.sock
+
+and in each worker:
+
+    client = TransformClient('/tmp/bytearound.sock')
+    codes = client.transform_many([f.__code__ for f in functions], 'fold_constants')
+
+If the service is not running, the client falls back to doing the work itself.
+
+"""
+from __future__ import print_function
+
+import argparse
+from collections import OrderedDict
+import errno
+import marshal
+import os
+import socket
+import SocketServer
+import stat
+import struct
+import threading
+
+from . import cache
+from . import instrument
+from . import transform
+
+_LENGTH = struct.Struct('<I')
+# options that can be passed to transform_code through the service
+_OPTIONS = frozenset(['pessimize', 'compact', 'collapse_lnotab', 'precise_stacksize'])
+# number of elements in each kind of request
+_REQUEST_LENGTHS = {'transform': 4, 'stats': 1}
+
+
+class ServiceError(Exception):
+    """Raised when the service returns an error for a request or its socket path is in use."""
+
+
+class TransformServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """Server that transforms code objects and caches the results.
+
+    maxsize is the maximum number of transformed code objects to keep; the least recently used ones
+    are dropped first. Raises ServiceError if path exists and is not the socket of a service that
+    is no longer running.
+
+    """
+    daemon_threads = True
+
+    def __init__(self, path, maxsize=10000):
+        _remove_stale_socket(path)
+        # the socket is created with the permissions from the umask, so make sure no other user can
+        # connect before chmod
+        old_umask = os.umask(0o177)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        self.path = path
+        self._socket_id = _get_file_id(path)
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()  # (transform name, options, fingerprint) -> marshalled code
+        self._in_progress = {}  # key -> threading.Event set when the key has been computed
+        self._lock = threading.Lock()
+
+    def transform(self, name, options, co):
+        """Returns the marshalled result of applying the named transform to co."""
+        key = (name, tuple(sorted(options.items())), cache.fingerprint(co))
+        while True:
+            with self._lock:
+                try:
+                    data = self._cache.pop(key)
+                except KeyError:
+                    event = self._in_progress.get(key)
+                    if event is None:
+                        event = self._in_progress[key] = threading.Event()
+                        self.misses += 1
+                        break
+                else:
+                    self._cache[key] = data  # move to the end
+                    self.hits += 1
+                    instrument.record_event('service', 'hits', co.co_name)
+                    return data
+            # another thread is computing the same key
+            event.wait()
+        instrument.record_event('service', 'misses', co.co_name)
+        try:
+            fn = transform.get_transform(name)
+            data = marshal.dumps(transform.transform_code(co, fn, **options))
+            with self._lock:
+                self._cache[key] = data
+                while len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+        finally:
+            with self._lock:
+                del self._in_progress[key]
+            event.set()
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._cache)}
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        # another server may have replaced the socket since this one was started
+        if _get_file_id(self.path) == self._socket_id:
+            os.unlink(self.path)
+
+
+class _RequestHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = _receive(self.request)
+            except EOFError:
+                return
+            _send(self.request, self._respond(request))
+
+    def _respond(self, request):
+        error = _check_request(request)
+        if error is not None:
+            return ('error', error)
+        if request[0] == 'transform':
+            _, name, options, codes = request
+            if not set(options) <= _OPTIONS:
+                return ('error', 'unsupported options: %s' % ', '.join(set(options) - _OPTIONS))
+            results = []
+            for co in codes:
+                try:
+                    data = self.server.transform(name, options, co)
+                except Exception as e:
+                    results.append((False, '%s: %s' % (type(e).__name__, e)))
+                else:
+                    results.append((True, data))
+            return ('ok', results)
+        else:
+            return ('ok', self.server.stats())
+
+
+def _check_request(request):
+    """Returns an error message if request is not a well-formed request, or else None."""
+    if not isinstance(request, tuple) or not request or not isinstance(request[0], str):
+        return 'malformed request of type %s' % type(request).__name__
+    expected_length = _REQUEST_LENGTHS.get(request[0])
+    if expected_length is None:
+        return 'unknown request %r' % (request[0],)
+    if len(request) != expected_length:
+        return '%s request has %d elements, expected %d' % (
+            request[0], len(request), expected_length)
+    if request[0] == 'transform' and not (
+            isinstance(request[1], str) and isinstance(request[2], dict) and
+            isinstance(request[3], list)):
+        return 'transform request must be (str, dict, list) after the request name'
+    return None
+
+
+class TransformClient(object):
+    """Client for a TransformServer listening at path.
+
+    The connection is opened when the first request is made and kept open; the client can be used
+    from several threads. If fallback is True and the service cannot be reached, transforms are
+    applied in the current process instead.
+
+    """
+    def __init__(self, path, fallback=True, timeout=None):
+        self.path = path
+        self.fallback = fallback
+        self.timeout = timeout
+        self._socket = None
+        self._lock = threading.Lock()
+
+    def transform(self, co, name, **options):
+        """Returns the result of applying the named transform to co."""
+        return self.transform_many([co], name, **options)[0]
+
+    def transform_many(self, codes, name, **options):
+        """Applies the named transform to a list of code objects, using a single request.
+
+        name is a name accepted by transform.get_transform and options are passed to
+        transform_code. Raises ServiceError if the transform fails for any of the code objects.
+
+        """
+        codes = list(codes)
+        try:
+            status, results = self._request(('transform', name, options, codes))
+        except (socket.error, EOFError):
+            if not self.fallback:
+                raise
+            fn = transform.get_transform(name)
+            memo = {}
+            return [transform.transform_code(co, fn, memo=memo, **options) for co in codes]
+        if status != 'ok':
+            raise ServiceError(results)
+        transformed = []
+        for success, result in results:
+            if not success:
+                raise ServiceError(result)
+            transformed.append(marshal.loads(result))
+        return transformed
+
+    def stats(self):
+        """Returns a dictionary with the number of cache hits, misses and entries of the service."""
+        return self._request(('stats',))[1]
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _request(self, message):
+        with self._lock:
+            if self._socket is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                try:
+                    sock.connect(self.path)
+                except socket.error:
+                    sock.close()
+                    raise
+                self._socket = sock
+            try:
+                _send(self._socket, message)
+                return _receive(self._socket)
+            except (socket.error, EOFError):
+                # the service may have been restarted, so reconnect on the next request
+                self._close()
+                raise
+
+    def _close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+def _send(sock, message):
+    data = marshal.dumps(message)
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+
+
+def _receive(sock):
+    length, = _LENGTH.unpack(_receive_exactly(sock, _LENGTH.size))
+    return marshal.loads(_receive_exactly(sock, length))
+
+
+def _receive_exactly(sock, length):
+    chunks = []
+    while length:
+        chunk = sock.recv(min(length, 65536))
+        if not chunk:
+            raise EOFError('connection closed')
+        chunks.append(chunk)
+        length -= len(chunk)
+    return ''.join(chunks)
+
+
+def _remove_stale_socket(path):
+    """Removes the socket left behind by a service that is no longer running."""
+    try:
+        mode = os.lstat(path).st_mode
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return
+        raise
+    if not stat.S_ISSOCK(mode):
+        raise ServiceError('%s exists and is not a socket' % path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error as e:
+        if e.errno != errno.ECONNREFUSED:
+            raise
+    else:
+        raise ServiceError('a service is already listening on %s' % path)
+    finally:
+        sock.close()
+    os.unlink(path)
+
+
+def _get_file_id(path):
+    """Returns (device, inode) of path, or None if it does not exist."""
+    try:
+        st = os.lstat(path)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return None
+        raise
+    return st.st_dev, st.st_ino
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m bytearound.service',
+        description='Run a service that applies bytearound transforms for other processes.')
+    parser.add_argument('-s', '--socket', required=True, help='Path of the Unix socket.')
+    parser.add_argument('--maxsize', type=int, default=10000,
+                        help='Maximum number of transformed code objects to cache.')
+    args = parser.parse_args(argv)
+    try:
+        server = TransformServer(args.socket, maxsize=args.maxsize)
+    except ServiceError as e:
+        parser.error(str(e))
+    print('listening on %s' % args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+
+Partial evaluation of functions for fixed argument values.
+
+Given a function and values for some of its parameters, creates a new function without those
+parameters, in which the parameters have been replaced by constants. Constant folding and dead code
+removal then eliminate code that only depends on the fixed values, such as checks of configuration
+flags.
+
+Usage:
+
+    def render(text, escape, width):
+        if escape:
+            text = cgi.escape(text)
+        return text.ljust(width)
+
+    render_plain = specialize(render, escape=False)
+    render_plain('hello', 10)
+
+"""
+from collections import OrderedDict
+import types
+
+from . import code_object
+from . import generator
+from . import instrument
+from . import ops
+from . import optimize
+
+
+class Specializer(object):
+    """Creates specialized versions of functions and caches them.
+
+    The cache holds at most maxsize functions; when it is full, the least recently used function
+    is discarded. Entries are keyed by the function and by generator.const_key() of each bound
+    argument, so that for example f(x=1) and f(x=True), or f(x=0.0) and f(x=-0.0), get different
+    specializations. Unhashable values are keyed by identity.
+
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def specialize(self, fn, **bound):
+        """Returns a version of fn with the parameters in bound fixed to the given values."""
+        key = (fn, _make_key(bound))
+        try:
+            specialized, _ = self._cache.pop(key)
+        except KeyError:
+            self.misses += 1
+            instrument.record_event('specialize', 'misses', fn.__name__)
+            specialized = specialize_function(fn, bound)
+            if len(self._cache) >= self.maxsize:
+                self._cache.popitem(last=False)
+        else:
+            self.hits += 1
+            instrument.record_event('specialize', 'hits', fn.__name__)
+        # (re)insert at the end to mark the entry as most recently used; bound is stored to keep
+        # unhashable values alive, because they are keyed by their id
+        self._cache[key] = (specialized, bound)
+        return specialized
+
+    def clear(self):
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+
+_default_specializer = Specializer()
+
+
+def specialize(fn, **bound):
+    """Returns a cached version of fn with the parameters in bound fixed to the given values."""
+    return _default_specializer.specialize(fn, **bound)
+
+
+def specialize_function(fn, bound):
+    """Returns a new function with the parameters in bound fixed to the given values.
+
+    The new function takes the remaining parameters in the same order as fn and keeps their
+    default values.
+
+    """
+    co = fn.__code__
+    positional = co.co_varnames[:co.co_argcount]
+    defaults = fn.__defaults__ or ()
+    default_values = dict(zip(positional[len(positional) - len(defaults):], defaults))
+    new_code = specialize_code(co, bound)
+    new_defaults = tuple(default_values[name] for name in positional
+                         if name in default_values and name not in bound)
+    new_fn = types.FunctionType(new_code, fn.__globals__, fn.__name__, new_defaults or None,
+                                fn.__closure__)
+    new_fn.__doc__ = fn.__doc__
+    new_fn.__module__ = fn.__module__
+    new_fn.__dict__.update(fn.__dict__)
+    return new_fn
+
+
+def specialize_code(co, bound):
+    """Returns a code object in which the parameters in bound are replaced by constants.
+
+    Raises ValueError if a parameter cannot be replaced: if it does not exist, if it is a *args or
+    **kwargs parameter, if the function assigns to it or if it is used in a nested function.
+
+    """
+    ba = code_object.ByteAround.from_code(co)
+    for name in bound:
+        if name not in ba.argnames[:co.co_argcount]:
+            raise ValueError('%s has no positional parameter %s' % (co.co_name, name))
+        if name in co.co_cellvars:
+            raise ValueError('cannot specialize %s: it is used in a nested function' % name)
+    for instr in ba:
+        if isinstance(instr, (ops.STORE_FAST, ops.DELETE_FAST)) and instr.oparg in bound:
+            raise ValueError('cannot specialize %s: it is assigned to in %s' % (
+                instr.oparg, co.co_name))
+
+    for i, instr in enumerate(ba.instructions):
+        if isinstance(instr, ops.LOAD_FAST) and instr.oparg in bound:
+            ba.instructions[i] = ops.LOAD_CONST(bound[instr.oparg], instr.lineno)
+    ba.argnames = tuple(name for name in ba.argnames if name not in bound)
+    optimize.fold_constants(ba)
+    optimize.remove_dead_code(ba)
+    return ba.to_code()
+
+
+def _make_key(bound):
+    # the values become constants, so key them the same way constants are deduplicated
+    return tuple([(name, generator.const_key(value)) for name, value in sorted(bound.items())])
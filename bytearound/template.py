@@ -0,0 +1,136 @@
+"""
+
+Instruction templates with placeholders.
+
+A Template is a sequence of instructions that is validated and analyzed once and can then be
+instantiated many times. Operands can be Placeholders, which are replaced by the values given to
+instantiate(). Labels in the template are replaced by new Labels in every instantiation, and jumps
+out of the template use a Placeholder that is given a Label when the template is instantiated.
+
+Usage:
+
+    get_attr = Template([
+        ops.LOAD_FAST(Placeholder('obj')),
+        ops.LOAD_ATTR(Placeholder('attr')),
+        ops.POP_JUMP_IF_FALSE(Placeholder('target')),
+    ])
+    ba.insert_instructions(0, get_attr.instantiate(obj='self', attr='x', target=label))
+
+"""
+from . import generator
+from . import ops
+
+# how each instruction is created by Template.instantiate
+_FIXED = 'fixed'  # the oparg is copied from the template
+_SUBSTITUTED = 'substituted'  # the oparg is the value of a placeholder
+_JUMP = 'jump'  # the oparg is one of the new Labels
+_LABEL = 'label'  # the instruction is one of the new Labels
+
+
+class Placeholder(object):
+    """An operand that is filled in when a template is instantiated."""
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'Placeholder(%r)' % self.name
+
+
+class Template(object):
+    """A validated sequence of instructions with placeholders.
+
+    stack_effect is the net effect on the stack of executing all instructions in order and
+    max_depth the largest number of values the template pushes on top of the stack at any point
+    while doing so. placeholders is the set of placeholder names; the names of placeholders used
+    as jump targets are also in label_placeholders.
+
+    """
+    def __init__(self, instructions):
+        instructions = list(instructions)
+        labels = {}
+        for instr in instructions:
+            if isinstance(instr, ops.Label):
+                if instr in labels:
+                    raise ValueError('%r appears more than once in the template' % instr)
+                labels[instr] = len(labels)
+            elif not isinstance(instr, ops.Instruction):
+                raise TypeError('templates can only contain Instruction and Label objects, not %r'
+                                % (instr,))
+
+        self.placeholders = set()
+        self.label_placeholders = set()
+        operand_placeholders = set()
+        self._plan = []  # list of (kind, instruction class, argument)
+        self.stack_effect = 0
+        self.max_depth = 0
+        for instr in instructions:
+            if isinstance(instr, ops.Label):
+                self._plan.append((_LABEL, None, labels[instr]))
+                continue
+            oparg = instr.oparg
+            if not instr.has_argument() and oparg is not None:
+                raise ValueError('%s does not take an argument' % (instr,))
+            if isinstance(oparg, Placeholder):
+                if oparg.name == 'lineno':
+                    raise ValueError('"lineno" cannot be used as a placeholder name')
+                self.placeholders.add(oparg.name)
+                if instr.is_jump():
+                    self.label_placeholders.add(oparg.name)
+                elif instr.opcode in generator.stack_effect_func_map:
+                    raise ValueError('the argument of %s determines its stack effect, so it '
+                                     'cannot be a placeholder' % (instr,))
+                else:
+                    operand_placeholders.add(oparg.name)
+                self._plan.append((_SUBSTITUTED, type(instr), oparg.name))
+            elif instr.is_jump():
+                if oparg not in labels:
+                    raise ValueError('%s jumps to a Label that is not in the template; use a '
+                                     'Placeholder for jumps out of the template' % (instr,))
+                self._plan.append((_JUMP, type(instr), labels[oparg]))
+            else:
+                self._plan.append((_FIXED, type(instr), oparg))
+            self.stack_effect += generator.opcode_stack_effect(instr)
+            self.max_depth = max(self.max_depth, self.stack_effect)
+        overlap = self.label_placeholders & operand_placeholders
+        if overlap:
+            raise ValueError('placeholders used both as jump targets and as other arguments: %s'
+                             % ', '.join(sorted(overlap)))
+        self._label_count = len(labels)
+        self._length = len(instructions)
+
+    def __len__(self):
+        return self._length
+
+    def instantiate(self, lineno=None, **values):
+        """Returns a new list of instructions with the placeholders replaced by values.
+
+        values must contain exactly the placeholders of the template; the values of placeholders
+        used as jump targets must be Labels. The instructions get the given line number, or None
+        so that ByteAround.insert_instructions fills in the line number of the surrounding code.
+
+        """
+        if len(values) != len(self.placeholders) or not self.placeholders.issuperset(values):
+            missing = self.placeholders - set(values)
+            extra = set(values) - self.placeholders
+            raise ValueError('missing placeholders: %s; unknown placeholders: %s' % (
+                ', '.join(sorted(missing)) or 'none', ', '.join(sorted(extra)) or 'none'))
+        for name in self.label_placeholders:
+            if not isinstance(values[name], ops.Label):
+                raise TypeError('placeholder %s is a jump target and must be a Label, not %r' % (
+                    name, values[name]))
+        labels = [ops.Label() for _ in xrange(self._label_count)]
+        result = []
+        for kind, cls, arg in self._plan:
+            if kind is _FIXED:
+                result.append(cls(arg, lineno))
+            elif kind is _SUBSTITUTED:
+                result.append(cls(values[arg], lineno))
+            elif kind is _JUMP:
+                result.append(cls(labels[arg], lineno))
+            else:
+                result.append(labels[arg])
+        return result
+
+    def __repr__(self):
+        return 'Template(%d instructions, placeholders=%s)' % (
+            self._length, sorted(self.placeholders))
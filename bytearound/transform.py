@@ -0,0 +1,159 @@
+"""
+
+Helpers for applying transforms to code objects.
+
+A transform is a callable that takes a ByteAround object and returns the ByteAround object to
+convert back into a code object (usually the same object, modified in place).
+
+"""
+import importlib
+import time
+import types
+
+from . import code_object
+from . import ops
+from . import optimize
+
+
+def transform_code(co, fn, pessimize=False, memo=None, pool=None, compact=False,
+                   collapse_lnotab=False, precise_stacksize=False):
+    """Applies a transform to a code object and to all code objects nested in its constants.
+
+    Nested code objects (e.g. the code for functions defined in a module) are transformed first, so
+    that fn sees the transformed versions in its LOAD_CONST instructions. memo is a dictionary of
+    code objects that have already been transformed; it can be shared between calls so that code
+    objects reachable from several places are only transformed once. pool, compact,
+    collapse_lnotab and precise_stacksize are passed to ByteAround.to_code for all generated code
+    objects.
+
+    """
+    if memo is None:
+        memo = {}
+    if co in memo:
+        return memo[co]
+    options = dict(pessimize=pessimize, pool=pool, compact=compact,
+                   collapse_lnotab=collapse_lnotab, precise_stacksize=precise_stacksize)
+    ba = code_object.ByteAround.from_code(co)
+    for instr in ba:
+        if isinstance(instr, ops.LOAD_CONST) and isinstance(instr.oparg, types.CodeType):
+            instr.oparg = transform_code(instr.oparg, fn, memo=memo, **options)
+    # for code objects that are not functions, co_consts[0] may be a nested code object
+    if isinstance(ba.docstring, types.CodeType):
+        ba.docstring = transform_code(ba.docstring, fn, memo=memo, **options)
+    result = fn(ba).to_code(**options)
+    memo[co] = result
+    return result
+
+
+class RecursiveTransformReport(object):
+    """Results of a transform_recursive() call."""
+    def __init__(self, functions, patched_functions, code_objects, elapsed):
+        self.functions = functions  # number of functions found
+        self.patched_functions = patched_functions  # number of functions whose code was replaced
+        self.code_objects = code_objects  # number of unique code objects transformed
+        self.elapsed = elapsed
+
+    def summary(self):
+        """Returns a human-readable summary of the results."""
+        return 'transformed %d code objects in %.2fs, patched %d of %d functions' % (
+            self.code_objects, self.elapsed, self.patched_functions, self.functions)
+
+
+def transform_recursive(obj, fn, prefix=None, **options):
+    """Applies a transform in place to all functions reachable from obj.
+
+    obj may be a module, class or function. Module and class dictionaries, methods, staticmethods,
+    classmethods, properties and the closures of functions are searched for functions, but only
+    objects defined in modules whose name is prefix or starts with prefix + '.' are included, so
+    that functions imported from other packages are left alone. prefix defaults to the name of obj
+    if it is a module and to its __module__ otherwise.
+
+    Each unique code object, including nested code objects, is transformed only once, and every
+    function that refers to it gets the transformed version. options are passed to
+    transform_code(). Returns a RecursiveTransformReport.
+
+    """
+    start = time.time()
+    if prefix is None:
+        prefix = obj.__name__ if isinstance(obj, types.ModuleType) else obj.__module__
+    functions = []
+    _find_functions(obj, prefix, functions, set())
+    memo = {}
+    patched = 0
+    for function in functions:
+        co = transform_code(function.__code__, fn, memo=memo, **options)
+        if co is not function.__code__:
+            function.__code__ = co
+            patched += 1
+    return RecursiveTransformReport(len(functions), patched, len(memo), time.time() - start)
+
+
+def _find_functions(obj, prefix, functions, seen):
+    if id(obj) in seen:
+        return
+    seen.add(id(obj))
+    if isinstance(obj, types.ModuleType):
+        if _is_in_package(obj.__name__, prefix):
+            for value in obj.__dict__.values():
+                _find_functions(value, prefix, functions, seen)
+    elif isinstance(obj, (type, types.ClassType)):
+        if _is_in_package(obj.__module__, prefix):
+            for value in obj.__dict__.values():
+                _find_functions(value, prefix, functions, seen)
+    elif isinstance(obj, types.FunctionType):
+        if _is_in_package(obj.__module__, prefix):
+            functions.append(obj)
+            for cell in obj.__closure__ or ():
+                try:
+                    contents = cell.cell_contents
+                except ValueError:
+                    continue  # empty cell
+                _find_functions(contents, prefix, functions, seen)
+    elif isinstance(obj, (types.MethodType, staticmethod, classmethod)):
+        _find_functions(obj.__func__, prefix, functions, seen)
+    elif isinstance(obj, property):
+        for accessor in (obj.fget, obj.fset, obj.fdel):
+            if accessor is not None:
+                _find_functions(accessor, prefix, functions, seen)
+
+
+def _is_in_package(module_name, prefix):
+    if not isinstance(module_name, basestring):
+        return False
+    return module_name == prefix or module_name.startswith(prefix + '.')
+
+
+def identity(ba):
+    """Transform that leaves the code unchanged."""
+    return ba
+
+
+_NAMED_TRANSFORMS = {
+    'identity': identity,
+    'fold_constants': optimize.fold_constants,
+    'remove_dead_code': optimize.remove_dead_code,
+    'eliminate_common_loads': optimize.eliminate_common_loads,
+    'remove_loop_blocks': optimize.remove_loop_blocks,
+}
+
+
+def get_transform(name):
+    """Returns a transform given its name.
+
+    name is either the name of a transform that comes with bytearound or the dotted path to a
+    function, like "mypackage.transforms.my_transform".
+
+    """
+    try:
+        return _NAMED_TRANSFORMS[name]
+    except KeyError:
+        pass
+    module_name, _, attr = name.rpartition('.')
+    if not module_name:
+        raise ValueError('unknown transform %r (known transforms: %s)' % (
+            name, ', '.join(sorted(_NAMED_TRANSFORMS))))
+    module = importlib.import_module(module_name)
+    try:
+        return getattr(module, attr)
+    except AttributeError:
+        raise ValueError('module %s has no transform named %s' % (module_name, attr))
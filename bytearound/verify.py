@@ -0,0 +1,196 @@
+"""
+
+Parallel round-trip verification of all code objects in packages and directories.
+
+This runs the same check as debug.check() on every code object found in the Python source files
+of the given packages and directories, using a process pool, and returns a report instead of
+printing or raising.
+
+Usage:
+
+    report = verify(packages=['json'], directories=['/path/to/site-packages'])
+    print(report.summary())
+
+"""
+from collections import namedtuple
+import imp
+import marshal
+import os
+import time
+import types
+
+from . import cache
+from . import code_object
+from . import debug
+
+# differences is a tuple of the code object attributes that differ after a round trip, error is a
+# string describing an exception raised during the round trip (or None)
+CodeResult = namedtuple('CodeResult', ['filename', 'name', 'firstlineno', 'differences', 'error'])
+
+ERROR = '<error>'  # key used for code objects that raised an exception in by_attribute()
+
+
+class VerificationReport(object):
+    """Results of a verification run."""
+    def __init__(self, results, elapsed):
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def passed(self):
+        return [result for result in self.results if _is_success(result)]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not _is_success(result)]
+
+    def by_attribute(self):
+        """Returns a dictionary of {attribute name: list of results where the attribute differed}.
+
+        Code objects for which the round trip raised an exception are listed under ERROR.
+
+        """
+        groups = {}
+        for result in self.results:
+            if result.error is not None:
+                groups.setdefault(ERROR, []).append(result)
+            for attr in result.differences:
+                groups.setdefault(attr, []).append(result)
+        return groups
+
+    def summary(self):
+        """Returns a human-readable summary of the results."""
+        lines = ['verified %d code objects in %.2fs: %d passed, %d failed' % (
+            len(self.results), self.elapsed, len(self.passed), len(self.failed))]
+        for attr, results in sorted(self.by_attribute().items()):
+            lines.append('%s: %d' % (attr, len(results)))
+            for result in results:
+                line = '    %s:%s %s' % (result.filename, result.firstlineno, result.name)
+                if result.error is not None:
+                    line += ' (%s)' % result.error
+                lines.append(line)
+        return '\n'.join(lines)
+
+
+def verify(packages=(), directories=(), processes=None):
+    """Verifies all code objects in the given packages and directories.
+
+    packages is a list of module or package names, which are located without being imported.
+    directories is a list of paths that are searched for .py files. processes is the number of
+    worker processes to use (by default the number of CPUs).
+
+    """
+    start = time.time()
+    code_objects, compile_errors = collect_code_objects(find_files(packages, directories))
+    report = verify_code_objects(code_objects, processes=processes)
+    report.results = compile_errors + report.results
+    report.elapsed = time.time() - start
+    return report
+
+
+def verify_code_objects(code_objects, processes=None):
+    """Verifies a list of code objects, returning a VerificationReport."""
+    start = time.time()
+    jobs = [marshal.dumps(co) for co in code_objects]
+    if processes == 1:
+        results = map(_check_marshalled, jobs)
+    else:
+        # imported here because multiprocessing is slow to import
+        import multiprocessing
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(processes)
+        try:
+            chunksize = max(1, min(256, len(jobs) // (4 * processes)))
+            results = pool.map(_check_marshalled, jobs, chunksize=chunksize)
+        finally:
+            pool.close()
+            pool.join()
+    return VerificationReport(results, time.time() - start)
+
+
+def find_files(packages=(), directories=()):
+    """Returns a sorted list of unique Python source files in the packages and directories."""
+    roots = list(directories)
+    for package in packages:
+        roots.append(_find_package(package))
+    files = set()
+    for root in roots:
+        if os.path.isfile(root):
+            files.add(os.path.realpath(root))
+            continue
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith('.py'):
+                    files.add(os.path.realpath(os.path.join(dirpath, filename)))
+    return sorted(files)
+
+
+def _find_package(name):
+    """Returns the source file of a module or the directory of a package.
+
+    Each part of a dotted name is looked up with imp.find_module in the directory of the previous
+    one, so that unlike pkgutil.get_loader, the parent packages are not imported.
+
+    """
+    path = None
+    parts = name.split('.')
+    for i, part in enumerate(parts):
+        try:
+            f, filename, (_, _, kind) = imp.find_module(part, path)
+        except ImportError:
+            raise ImportError('cannot find package %s' % name)
+        if f is not None:
+            f.close()
+        if kind == imp.PKG_DIRECTORY:
+            path = [filename]
+        elif i < len(parts) - 1:
+            raise ImportError('cannot find package %s' % name)
+    return filename
+
+
+def collect_code_objects(files):
+    """Compiles the files and returns all code objects in them, without duplicates.
+
+    Returns a tuple of (list of code objects, list of CodeResults for files that failed to
+    compile).
+
+    """
+    seen = set()
+    code_objects = []
+    errors = []
+
+    def add(co):
+        key = cache.fingerprint(co)
+        if key in seen:
+            return
+        seen.add(key)
+        code_objects.append(co)
+        for constant in co.co_consts:
+            if isinstance(constant, types.CodeType):
+                add(constant)
+
+    for path in files:
+        try:
+            with open(path, 'rU') as f:
+                co = compile(f.read(), path, 'exec', dont_inherit=True)
+        except Exception as e:
+            errors.append(CodeResult(path, '<module>', 0, (), 'compile failed: %s' % e))
+        else:
+            add(co)
+    return code_objects, errors
+
+
+def _check_marshalled(data):
+    co = marshal.loads(data)
+    try:
+        new_co = code_object.ByteAround.from_code(co).to_code(pessimize=True)
+        differences = tuple(sorted(debug.diff_code_objects(co, new_co).attributes))
+    except Exception as e:
+        return CodeResult(co.co_filename, co.co_name, co.co_firstlineno, (),
+                          '%s: %s' % (type(e).__name__, e))
+    return CodeResult(co.co_filename, co.co_name, co.co_firstlineno, differences, None)
+
+
+def _is_success(result):
+    return result.error is None and not result.differences
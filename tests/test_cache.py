@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+
+from bytearound import ops
+from bytearound.cache import CodeCache, fingerprint
+
+
+def function_returning_hello():
+    return 'hello'
+
+
+def replace_hello(ba):
+    for instr in ba:
+        if isinstance(instr, ops.LOAD_CONST) and instr.oparg == 'hello':
+            instr.oparg = 'goodbye'
+    return ba
+
+
+def test_cache():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'test.cache')
+        co = function_returning_hello.__code__
+        cache = CodeCache(path, version='v1')
+        assert cache.get(co) is None
+        transformed = cache.transform(co, replace_hello)
+        assert 'goodbye' in transformed.co_consts
+        assert co in cache
+        assert cache.get(co) == transformed
+
+        calls = []
+
+        def failing_transform(ba):
+            calls.append(ba)
+            raise AssertionError('should not be called')
+
+        # a fresh cache on the same file finds the entry without running the transform
+        other = CodeCache(path, version='v1')
+        assert other.transform(co, failing_transform) == transformed
+        assert not calls
+        assert len(other) == 1
+
+        # entries written by one instance become visible to another
+        other.put(replace_hello.__code__, replace_hello.__code__)
+        assert cache.get(replace_hello.__code__) == replace_hello.__code__
+
+        # a different version does not see the entries
+        assert CodeCache(path, version='v2').get(co) is None
+        cache.close()
+        other.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_damaged_records():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'test.cache')
+        co = function_returning_hello.__code__
+        cache = CodeCache(path, version='v1')
+        cache.put(replace_hello.__code__, replace_hello.__code__)
+        with open(path, 'rb') as f:
+            record = f.read()[len('BACACHE2'):]
+        # a record cut short by a failed write, whose header claims more data than follows
+        with open(path, 'ab') as f:
+            f.write(record[:len(record) // 2])
+        cache.put(co, co)
+        # a complete record with the wrong contents
+        with open(path, 'ab') as f:
+            f.write(record[:-1] + chr(ord(record[-1]) ^ 1))
+        cache.put(test_fingerprint.__code__, test_fingerprint.__code__)
+
+        for reader in (cache, CodeCache(path, version='v1')):
+            assert reader.get(co) == co
+            assert reader.get(test_fingerprint.__code__) == test_fingerprint.__code__
+            assert reader.get(replace_hello.__code__) == replace_hello.__code__
+            assert len(reader) == 3
+            reader.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_fingerprint():
+    assert fingerprint(function_returning_hello.__code__) == \
+        fingerprint(function_returning_hello.__code__)
+    assert fingerprint(function_returning_hello.__code__) != fingerprint(replace_hello.__code__)
@@ -0,0 +1,85 @@
+from bytearound import ByteAround, ops
+from bytearound.dataflow import FAST, NAME, ControlFlowGraph, Liveness, ReachingDefinitions
+
+
+def function_with_try(x, y):
+    z = x
+    try:
+        z = y()
+        w = 1
+    except:
+        return z
+    for i in range(w):
+        if i:
+            break
+        x = i
+    return x
+
+
+def _index_of(ba, cls, oparg):
+    return next(i for i, instr in enumerate(ba) if isinstance(instr, cls) and instr.oparg == oparg)
+
+
+def test_control_flow_graph():
+    ba = ByteAround.from_code(function_with_try.__code__)
+    cfg = ControlFlowGraph(ba.instructions)
+    call_block = cfg.block_of(_index_of(ba, ops.LOAD_FAST, 'y'))
+    handler_block = cfg.block_of(_index_of(ba, ops.LOAD_FAST, 'z') - 3)
+    assert cfg.exceptional_successors[call_block] == [handler_block]
+    assert cfg.exceptional_successors[0] == []
+    break_block = cfg.block_of(next(i for i, instr in enumerate(ba)
+                                    if isinstance(instr, ops.BREAK_LOOP)))
+    assert len(cfg.successors[break_block]) == 1
+
+
+def test_liveness():
+    ba = ByteAround.from_code(function_with_try.__code__)
+    result = Liveness(ba).solve()
+    before_store_z = result.decode(result.before(_index_of(ba, ops.STORE_FAST, 'z')))
+    assert before_store_z == set([(FAST, 'x'), (FAST, 'y')])
+    # z is read in the exception handler, so the assignment in the try block does not kill it
+    before_call = result.decode(result.before(_index_of(ba, ops.LOAD_FAST, 'y')))
+    assert (FAST, 'z') in before_call
+    assert (FAST, 'w') not in before_call
+    before_loop = result.decode(result.before(_index_of(ba, ops.LOAD_GLOBAL, 'range')))
+    assert before_loop == set([(FAST, 'w'), (FAST, 'x')])
+
+    module = ByteAround.from_code(compile('a = 1\nb = a\ndel a\n', '<test>', 'exec'))
+    result = Liveness(module).solve()
+    # names are live at the end, but assignments still kill them
+    assert result.decode(result.before(len(module) - 1)) == set([(NAME, 'a'), (NAME, 'b')])
+    assert result.decode(result.before(1)) == set()
+    assert result.decode(result.before(2)) == set([(NAME, 'a')])
+
+
+def test_reaching_definitions():
+    ba = ByteAround.from_code(function_with_try.__code__)
+    analysis = ReachingDefinitions(ba)
+    result = analysis.solve()
+    return_x = len(ba) - 2
+    reaching = result.decode(result.before(return_x))
+    x_definitions = [definition.index for definition in reaching if definition.variable[1] == 'x']
+    assert x_definitions == [None, _index_of(ba, ops.STORE_FAST, 'x')]
+    handler = _index_of(ba, ops.LOAD_FAST, 'z') - 3
+    z_definitions = [definition.index for definition in result.decode(result.before(handler))
+                     if definition.variable[1] == 'z']
+    assert len(z_definitions) == 2
+
+
+def test_large_function():
+    instructions = []
+    for i in range(5000):
+        label = ops.Label()
+        instructions += [
+            ops.LOAD_FAST('x%d' % (i % 50)),
+            ops.POP_JUMP_IF_FALSE(label),
+            ops.LOAD_FAST('x%d' % ((i + 1) % 50)),
+            ops.STORE_FAST('x%d' % ((i + 2) % 50)),
+            label,
+        ]
+    instructions += [ops.LOAD_CONST(None), ops.RETURN_VALUE()]
+    ba = ByteAround(instructions, argnames=('x0',))
+    liveness = Liveness(ba).solve()
+    assert (FAST, 'x0') in liveness.decode(liveness.block_in[0])
+    reaching = ReachingDefinitions(ba).solve()
+    assert len(reaching.decode(reaching.block_out[-1])) > 50
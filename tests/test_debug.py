@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+
+from bytearound import ByteAround, ops
+from bytearound.debug import decode_instructions, diff_code_objects
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+
+def function_with_power():
+    return 2 ** 32
+
+
+def function_returning_hello():
+    return 'hello'
+
+
+def test_diff_code_objects():
+    co = function_returning_hello.__code__
+    assert not diff_code_objects(co, ByteAround.from_code(co).to_code(pessimize=True))
+
+    ba = ByteAround.from_code(co)
+    ba[0:1] = [ops.LOAD_CONST('good'), ops.LOAD_CONST('bye'), ops.BINARY_ADD()]
+    difference = diff_code_objects(co, ba.to_code())
+    assert {'co_code', 'co_consts', 'co_stacksize'} <= difference.attributes
+    formatted = difference.format()
+    assert "-   0 LOAD_CONST               (<type 'str'>, 'hello')" in formatted
+    assert '+   2 BINARY_ADD' in formatted
+
+    co = function_with_power.__code__
+    difference = diff_code_objects(co, ByteAround.from_code(co).to_code(pessimize=True))
+    assert 'co_consts' in difference.attributes
+
+
+def test_decode_instructions():
+    assert decode_instructions(function_returning_hello.__code__) == [
+        ('LOAD_CONST', (str, 'hello')),
+        ('RETURN_VALUE', None),
+    ]
+    assert decode_instructions(compile('1.0', '', 'eval')) != \
+        decode_instructions(compile('1', '', 'eval'))
+
+
+def test_debug_is_imported_lazily():
+    # importing bytearound should not pull in the debug module and the slow modules it uses
+    code = ('import sys, bytearound; '
+            'print(sorted(m for m in ("bytearound.debug", "difflib", "inspect") if m in sys.modules))')
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=_ROOT)
+    assert output.strip() == '[]', output
@@ -0,0 +1,74 @@
+import threading
+
+from bytearound import ByteAround, ops
+from bytearound.frozen import FrozenByteAround
+
+
+def function_with_loop(xs):
+    total = 0
+    for x in xs:
+        if x:
+            total += x
+    return total
+
+
+def test_freeze_and_thaw():
+    ba = ByteAround.from_code(function_with_loop.__code__)
+    frozen = ba.freeze()
+    assert isinstance(frozen, FrozenByteAround)
+    assert all(isinstance(instr, tuple) for instr in frozen.instructions)
+    assert frozen == ByteAround.from_code(function_with_loop.__code__).freeze()
+    assert hash(frozen) == hash(ba.freeze())
+    assert frozen.to_code() == ba.to_code()
+
+    # changes to the ByteAround do not affect the snapshot
+    ba[0] = ops.LOAD_CONST(1)
+    assert ba.freeze() != frozen
+    assert frozen.to_code() == function_with_loop.__code__
+
+    thawed = frozen.thaw()
+    thawed.instructions.insert(0, ops.NOP(None, 1))
+    assert len(frozen.thaw()) == len(thawed) - 1
+    # jumps point to the new Labels
+    labels = [instr for instr in thawed if isinstance(instr, ops.Label)]
+    assert labels
+    assert all(any(instr.oparg is label for label in labels) for instr in thawed
+               if not isinstance(instr, ops.Label) and instr.is_jump())
+    fn = type(function_with_loop)(thawed.to_code(), {})
+    assert fn([1, 0, 2]) == 3
+
+    try:
+        frozen.name = 'other'
+    except AttributeError:
+        pass
+    else:
+        assert False, 'expected AttributeError'
+
+
+def test_frozen_constants():
+    def make(value):
+        return ByteAround([ops.LOAD_CONST(value, 1), ops.RETURN_VALUE(None, 1)]).freeze()
+
+    assert make(1) == make(1)
+    assert make(1) != make(True)
+    assert make(0.0) != make(-0.0)
+    # unhashable constants are compared by identity
+    assert make([]) != make([])
+    assert len({make(1), make(1), make(1.0)}) == 2
+
+
+def test_frozen_threads():
+    frozen = ByteAround.from_code(function_with_loop.__code__).freeze()
+    results = []
+
+    def assemble():
+        for _ in range(20):
+            results.append(frozen.to_code())
+
+    threads = [threading.Thread(target=assemble) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 80
+    assert all(co == function_with_loop.__code__ for co in results)
@@ -1,6 +1,11 @@
+import contextlib
 import opcode
+import StringIO
+import types
 
-from bytearound.generator import stack_effect_func_map, stack_effect_map
+from bytearound import ByteAround, ops
+from bytearound.generator import _ConstsList, compute_stacksize, stack_effect_func_map, \
+    stack_effect_map
 
 
 def test_no_missing_opcodes():
@@ -13,5 +18,97 @@ def test_no_missing_opcodes():
     assert not dupe_ops, 'Ops are handled in both maps: {}'.format(dupe_ops)
 
 
+def test_consts_list_by_value():
+    nan = float('nan')
+    values = [1, 1.0, 1L, True, 0.0, -0.0, nan, float('nan'), 'a', u'a', (1, (2.0,)), (1, (2,)),
+              ''.join(['a', 'b']), 'ab', [], []]
+    by_identity = _ConstsList(values)
+    assert len(by_identity.objs) == len(values)
+    by_value = _ConstsList(values, by_value=True)
+    # the NaNs and the two equal strings are merged, but the lists are separate objects
+    assert len(by_value.objs) == len(values) - 2
+    assert by_value.add(-0.0) == 5
+    assert by_value.add((1, (2,))) == 10
+    assert by_value.add(float('nan')) == 6
+
+
+def test_dedupe_consts():
+    ba = ByteAround(instructions=[
+        ops.LOAD_CONST(''.join(['a', 'b']), 1),
+        ops.LOAD_CONST(''.join(['a', 'b']), 1),
+        ops.BUILD_TUPLE(2, 1),
+        ops.RETURN_VALUE(None, 1),
+    ])
+    assert len(ba.to_code().co_consts) == 2
+    co = ba.to_code(dedupe_consts=True)
+    assert co.co_consts == ('ab',)
+    assert eval(co) == ('ab', 'ab')
+
+
+def function_with_docstring(x):
+    """Docstring."""
+    y = ''.join(['a', 'b'])
+    z = ''.join(['a', 'b'])
+    return x + 1, y, z
+
+
+def test_compact():
+    ba = ByteAround.from_code(function_with_docstring.__code__)
+    co = ba.to_code(compact=True)
+    assert co.co_consts[0] is None
+    assert 'Docstring.' not in co.co_consts
+    fn = type(function_with_docstring)(co, globals())
+    assert fn.__doc__ is None
+    assert fn(1) == function_with_docstring(1)
+    assert len(co.co_lnotab) == len(ba.to_code().co_lnotab)
+
+    collapsed = ba.to_code(compact=True, collapse_lnotab=True)
+    assert len(collapsed.co_lnotab) == 2
+    try:
+        ba.to_code(compact=True, pessimize=True)
+    except ValueError:
+        pass
+    else:
+        assert False, 'expected ValueError'
+
+
+def function_with_handlers(context, xs):
+    for x in xs:
+        try:
+            context.thing.write(x)
+        finally:
+            pass
+    with context as value:
+        return value.getvalue()
+
+
+def test_precise_stacksize():
+    co = function_with_handlers.__code__
+    ba = ByteAround.from_code(co)
+    assert compute_stacksize(ba) == co.co_stacksize
+    precise = compute_stacksize(ba, precise=True)
+    assert 0 < precise < co.co_stacksize
+
+    fn = types.FunctionType(ba.to_code(precise_stacksize=True), globals())
+    assert fn.__code__.co_stacksize == precise
+    context = contextlib.closing(StringIO.StringIO())
+    assert fn(context, ['a', 'b']) == 'ab'
+
+
+def test_precise_stacksize_inconsistent():
+    label = ops.Label()
+    ba = ByteAround.from_code((lambda: None).__code__)
+    # the label is reached with one value on the stack from one path and two from the other
+    ba.instructions = [ops.LOAD_CONST(1), ops.LOAD_CONST(True), ops.POP_JUMP_IF_FALSE(label),
+                       ops.LOAD_CONST(2), label, ops.RETURN_VALUE()]
+    assert compute_stacksize(ba) == 2
+    try:
+        compute_stacksize(ba, precise=True)
+    except ValueError:
+        pass
+    else:
+        assert False, 'expected ValueError'
+
+
 if __name__ == '__main__':
     test_no_missing_opcodes()
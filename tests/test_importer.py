@@ -0,0 +1,69 @@
+import os
+import shutil
+import sys
+import tempfile
+
+from bytearound import importer, ops
+
+_MODULE_SOURCE = '''
+def f():
+    return 'hello'
+
+class C(object):
+    def method(self):
+        return 'hello'
+'''
+
+
+def replace_hello(ba):
+    for instr in ba:
+        if isinstance(instr, ops.LOAD_CONST) and instr.oparg == 'hello':
+            instr.oparg = 'goodbye'
+    return ba
+
+
+def failing_transform(ba):
+    raise AssertionError('the cached code should have been used')
+
+
+def _import_fresh(name):
+    for module in list(sys.modules):
+        if module == name or module.startswith(name + '.'):
+            del sys.modules[module]
+    __import__(name)
+    return sys.modules[name]
+
+
+def test_import_hook():
+    tmpdir = tempfile.mkdtemp()
+    package_dir = os.path.join(tmpdir, 'bytearound_test_pkg')
+    os.mkdir(package_dir)
+    with open(os.path.join(package_dir, '__init__.py'), 'w') as f:
+        f.write('')
+    module_path = os.path.join(package_dir, 'mod.py')
+    with open(module_path, 'w') as f:
+        f.write(_MODULE_SOURCE)
+    sys.path.insert(0, tmpdir)
+    hook = importer.install(replace_hello, version='v1', modules=['bytearound_test_pkg'])
+    try:
+        mod = _import_fresh('bytearound_test_pkg.mod')
+        assert mod.f() == 'goodbye'
+        assert mod.C().method() == 'goodbye'
+        assert os.path.exists(importer.get_cache_path(module_path))
+
+        hook.fn = failing_transform
+        mod = _import_fresh('bytearound_test_pkg.mod')
+        assert mod.f() == 'goodbye'
+
+        # a different version invalidates the cache
+        hook.fn = lambda ba: ba
+        hook.version = 'v2'
+        mod = _import_fresh('bytearound_test_pkg.mod')
+        assert mod.f() == 'hello'
+    finally:
+        importer.uninstall(hook)
+        sys.path.remove(tmpdir)
+        for module in list(sys.modules):
+            if module.startswith('bytearound_test_pkg'):
+                del sys.modules[module]
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,41 @@
+from bytearound import ByteAround, instrument
+
+
+def function_with_loop(x):
+    for y in x:
+        if y:
+            return y
+
+
+def test_collect():
+    co = function_with_loop.__code__
+    with instrument.collect() as stats:
+        ByteAround.from_code(co).to_code()
+    assert stats.calls == {'from_code': 1, 'to_code': 1}
+    assert ('from_code', 'parse') in stats.phases
+    for phase in ('offsets', 'operands', 'labels', 'code', 'stacksize', 'code_object'):
+        assert ('to_code', phase) in stats.phases, phase
+    assert stats.counters[('to_code', 'extended_args')] == 0
+    assert stats.counters[('to_code', 'instructions')] == \
+        stats.counters[('from_code', 'instructions')]
+    assert 'to_code: 1 calls' in stats.report()
+
+    # nothing is recorded once the context manager exits
+    assert not instrument.is_enabled()
+    ByteAround.from_code(co).to_code()
+    assert stats.calls == {'from_code': 1, 'to_code': 1}
+
+
+def test_listener():
+    records = []
+    instrument.add_listener(records.append)
+    try:
+        ByteAround.from_code(function_with_loop.__code__)
+    finally:
+        instrument.remove_listener(records.append)
+    assert len(records) == 1
+    record = records[0]
+    assert record.kind == 'from_code'
+    assert record.name == 'function_with_loop'
+    assert record.phase_order == ['parse', 'setup']
+    assert record.total >= sum(record.phases.values())
@@ -0,0 +1,43 @@
+from bytearound import ByteAround
+from bytearound.interning import InternPool
+
+
+def make_function(suffix):
+    namespace = {}
+    exec '''
+def f(x):
+    return x.attribute_%s, %r, (1, 2.0, %r), 0.0, -0.0
+''' % (suffix, 'constant string' + suffix, 'nested string' + suffix) in namespace
+    return namespace['f']
+
+
+def test_canonical():
+    pool = InternPool()
+    a = ''.join(['a', 'b'])
+    b = ''.join(['a', 'b'])
+    assert pool.canonical(a) is a
+    assert pool.canonical(b) is a
+    assert pool.canonical(1.0) is not pool.canonical(1)
+    assert pool.canonical(-0.0) is not pool.canonical(0.0)
+    assert pool.canonical((b, 3)) is pool.canonical((a, 3))
+    assert pool.canonical((a, 3))[0] is a
+    lst = []
+    assert pool.canonical(lst) is lst
+    assert pool.hits == 4
+    assert pool.bytes_saved > 0
+    assert 'bytes saved' in pool.report()
+
+
+def test_to_code_with_pool():
+    pool = InternPool()
+    fns = [make_function(''), make_function('')]
+    codes = [ByteAround.from_code(fn.__code__).to_code(pool=pool) for fn in fns]
+    assert codes[0].co_consts is codes[1].co_consts
+    assert codes[0].co_consts[1] is codes[1].co_consts[1]
+    assert fns[0].__code__.co_consts[1] is not fns[1].__code__.co_consts[1]
+    assert codes[0] == ByteAround.from_code(fns[0].__code__).to_code()
+
+    other = ByteAround.from_code(make_function('2').__code__).to_code(pool=pool)
+    assert other.co_consts is not codes[0].co_consts
+    assert other.co_consts[-1] is codes[0].co_consts[-1]  # -0.0
+    assert pool.hits > 0
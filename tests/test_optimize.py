@@ -0,0 +1,195 @@
+from bytearound import ByteAround, ops
+from bytearound.optimize import INVALIDATING_OPCODES, eliminate_common_loads, fold_constants, \
+    remove_dead_code, remove_loop_blocks
+
+
+def _optimize(fn):
+    ba = ByteAround.from_code(fn.__code__)
+    remove_dead_code(fold_constants(ba))
+    return ba
+
+
+def test_fold_constants():
+    ba = ByteAround(instructions=[
+        ops.LOAD_CONST(2, 1),
+        ops.LOAD_CONST(3, 1),
+        ops.BINARY_MULTIPLY(None, 1),
+        ops.UNARY_NEGATIVE(None, 1),
+        ops.LOAD_CONST('x', 1),
+        ops.BUILD_TUPLE(2, 1),
+        ops.RETURN_VALUE(None, 1),
+    ])
+    fold_constants(ba)
+    assert [type(instr) for instr in ba] == [ops.LOAD_CONST, ops.RETURN_VALUE]
+    assert ba[0].oparg == (-6, 'x')
+
+    # operations that raise and mutable results are not folded
+    ba = ByteAround(instructions=[
+        ops.LOAD_CONST(1, 1),
+        ops.LOAD_CONST(0, 1),
+        ops.BINARY_FLOOR_DIVIDE(None, 1),
+        ops.LOAD_CONST(None, 1),
+        ops.BUILD_LIST(1, 1),
+        ops.BUILD_TUPLE(2, 1),
+        ops.RETURN_VALUE(None, 1),
+    ])
+    fold_constants(ba)
+    assert len(ba) == 7
+
+
+def test_remove_dead_branches():
+    def f(x):
+        if 0 < 1:
+            return x
+        else:
+            return -x
+
+    ba = _optimize(f)
+    assert [type(instr) for instr in ba] == [ops.LOAD_FAST, ops.RETURN_VALUE]
+    g = type(f)(ba.to_code(), {})
+    assert g(3) == 3
+
+
+def test_remove_dead_code_keeps_handlers():
+    def f(xs):
+        result = []
+        for x in xs:
+            try:
+                result.append(1 // x)
+            except ZeroDivisionError:
+                result.append(None)
+                continue
+            result.append(x)
+        while True:
+            return result
+
+    ba = _optimize(f)
+    g = type(f)(ba.to_code(), globals())
+    assert g([0, 1]) == f([0, 1])
+    assert not any(isinstance(instr, ops.POP_BLOCK) for instr in ba[-3:])
+
+
+class Config(object):
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class Holder(object):
+    def __init__(self, cfg):
+        self.cfg = cfg
+
+
+def function_with_repeated_loads(self):
+    a = self.cfg.x
+    b = self.cfg.x
+    c = self.cfg.y
+    self.cfg = Config(a + 1, c)  # a call and a STORE_ATTR invalidate the chains
+    d = self.cfg.x
+    return (a, b, c, d, self.cfg.x)
+
+
+def test_eliminate_common_loads():
+    ba = ByteAround.from_code(function_with_repeated_loads.__code__)
+    eliminate_common_loads(ba)
+    stores = [instr.oparg for instr in ba if isinstance(instr, ops.STORE_FAST)]
+    assert stores == ['.cse0', 'a', 'b', 'c', '.cse1', 'd']
+    attrs = [instr for instr in ba if isinstance(instr, ops.LOAD_ATTR)]
+    # self.cfg.x, self.cfg.y, STORE_ATTR cfg and the last two chains
+    assert len(attrs) == 3 + 1 + 2
+
+    fn = type(function_with_repeated_loads)(ba.to_code(), globals())
+    assert fn(Holder(Config(1, 2))) == function_with_repeated_loads(Holder(Config(1, 2)))
+
+    # stores of an unrelated local do not invalidate chains, but stores of the base do
+    def g(self, other):
+        a = self.x.y
+        other = a
+        b = self.x.y
+        self = other
+        return a + b + self.x.y
+
+    ba = ByteAround.from_code(g.__code__)
+    eliminate_common_loads(ba)
+    assert sum(isinstance(instr, ops.LOAD_ATTR) for instr in ba) == 4
+
+    # the addition may call __add__, so by default the last chain is not reused, but configuring
+    # BINARY_ADD to not invalidate chains allows it
+    def h(self):
+        return self.x.y + self.x.y + self.x.y
+
+    ba = ByteAround.from_code(h.__code__)
+    eliminate_common_loads(ba)
+    assert sum(isinstance(instr, ops.LOAD_ATTR) for instr in ba) == 4
+    eliminate_common_loads(ba, invalidating=INVALIDATING_OPCODES - {ops.BINARY_ADD.opcode})
+    assert sum(isinstance(instr, ops.LOAD_ATTR) for instr in ba) == 2
+    fn = type(h)(ba.to_code(), {})
+    assert fn(Config(Config(1, 3), None)) == 9
+
+    # assigning the base invalidates its chains even if stores are not invalidating
+    def k(self, other):
+        p = self.x
+        self = other
+        return p, self.x
+
+    ba = ByteAround.from_code(k.__code__)
+    eliminate_common_loads(ba, invalidating=frozenset([ops.CALL_FUNCTION.opcode]))
+    fn = type(k)(ba.to_code(), {})
+    assert fn(Config(1, None), Config(2, None)) == (1, 2)
+
+
+def loops_without_breaks(xs):
+    total = 0
+    for x in xs:
+        try:
+            total += x
+        finally:
+            total += 1
+    i = 0
+    while i < 3:
+        for x in xs:
+            total += x * i
+        i += 1
+    return total
+
+
+def loops_with_breaks(xs):
+    total = 0
+    for x in xs:
+        # this loop is kept because of the break, but the inner loop is removed
+        for y in xs:
+            total += y
+        try:
+            if x > 2:
+                break
+        finally:
+            total += 1
+    for x in xs:
+        for y in xs:
+            try:
+                if y == 1:
+                    continue
+            finally:
+                total += 1
+            total += x * y
+            if y > x:
+                break
+    return total
+
+
+def _count(ba, cls):
+    return sum(isinstance(instr, cls) for instr in ba)
+
+
+def test_remove_loop_blocks():
+    for fn, setup_loops, pop_blocks in ((loops_without_breaks, 0, 1),
+                                        (loops_with_breaks, 2, 4)):
+        ba = ByteAround.from_code(fn.__code__)
+        remove_loop_blocks(ba)
+        assert _count(ba, ops.SETUP_LOOP) == setup_loops, fn
+        # one POP_BLOCK for each remaining loop and each try/finally
+        assert _count(ba, ops.POP_BLOCK) == pop_blocks, fn
+        ba.to_code(precise_stacksize=True)
+        optimized = type(fn)(ba.to_code(), {})
+        for xs in ([], [1, 2, 3, 4], range(10)):
+            assert optimized(xs) == fn(xs)
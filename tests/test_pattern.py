@@ -0,0 +1,84 @@
+from bytearound import ByteAround, ops
+from bytearound.pattern import ANY, ANY_INSTRUCTION, Pattern, Predicate, get_index, replace, \
+    search
+
+
+def function_with_len(xs, ys):
+    if len(xs) > len(ys):
+        return len(xs)
+    return len(ys) + 1
+
+
+LEN_PATTERN = Pattern([ops.LOAD_GLOBAL('len'), ops.LOAD_FAST(ANY), ops.CALL_FUNCTION(1)])
+
+
+def _check_index(ba):
+    index = get_index(ba)
+    for op in set(instr.opcode for instr in ba):
+        assert index.positions(op) == [i for i, instr in enumerate(ba) if instr.opcode == op]
+
+
+def test_search():
+    ba = ByteAround.from_code(function_with_len.__code__)
+    matches = search(ba, LEN_PATTERN)
+    assert [match.instructions[1].oparg for match in matches] == ['xs', 'ys', 'xs', 'ys']
+    for match in matches:
+        assert ba[match.start:match.end] == match.instructions
+
+    pattern = Pattern([ops.LOAD_FAST(Predicate(lambda name: name.startswith('y'))),
+                       ops.CALL_FUNCTION, ANY_INSTRUCTION])
+    assert [match.start for match in search(ba, pattern)] == [matches[1].start + 1,
+                                                               matches[3].start + 1]
+    assert search(ba, Pattern([ops.LOAD_CONST(True)])) == []
+    assert len(search(ba, Pattern([ops.LOAD_CONST(1)]))) == 1
+
+
+def test_replace():
+    ba = ByteAround.from_code(function_with_len.__code__)
+    index = get_index(ba)
+
+    def to_method_call(match):
+        return [ops.LOAD_FAST(match.instructions[1].oparg, None),
+                ops.LOAD_ATTR('__len__', None),
+                ops.CALL_FUNCTION(0, None)]
+
+    assert replace(ba, LEN_PATTERN, to_method_call) == 4
+    assert get_index(ba) is index
+    _check_index(ba)
+    assert search(ba, LEN_PATTERN) == []
+    assert len(search(ba, Pattern([ops.LOAD_ATTR('__len__')]))) == 4
+    fn = type(function_with_len)(ba.to_code(), {})
+    assert fn([1], []) == 1
+    assert fn([], [1]) == 2
+
+    # edits through __setitem__ keep the index up to date
+    ba[0] = ops.NOP()
+    ba[2:4] = []
+    ba[-1:] = [ops.LOAD_CONST(None), ops.RETURN_VALUE()]
+    assert get_index(ba) is index
+    _check_index(ba)
+    assert 'pattern_index' not in repr(ba)
+
+
+def test_index_detects_direct_changes():
+    ba = ByteAround.from_code(function_with_len.__code__)
+    return_positions = [match.start for match in search(ba, Pattern([ops.RETURN_VALUE]))]
+    # changes that bypass ByteAround.__setitem__ and keep the length
+    ba.instructions[0] = ops.RETURN_VALUE(None, 1)
+    assert [match.start for match in search(ba, Pattern([ops.RETURN_VALUE]))] == \
+        [0] + return_positions
+    ba.instructions.reverse()
+    _check_index(ba)
+
+    # failed assignments leave the index unchanged
+    index = get_index(ba)
+    try:
+        ba[len(ba) + 10] = ops.NOP()
+    except IndexError:
+        pass
+    else:
+        assert False, 'expected IndexError'
+    assert get_index(ba) is index
+    _check_index(ba)
+    ba[::2] = ba[::2]
+    _check_index(ba)
@@ -0,0 +1,48 @@
+from bytearound import ByteAround, blocks
+from bytearound.profiler import BlockProfiler
+
+
+def function_with_branches(xs):
+    total = 0
+    for x in xs:
+        if x % 3 == 0:
+            total += x
+        else:
+            try:
+                total -= 1 // (x % 3 - 1)
+            except ZeroDivisionError:
+                total += 100
+    return total
+
+
+def test_profiler():
+    original_code = function_with_branches.__code__
+    expected = function_with_branches(range(10))
+    with BlockProfiler() as profiler:
+        profiler.instrument(function_with_branches)
+        assert function_with_branches.__code__ is not original_code
+        assert function_with_branches(range(10)) == expected
+        counts = profiler.counts(function_with_branches)
+        code_blocks = blocks.split_blocks(ByteAround.from_code(original_code).instructions)
+        assert len(counts) == len(code_blocks)
+        assert counts[0] == 1  # the entry block
+        line_counts = profiler.line_counts(function_with_branches)
+        first_line = original_code.co_firstlineno
+        assert line_counts[first_line + 4] == 4  # total += x
+        # the except clause has two blocks: the exception comparison and the start of the body
+        assert line_counts[first_line + 8] == 6
+        assert 'function_with_branches' in profiler.report()
+        profiler.reset()
+        assert not any(profiler.counts(function_with_branches))
+    assert function_with_branches.__code__ is original_code
+
+
+def test_split_blocks():
+    instructions = ByteAround.from_code(function_with_branches.__code__).instructions
+    code_blocks = blocks.split_blocks(instructions)
+    assert sum(len(block.labels) + len(block.instructions) for block in code_blocks) == \
+        len(instructions)
+    for block in code_blocks:
+        assert instructions[block.start:block.end] == block.labels + block.instructions
+        for instr in block.instructions[:-1]:
+            assert not instr.is_jump()
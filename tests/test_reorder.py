@@ -0,0 +1,81 @@
+from bytearound import ByteAround, blocks, ops
+from bytearound.profiler import BlockProfiler
+from bytearound.reorder import reorder_blocks, reorder_function
+
+
+def mostly_positive(xs):
+    total = 0
+    for x in xs:
+        if x < 0:
+            total -= 1
+        elif x == 0:
+            continue
+        else:
+            total += x
+    return total
+
+
+def with_blocks(xs):
+    xs = list(xs)
+    result = []
+    for x in xs:
+        try:
+            with open('/dev/null') as f:
+                if x:
+                    result.append(1 // x)
+                else:
+                    result.append(f.read())
+        except ZeroDivisionError:
+            result.append(None)
+        finally:
+            result.append(x)
+    while xs:
+        if xs.pop() > 2:
+            break
+    return result
+
+
+def _reorder_with_profile(fn, *args):
+    original_code = fn.__code__
+    expected = fn(*args)
+    with BlockProfiler() as profiler:
+        profiler.instrument(fn)
+        fn(*args)
+        counts = profiler.counts(fn)
+    reorder_function(fn, counts)
+    try:
+        assert fn.__code__ is not original_code
+        assert fn(*args) == expected
+    finally:
+        fn.__code__ = original_code
+    return counts
+
+
+def test_reorder_function():
+    _reorder_with_profile(mostly_positive, [1, 2, -1, 0, 3])
+    _reorder_with_profile(mostly_positive, [-1] * 10 + [0])
+    _reorder_with_profile(with_blocks, [0, 1, 2, 3])
+    _reorder_with_profile(with_blocks, [1] * 10)
+
+
+def test_hot_path_falls_through():
+    ba = ByteAround.from_code(mostly_positive.__code__)
+    code_blocks = blocks.split_blocks(ba.instructions)
+    # pretend that x < 0 is always false: the jump goes to the elif branch
+    counts = [1] * len(code_blocks)
+    label_map = blocks.get_label_map(code_blocks)
+    compare_block = next(block for block in code_blocks
+                         if block.last.opcode == ops.POP_JUMP_IF_FALSE.opcode)
+    counts[label_map[compare_block.last.oparg]] = 100
+    jump = compare_block.last
+    linenos = {id(instr): instr.lineno for instr in ba.instructions}
+    reorder_blocks(ba, counts)
+    assert jump not in ba.instructions
+    assert any(instr.opcode == ops.POP_JUMP_IF_TRUE.opcode for instr in ba.instructions)
+    # the line numbers are not changed, even though they are no longer in increasing order
+    new_linenos = [instr.lineno for instr in ba.instructions if not isinstance(instr, ops.Label)]
+    assert new_linenos != sorted(new_linenos)
+    for instr in ba.instructions:
+        if id(instr) in linenos:
+            assert instr.lineno == linenos[id(instr)]
+    ba.to_code()
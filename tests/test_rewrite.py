@@ -0,0 +1,83 @@
+import marshal
+import os
+import shutil
+import tempfile
+
+from bytearound import ops, rewrite
+
+
+def replace_hello(ba):
+    for instr in ba:
+        if isinstance(instr, ops.LOAD_CONST) and instr.oparg == 'hello':
+            instr.oparg = 'goodbye'
+    return ba
+
+
+def _load_pyc(path):
+    with open(path, 'rb') as f:
+        f.read(8)
+        return marshal.load(f)
+
+
+def _make_tree(tmpdir):
+    package_dir = os.path.join(tmpdir, 'pkg')
+    os.mkdir(package_dir)
+    for name in ('a.py', 'b.py'):
+        with open(os.path.join(package_dir, name), 'w') as f:
+            f.write('def f():\n    return "hello"\nresult = f()\n')
+    return package_dir
+
+
+def test_rewrite_file():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        package_dir = _make_tree(tmpdir)
+        path = os.path.join(package_dir, 'a.py')
+        rewrite.rewrite_file(path, path + 'c', replace_hello)
+        namespace = {}
+        exec(_load_pyc(path + 'c'), namespace)
+        assert namespace['result'] == 'goodbye'
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_main():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        package_dir = _make_tree(tmpdir)
+        output_dir = os.path.join(tmpdir, 'out')
+        assert rewrite.main([package_dir, '-j', '2', '-o', output_dir]) == 0
+        assert sorted(os.listdir(output_dir)) == ['a.pyc', 'b.pyc']
+        for name in ('a.pyc', 'b.pyc'):
+            namespace = {}
+            exec(_load_pyc(os.path.join(output_dir, name)), namespace)
+            assert namespace['result'] == 'hello'
+
+        # without an output directory, .pyc files are written next to the source, and are not
+        # rewritten a second time
+        assert rewrite.main([package_dir, '-j', '1']) == 0
+        assert set(os.listdir(package_dir)) == {'a.py', 'a.pyc', 'b.py', 'b.pyc'}
+        assert list(rewrite.find_files([package_dir])) == [
+            os.path.join(package_dir, 'a.py'), os.path.join(package_dir, 'b.py')]
+
+        with open(os.path.join(package_dir, 'c.py'), 'w') as f:
+            f.write('syntax error')
+        assert rewrite.main([package_dir, '-j', '1']) == 1
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_output_path_for_file_argument():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        package_dir = _make_tree(tmpdir)
+        path = os.path.join(package_dir, 'a.py')
+        assert rewrite.get_output_path(path, path, 'out') == os.path.join('out', 'a.pyc')
+        assert rewrite.get_output_path(path, package_dir, 'out') == os.path.join('out', 'a.pyc')
+
+        output_dir = os.path.join(tmpdir, 'out')
+        assert rewrite.main([path, '-j', '1', '-o', output_dir]) == 0
+        assert os.listdir(output_dir) == ['a.pyc']
+        assert 'a.pyc' not in os.listdir(tmpdir)
+    finally:
+        shutil.rmtree(tmpdir)
@@ -57,5 +57,20 @@ def test_jumps():
     check(function_with_jumps)
 
 
+def _check_lnotab(co):
+    # check() simplifies co_lnotab before comparing it, so compare the bytes directly
+    new_co = bytearound.ByteAround.from_code(co, is_function=False).to_code()
+    assert new_co.co_lnotab == co.co_lnotab, (map(ord, co.co_lnotab), map(ord, new_co.co_lnotab))
+
+
+def test_large_lnotab_increments():
+    for gap in (254, 255, 256, 274, 509, 510, 511, 764, 765, 800):
+        _check_lnotab(compile('x = 1\n' + '\n' * gap + 'y = 2\n', '<gap>', 'exec'))
+    # a line with n loads is 3 * n + 6 bytes long
+    for loads in (84, 85, 168, 169, 253, 254):
+        code = 'z = [%s]\n' % ', '.join(['x'] * loads) + '\n' * 509 + 'y = 2\n'
+        _check_lnotab(compile(code, '<gap>', 'exec'))
+
+
 def test_myself():
     bytearound.check_recursive(bytearound)
@@ -0,0 +1,131 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+from bytearound import service
+from bytearound.service import ServiceError, TransformClient, TransformServer
+
+
+def function_with_constants():
+    return 2 * 3
+
+
+def other_function():
+    return 4 - 1
+
+
+def _start_server(path):
+    server = TransformServer(path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def test_service():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'service.sock')
+        server = _start_server(path)
+        try:
+            assert os.stat(path).st_mode & 0o077 == 0
+            client = TransformClient(path, fallback=False)
+            co = function_with_constants.__code__
+            transformed = client.transform(co, 'fold_constants')
+            assert 6 in transformed.co_consts
+            assert client.stats() == {'hits': 0, 'misses': 1, 'entries': 1}
+
+            # a second worker gets the cached result
+            other_client = TransformClient(path, fallback=False)
+            results = other_client.transform_many([co, other_function.__code__], 'fold_constants')
+            assert results[0] == transformed
+            assert 3 in results[1].co_consts
+            assert other_client.stats() == {'hits': 1, 'misses': 2, 'entries': 2}
+
+            try:
+                client.transform(co, 'no_such_transform')
+            except ServiceError as e:
+                assert 'no_such_transform' in str(e)
+            else:
+                assert False, 'expected ServiceError'
+            client.close()
+            other_client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert not os.path.exists(path)
+
+        # without the service, the client does the work itself
+        client = TransformClient(path)
+        assert 6 in client.transform(function_with_constants.__code__, 'fold_constants').co_consts
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def _expect_service_error(path):
+    try:
+        TransformServer(path)
+    except ServiceError:
+        pass
+    else:
+        assert False, 'expected ServiceError'
+
+
+def test_existing_socket_path():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        # a regular file is not removed
+        path = os.path.join(tmpdir, 'not_a_socket')
+        with open(path, 'w') as f:
+            f.write('data')
+        _expect_service_error(path)
+        assert os.path.isfile(path)
+
+        # a running service is not replaced
+        path = os.path.join(tmpdir, 'service.sock')
+        server = _start_server(path)
+        try:
+            _expect_service_error(path)
+            client = TransformClient(path, fallback=False)
+            assert client.stats()['entries'] == 0
+            client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        # the socket of a service that is no longer running is replaced
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+        sock.close()
+        server = TransformServer(path)
+        server.server_close()
+        assert not os.path.exists(path)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_malformed_requests():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'service.sock')
+        server = _start_server(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+            requests = ['stats', (), ('stats', 1), ('transform', 'identity'), ('unknown',),
+                        ('transform', 'identity', {}, 1), ([],)]
+            for request in requests:
+                service._send(sock, request)
+                status, message = service._receive(sock)
+                assert status == 'error', (request, message)
+            # the connection is still usable
+            service._send(sock, ('stats',))
+            assert service._receive(sock)[0] == 'ok'
+        finally:
+            sock.close()
+            server.shutdown()
+            server.server_close()
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,69 @@
+import math
+
+from bytearound.specialize import Specializer, specialize_code, specialize_function
+
+
+def render(text, escape, width=10, *args):
+    if escape:
+        text = text.replace('<', '&lt;')
+    if width > 0:
+        text = text.ljust(width)
+    return text
+
+
+def test_specialize_function():
+    render_plain = specialize_function(render, {'escape': False})
+    assert render_plain.__code__.co_varnames[:3] == ('text', 'width', 'args')
+    assert render_plain.__defaults__ == (10,)
+    assert render_plain('<b>') == render('<b>', False)
+    assert render_plain('<b>', 4) == render('<b>', False, 4)
+    assert 'replace' not in render_plain.__code__.co_names
+
+    render_short = specialize_function(render, {'escape': True, 'width': 0})
+    assert render_short.__defaults__ is None
+    assert render_short('<b>') == '&lt;b>'
+    assert 'ljust' not in render_short.__code__.co_names
+
+
+def test_specialize_errors():
+    def f(x, y):
+        x += 1
+
+        def g():
+            return y
+        return x, g
+
+    for bound in ({'x': 1}, {'y': 1}, {'z': 1}):
+        try:
+            specialize_code(f.__code__, bound)
+        except ValueError:
+            pass
+        else:
+            assert False, 'expected ValueError for %s' % bound
+
+
+def test_specializer_cache():
+    specializer = Specializer(maxsize=2)
+    first = specializer.specialize(render, escape=False)
+    assert specializer.specialize(render, escape=False) is first
+    assert specializer.specialize(render, escape=0) is not first
+    assert specializer.specialize(render, escape=[]) is not first
+    assert len(specializer) == 2
+    assert specializer.hits == 1
+    assert specializer.misses == 3
+    assert specializer.specialize(render, escape=False) is not first
+
+
+def test_specializer_cache_distinguishes_equal_constants():
+    def sign(x):
+        return math.copysign(1, x)
+
+    def first(x):
+        return x[0]
+
+    specializer = Specializer()
+    assert specializer.specialize(sign, x=0.0)() == 1.0
+    assert specializer.specialize(sign, x=-0.0)() == -1.0
+    assert type(specializer.specialize(first, x=(1,))()) is int
+    assert type(specializer.specialize(first, x=(1.0,))()) is float
+    assert specializer.misses == 4
@@ -0,0 +1,71 @@
+from bytearound import ByteAround, ops
+from bytearound.pattern import Pattern, search
+from bytearound.template import Placeholder, Template
+
+
+def function_returning_x(x):
+    return x
+
+
+# replaces the value on top of the stack with getattr(obj, attr) if it is true
+get_attr_if_true = Template([
+    ops.POP_JUMP_IF_FALSE(Placeholder('otherwise')),
+    ops.LOAD_FAST(Placeholder('obj')),
+    ops.LOAD_ATTR(Placeholder('attr')),
+    ops.RETURN_VALUE(),
+])
+
+# negates the value on top of the stack if it is true
+_label = ops.Label()
+negate_if_true = Template([
+    ops.DUP_TOP(),
+    ops.POP_JUMP_IF_FALSE(_label),
+    ops.UNARY_NEGATIVE(),
+    _label,
+])
+
+
+def test_template():
+    assert get_attr_if_true.placeholders == {'otherwise', 'obj', 'attr'}
+    assert get_attr_if_true.label_placeholders == {'otherwise'}
+    assert get_attr_if_true.stack_effect == -1
+    assert negate_if_true.stack_effect == 0
+    assert negate_if_true.max_depth == 1
+
+    first = negate_if_true.instantiate()
+    second = negate_if_true.instantiate(lineno=3)
+    assert first[1].oparg is first[3]
+    assert first[3] is not second[3]
+    assert all(instr.lineno == 3 for instr in second if not isinstance(instr, ops.Label))
+
+    ba = ByteAround.from_code(function_returning_x.__code__)
+    assert len(search(ba, Pattern([ops.UNARY_NEGATIVE]))) == 0
+    ba.insert_instructions(1, negate_if_true.instantiate())
+    # the pattern index is kept up to date
+    assert len(search(ba, Pattern([ops.UNARY_NEGATIVE]))) == 1
+    # the instructions get the line number of the surrounding code
+    assert all(instr.lineno == ba[0].lineno for instr in ba if not isinstance(instr, ops.Label))
+    fn = type(function_returning_x)(ba.to_code(), {})
+    assert fn(3) == -3
+    assert fn(0) == 0
+
+
+def test_template_errors():
+    for instructions in ([ops.JUMP_ABSOLUTE(ops.Label())],
+                         [ops.BUILD_TUPLE(Placeholder('n'))],
+                         [ops.POP_TOP(1)],
+                         [ops.LOAD_FAST(Placeholder('lineno'))]):
+        try:
+            Template(instructions)
+        except ValueError:
+            pass
+        else:
+            assert False, 'expected ValueError for %s' % instructions
+
+    for values in ({'obj': 'x', 'attr': 'y'}, {'obj': 'x', 'attr': 'y', 'otherwise': 'z'}):
+        try:
+            get_attr_if_true.instantiate(**values)
+        except (ValueError, TypeError):
+            pass
+        else:
+            assert False, 'expected an error for %s' % values
@@ -0,0 +1,106 @@
+import os.path
+import types
+
+from bytearound import ops, transform
+
+_SOURCE = '''
+import functools
+
+
+def greet():
+    return 'hello'
+
+
+alias = greet
+
+
+def decorate(fn):
+    @functools.wraps(fn)
+    def wrapper():
+        return fn() + '!'
+    return wrapper
+
+
+@decorate
+def decorated():
+    return 'hello'
+
+
+def make_inner():
+    def inner():
+        return 'hello'
+    return inner
+
+
+class Greeter(object):
+    def method(self):
+        return 'hello'
+
+    @staticmethod
+    def static():
+        return 'hello'
+
+    @classmethod
+    def clsmethod(cls):
+        return 'hello'
+
+    @property
+    def prop(self):
+        return 'hello'
+'''
+
+
+def replace_hello(ba):
+    for instr in ba:
+        if isinstance(instr, ops.LOAD_CONST) and instr.oparg == 'hello':
+            instr.oparg = 'goodbye'
+    return ba
+
+
+def make_module(name):
+    module = types.ModuleType(name)
+    exec(compile(_SOURCE, '<%s>' % name, 'exec'), module.__dict__)
+    module.join = os.path.join
+    return module
+
+
+def test_transform_recursive():
+    module = make_module('bytearound_test_module')
+    join_code = os.path.join.__code__
+    greet_code = module.greet.__code__
+
+    report = transform.transform_recursive(module, replace_hello)
+
+    assert module.greet() == 'goodbye'
+    assert module.alias is module.greet
+    assert module.decorated() == 'goodbye!'
+    assert module.make_inner()() == 'goodbye'
+    greeter = module.Greeter()
+    assert greeter.method() == 'goodbye'
+    assert module.Greeter.static() == 'goodbye'
+    assert module.Greeter.clsmethod() == 'goodbye'
+    assert greeter.prop == 'goodbye'
+    # functions from other modules are left alone
+    assert os.path.join.__code__ is join_code
+    assert module.greet.__code__ is not greet_code
+
+    # greet, decorate, wrapper, decorated, make_inner and the four methods, plus inner
+    assert report.functions == 9
+    assert report.patched_functions == 9
+    assert report.code_objects == 10
+    assert 'patched 9 of 9 functions' in report.summary()
+
+
+def test_transform_recursive_shared_code():
+    module = make_module('bytearound_test_module2')
+    calls = []
+
+    def counting_transform(ba):
+        calls.append(ba.name)
+        return ba
+
+    # two functions sharing a code object
+    module.greet2 = types.FunctionType(module.greet.__code__, module.__dict__, 'greet2')
+    transform.transform_recursive(module, counting_transform)
+    assert module.greet.__code__ is module.greet2.__code__
+    assert calls.count('greet') == 1
@@ -0,0 +1,58 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import bytearound
+from bytearound import verify
+
+
+def function_with_power():
+    # the peephole optimizer folds this, which breaks the round trip
+    return 2 ** 32
+
+
+def test_verify_package():
+    report = verify.verify(packages=['bytearound'], processes=2)
+    assert report.results
+    assert not report.failed, report.summary()
+    # every file is only processed once even if it is included twice
+    package_dir = os.path.dirname(bytearound.__file__)
+    other = verify.verify(packages=['bytearound'], directories=[package_dir], processes=1)
+    assert len(other.results) == len(report.results)
+
+
+def test_find_files_does_not_import():
+    tmpdir = tempfile.mkdtemp()
+    sys.path.insert(0, tmpdir)
+    try:
+        package_dir = os.path.join(tmpdir, 'unimportable_package', 'sub')
+        os.makedirs(package_dir)
+        with open(os.path.join(tmpdir, 'unimportable_package', '__init__.py'), 'w') as f:
+            f.write('raise AssertionError("imported")\n')
+        for filename in ('__init__.py', 'module.py'):
+            with open(os.path.join(package_dir, filename), 'w') as f:
+                f.write('x = 1\n')
+        files = verify.find_files(['unimportable_package.sub'])
+        assert [os.path.basename(path) for path in files] == ['__init__.py', 'module.py']
+        assert verify.find_files(['unimportable_package.sub.module']) == files[1:]
+        assert 'unimportable_package' not in sys.modules
+        try:
+            verify.find_files(['unimportable_package.missing'])
+        except ImportError:
+            pass
+        else:
+            assert False, 'expected ImportError'
+    finally:
+        sys.path.remove(tmpdir)
+        shutil.rmtree(tmpdir)
+
+
+def test_failure_report():
+    report = verify.verify_code_objects([function_with_power.__code__, test_verify_package.__code__],
+                                        processes=1)
+    assert len(report.passed) == 1
+    assert [result.name for result in report.failed] == ['function_with_power']
+    groups = report.by_attribute()
+    assert 'co_consts' in groups
+    assert 'function_with_power' in report.summary()